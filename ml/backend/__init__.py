@@ -1,2 +1,4 @@
+import os
 
-
+# On-disk state (job queue, registered templates, profiles) defaults to ml/data/, which git ignores
+DATA_DIR = os.environ.get("ML_DATA_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"))
@@ -0,0 +1,151 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+
+class Overloaded(Exception):
+    """Raised when the admission queue is full; carries a Retry-After hint in seconds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Verification queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class VerificationExecutor:
+    """
+    Size-limited executor for CPU-bound verification work with a bounded admission queue.
+
+    At most `workers` jobs run at once and at most `max_queue` more may wait; anything
+    beyond that is rejected immediately with `Overloaded` so callers fail fast instead
+    of piling up behind a busy event loop.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ml-verify")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self.completed = 0
+        self.rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._service_total = 0.0
+
+    def _retry_after(self) -> int:
+        # Rough estimate: time to drain the current backlog at the observed service rate
+        avg_service = self._service_total / self.completed if self.completed else 1.0
+        backlog = self._queued + self._running
+        return max(1, int(math.ceil(avg_service * backlog / self.workers)))
+
+    @property
+    def capacity(self) -> int:
+        """Most jobs that may be running or waiting at once."""
+        return self.workers + self.max_queue
+
+    def _admit(self, n: int) -> None:
+        # All n jobs must fit, so a batch cannot push the queue past its bound
+        with self._lock:
+            if self._queued + self._running + n > self.capacity:
+                self.rejected += 1
+                raise Overloaded(self._retry_after())
+            self._queued += n
+
+    def _job(self, fn: Callable[..., Any], args: Tuple[Any, ...], enqueued: float, waited: List[float]) -> Callable[[], Any]:
+        def job() -> Any:
+            started = time.perf_counter()
+            waited.append(started - enqueued)
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._wait_total += waited[-1]
+                self._wait_max = max(self._wait_max, waited[-1])
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self.completed += 1
+                    self._service_total += time.perf_counter() - started
+
+        return job
+
+    def _release_unstarted(self, futures: List[Future]) -> None:
+        # Caller went away: drop jobs that have not started and free their queue slots
+        cancelled = sum(1 for f in futures if f.cancel())
+        if cancelled:
+            with self._lock:
+                self._queued -= cancelled
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Tuple[Any, float]:
+        """Run fn(*args) on the pool; returns (result, seconds spent waiting in the queue)."""
+        self._admit(1)
+        waited: List[float] = []
+        future = self._pool.submit(self._job(fn, args, time.perf_counter(), waited))
+        try:
+            result = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            self._release_unstarted([future])
+            raise
+        return result, waited[0]
+
+    async def run_many(self, fn: Callable[..., Any], arg_list: List[Tuple[Any, ...]]) -> Tuple[List[Any], float]:
+        """
+        Admit a batch as one request and fan its items out over the pool.
+
+        Returns (outcomes, max queue wait) where each outcome is the item's result or the
+        exception it raised, in input order. All items count toward queue depth, so
+        single requests arriving behind a large batch see backpressure; a batch is only
+        admitted whole, so one larger than `capacity` never is.
+        """
+        self._admit(len(arg_list))
+        enqueued = time.perf_counter()
+        waited: List[float] = []
+        futures = [self._pool.submit(self._job(fn, args, enqueued, waited)) for args in arg_list]
+        try:
+            outcomes = await asyncio.gather(*(asyncio.wrap_future(f) for f in futures), return_exceptions=True)
+        except asyncio.CancelledError:
+            self._release_unstarted(futures)
+            raise
+        return list(outcomes), max(waited, default=0.0)
+
+    def broadcast(self, fn: Callable[[], Any]) -> List[Any]:
+        """
+        Run fn once per worker (bypassing admission) and wait for all of them; used for
+        warm-up. The calls are submitted together so each lands on its own pool thread.
+        """
+        futures = [self._pool.submit(fn) for _ in range(self.workers)]
+        return [f.result() for f in futures]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            done = self.completed
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "queued": self._queued,
+                "running": self._running,
+                "completed": done,
+                "rejected": self.rejected,
+                "avg_wait_s": round(self._wait_total / done, 4) if done else 0.0,
+                "max_wait_s": round(self._wait_max, 4),
+                "avg_service_s": round(self._service_total / done, 4) if done else 0.0,
+            }
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, str(default)))
+    except ValueError:
+        return default
+
+
+# With worker processes (backend.workers) each executor thread only dispatches to one process
+verify_executor = VerificationExecutor(
+    _env_int("ML_WORKER_PROCESSES", 0) or _env_int("ML_VERIFY_WORKERS", 2), _env_int("ML_VERIFY_QUEUE", 8)
+)
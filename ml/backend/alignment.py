@@ -0,0 +1,193 @@
+import os
+from typing import Any, Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+from . import matching, metrics, registry
+from .context import PageImage
+
+
+# Multi-scale alignment: ORB/RANSAC run on a level whose long side is about ALIGN_WORKING_PX
+# and only move up to finer levels (x2 each, up to ALIGN_LEVELS) when the inlier ratio is
+# below ALIGN_REFINE_RATIO. Pages already smaller than the working size align at full
+# resolution exactly as before.
+ALIGN_WORKING_PX = int(os.environ.get("ML_ALIGN_WORKING_PX", "2000"))
+ALIGN_LEVELS = max(1, int(os.environ.get("ML_ALIGN_LEVELS", "2")))
+ALIGN_REFINE_RATIO = float(os.environ.get("ML_ALIGN_REFINE_RATIO", "0.5"))
+
+
+class Alignment:
+    """
+    Result of registering the uploaded page onto the template page.
+
+    `page` is the upload warped into template coordinates when alignment
+    succeeded, otherwise the raw upload (so callers can always use it).
+    """
+
+    def __init__(
+        self,
+        page: PageImage,
+        aligned: bool,
+        homography: np.ndarray | None = None,
+        matches: int = 0,
+        inliers: int = 0,
+        reason: str | None = None,
+        scale: float = 1.0,
+        levels: int = 0,
+        matcher: str | None = None,
+    ):
+        self.page = page
+        self.aligned = aligned
+        self.homography = homography
+        self.matches = matches
+        self.inliers = inliers
+        self.reason = reason
+        self.scale = scale  # working scale the homography was finally estimated at
+        self.levels = levels  # pyramid levels actually evaluated
+        self.matcher = matcher  # backend matching.match used (None: no features to match)
+
+    @property
+    def inlier_ratio(self) -> float:
+        return float(self.inliers) / float(self.matches) if self.matches else 0.0
+
+    def info(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            "aligned": self.aligned,
+            "matches": int(self.matches),
+            "inliers": int(self.inliers),
+            "inlier_ratio": round(self.inlier_ratio, 4),
+            "scale": round(self.scale, 4),
+            "levels": int(self.levels),
+            "matcher": self.matcher,
+        }
+        if self.reason:
+            out["reason"] = self.reason
+        return out
+
+
+def _scaled_gray(page: PageImage, scale: float) -> np.ndarray:
+    if scale >= 1.0:
+        return page.gray
+    return page.memo(
+        f"gray@{scale:.4f}",
+        lambda: cv2.resize(page.gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA),
+    )
+
+
+@metrics.stage("orb")
+def _orb_features(page: PageImage, n_features: int = 2000, scale: float = 1.0) -> Tuple[np.ndarray, np.ndarray | None]:
+    """
+    Keypoint coordinates (N x 2 float32, always in full-resolution page coordinates)
+    and ORB descriptors computed at `scale`, memoized on the page.
+    """
+
+    def compute() -> Tuple[np.ndarray, np.ndarray | None]:
+        orb = registry.orb(n_features)
+        keypoints, descriptors = orb.detectAndCompute(_scaled_gray(page, scale), None)
+        pts = np.float32([kp.pt for kp in keypoints]).reshape(-1, 2)
+        if scale < 1.0:
+            pts /= scale
+        return pts, descriptors
+
+    key = f"orb:{n_features}" if scale >= 1.0 else f"orb:{n_features}@{scale:.4f}"
+    return page.memo(key, compute)
+
+
+def _level_scales(shape: Tuple[int, ...], working_px: int, levels: int) -> List[float]:
+    """Coarse-to-fine scales: the working level first, then x2 per level, capped at 1.0."""
+    scale = min(1.0, float(working_px) / float(max(shape[:2])))
+    scales: List[float] = []
+    while len(scales) < levels:
+        scales.append(scale)
+        if scale >= 1.0:
+            break
+        scale = min(1.0, scale * 2.0)
+    return scales
+
+
+def _estimate_homography(
+    pts_u: np.ndarray,
+    des_u: np.ndarray,
+    pts_t: np.ndarray,
+    des_t: np.ndarray,
+    ransac_px: float,
+    guide: np.ndarray | None = None,
+    guide_px: float = 0.0,
+) -> Tuple[np.ndarray | None, int, int, str | None, str]:
+    """Returns (H, matches used, inliers, failure reason, matcher backend used)."""
+    matches = matching.match(des_u, des_t)
+    if guide is not None and len(matches) >= 8:
+        # Guided refinement: keep only matches consistent with the coarser estimate
+        q = pts_u[matches.query].reshape(-1, 1, 2)
+        err = np.linalg.norm(cv2.perspectiveTransform(q, guide).reshape(-1, 2) - pts_t[matches.train], axis=1)
+        guided = matches.select(err <= guide_px)
+        if len(guided) >= 8:
+            matches = guided
+    if len(matches) < 8:
+        return None, len(matches), 0, "Not enough matches for homography", matches.backend
+
+    matches = matches.best(200)
+    src = pts_u[matches.query].reshape(-1, 1, 2)
+    dst = pts_t[matches.train].reshape(-1, 1, 2)
+
+    H, mask = cv2.findHomography(src, dst, cv2.RANSAC, ransac_px)
+    if H is None:
+        return None, len(matches), 0, "Homography estimation failed", matches.backend
+    inliers = int(np.count_nonzero(mask)) if mask is not None else 0
+    return H, len(matches), inliers, None, matches.backend
+
+
+@metrics.stage("align")
+def align_to_template(
+    uploaded: PageImage,
+    template: PageImage,
+    working_px: int | None = None,
+    levels: int | None = None,
+) -> Alignment:
+    working_px = ALIGN_WORKING_PX if working_px is None else working_px
+    levels = ALIGN_LEVELS if levels is None else max(1, levels)
+    scales_u = _level_scales(uploaded.shape, working_px, levels)
+    scales_t = _level_scales(template.shape, working_px, levels)
+    n_levels = max(len(scales_u), len(scales_t))
+
+    best: Tuple[np.ndarray, int, int, float, str] | None = None
+    matches, reason, evaluated, matcher = 0, "Insufficient features for alignment", 0, None
+    for level in range(n_levels):
+        s_u = scales_u[min(level, len(scales_u) - 1)]
+        s_t = scales_t[min(level, len(scales_t) - 1)]
+        evaluated += 1
+        # Fewer keypoints for speed
+        pts_u, descriptors_u = _orb_features(uploaded, scale=s_u)
+        pts_t, descriptors_t = _orb_features(template, scale=s_t)
+        if descriptors_u is None or descriptors_t is None:
+            reason = "Insufficient features for alignment"
+            continue
+
+        # RANSAC/guide tolerances are 5/20 px at the working level, expressed in full-resolution pixels
+        guide = best[0] if best is not None else None
+        H, matches, inliers, reason, matcher = _estimate_homography(
+            pts_u, descriptors_u, pts_t, descriptors_t, 5.0 / s_t, guide=guide, guide_px=20.0 / s_t
+        )
+        if H is not None and (best is None or inliers / matches >= best[2] / best[1]):
+            best = (H, matches, inliers, s_t, matcher)
+        if best is not None and best[2] / best[1] >= ALIGN_REFINE_RATIO:
+            break
+
+    if best is None:
+        return Alignment(uploaded, False, matches=matches, reason=reason, levels=evaluated, matcher=matcher)
+
+    H, matches, inliers, scale, matcher = best
+    # Single full-resolution warp with the final homography
+    height, width = template.shape[:2]
+    warped = cv2.warpPerspective(uploaded.image, H, (width, height))
+    return Alignment(
+        PageImage(image=warped),
+        True,
+        homography=H,
+        matches=matches,
+        inliers=inliers,
+        scale=scale,
+        levels=evaluated,
+        matcher=matcher,
+    )
@@ -0,0 +1,199 @@
+"""
+Benchmark and verdict-regression suite on generated certificates.
+
+Builds synthetic certificate pages (backend.synthetic) at several DPIs together
+with controlled variants (identical copy, benign re-scan, edited text, swapped
+photo, removed seal, replaced signature) and reports, per case, the wall time of
+each pipeline stage and model, peak traced memory, and the verdicts; then the
+throughput of whole verifications at several worker counts.
+
+    python -m backend.benchmark --dpi 150 300 --workers 1 2 4 --out bench.json
+    python -m backend.benchmark --compare bench.json
+
+The exit status is 1 if a variant's verdict contradicts its expectation, if the
+tiered pipeline disagrees with the full one, or (with --compare) if any verdict
+differs from the baseline run, so optimizations can be checked for behaviour
+changes as well as speed.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+from . import matching
+from .context import DocumentPair
+from .main import MODELS, PIPELINE_VERSION, verify_pair
+from .synthetic import VARIANTS, synthetic_certificate, variant
+
+Case = Tuple[int, str, np.ndarray, np.ndarray]
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def build_corpus(dpis: List[int], names: List[str]) -> List[Case]:
+    cases: List[Case] = []
+    for dpi in dpis:
+        original = synthetic_certificate(dpi)
+        for name in names:
+            cases.append((dpi, name, original, variant(original, name, dpi)))
+    return cases
+
+
+def _stage_times(original: np.ndarray, upload: np.ndarray) -> Dict[str, float]:
+    """One sequential, untiered run with every shared stage and model timed separately."""
+    pair = DocumentPair.from_arrays(original, upload)
+    times: Dict[str, float] = {}
+    t0 = time.perf_counter()
+    pair.original.gray, pair.uploaded.gray
+    times["decode"] = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    pair.alignment
+    times["alignment"] = time.perf_counter() - t0
+    for name, fn in MODELS:
+        t0 = time.perf_counter()
+        fn(pair)
+        times[name] = time.perf_counter() - t0
+    times["total"] = sum(times.values())
+    return times
+
+
+def _verdicts(result: Dict[str, Any]) -> Dict[str, Any]:
+    return {"overall": result["overall_status"], **{name: result[name].get("status") for name, _ in MODELS}}
+
+
+def run_case(case: Case, repeat: int) -> Dict[str, Any]:
+    dpi, name, original, upload = case
+    runs = [_stage_times(original, upload) for _ in range(repeat)]
+    stages = {k: round(statistics.median(r[k] for r in runs) * 1000, 2) for k in runs[0]}
+
+    # Memory is measured on a separate run: tracing slows allocation-heavy code
+    tracemalloc.start()
+    full = verify_pair(DocumentPair.from_arrays(original, upload), workers=1, tiered=False)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    t0 = time.perf_counter()
+    tiered = verify_pair(DocumentPair.from_arrays(original, upload), workers=1, tiered=True)
+    tiered_ms = (time.perf_counter() - t0) * 1000
+
+    expect_tampered = VARIANTS[name][1]
+    verdicts = _verdicts(full)
+    problems = []
+    if expect_tampered is not None and (verdicts["overall"] == "tampered") != expect_tampered:
+        problems.append(f"expected {'tampered' if expect_tampered else 'authentic'}, got {verdicts['overall']}")
+    if tiered["overall_status"] != full["overall_status"]:
+        problems.append(f"tiered verdict {tiered['overall_status']} != full verdict {full['overall_status']}")
+    return {
+        "dpi": dpi,
+        "variant": name,
+        "shape": list(original.shape[:2]),
+        "stages_ms": stages,
+        "peak_traced_mb": round(peak / 2**20, 1),
+        "tiered_ms": round(tiered_ms, 2),
+        "verdict_tier": tiered.get("verdict_tier"),
+        "verdicts": verdicts,
+        "problems": problems,
+    }
+
+
+def run_throughput(cases: List[Case], workers: int, rounds: int) -> Dict[str, Any]:
+    """Whole untiered verifications of every case, `rounds` times, on `workers` threads."""
+    jobs = [(o, u) for _, _, o, u in cases] * rounds
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        t0 = time.perf_counter()
+        list(pool.map(lambda j: verify_pair(DocumentPair.from_arrays(*j), workers=1, tiered=False), jobs))
+        elapsed = time.perf_counter() - t0
+    return {"workers": workers, "pages": len(jobs), "seconds": round(elapsed, 3), "pages_per_s": round(len(jobs) / elapsed, 3)}
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Any]:
+    """Verdict changes and per-case total-time ratios (current / baseline)."""
+    base = {(c["dpi"], c["variant"]): c for c in baseline.get("cases", [])}
+    changed, ratios = [], {}
+    for c in current["cases"]:
+        b = base.get((c["dpi"], c["variant"]))
+        if b is None:
+            continue
+        key = f"{c['dpi']}/{c['variant']}"
+        if b["verdicts"] != c["verdicts"]:
+            changed.append({"case": key, "baseline": b["verdicts"], "current": c["verdicts"]})
+        if b["stages_ms"]["total"]:
+            ratios[key] = round(c["stages_ms"]["total"] / b["stages_ms"]["total"], 3)
+    return {"baseline_commit": baseline.get("meta", {}).get("commit"), "verdict_changes": changed, "time_ratio": ratios}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark backend.main on synthetic certificates")
+    parser.add_argument("--dpi", type=int, nargs="+", default=[150, 300])
+    parser.add_argument("--variants", nargs="+", default=list(VARIANTS), choices=list(VARIANTS))
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case (median reported)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--rounds", type=int, default=1, help="passes over the corpus per throughput run")
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--compare", help="baseline JSON report to check verdicts and timings against")
+    args = parser.parse_args()
+
+    cases = build_corpus(args.dpi, args.variants)
+    verify_pair(DocumentPair.from_arrays(cases[0][2], cases[0][3]), tiered=False)  # warm-up
+
+    report: Dict[str, Any] = {
+        "meta": {
+            "commit": _git_commit(),
+            "pipeline_version": PIPELINE_VERSION,
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "cpus": os.cpu_count(),
+            "cv2_threads": cv2.getNumThreads(),
+            "matcher": matching.MATCHER,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "cases": [run_case(c, args.repeat) for c in cases],
+        "throughput": [run_throughput(cases, w, args.rounds) for w in args.workers],
+    }
+    report["meta"]["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    failed = any(c["problems"] for c in report["cases"])
+    if args.compare:
+        with open(args.compare) as f:
+            report["comparison"] = compare(report, json.load(f))
+        failed = failed or bool(report["comparison"]["verdict_changes"])
+
+    for c in report["cases"]:
+        s = c["stages_ms"]
+        print(
+            f"[bench] dpi={c['dpi']} {c['variant']:9s} total={s['total']:.0f}ms align={s['alignment']:.0f}ms "
+            + " ".join(f"{name}={s[name]:.0f}ms" for name, _ in MODELS)
+            + f" peak={c['peak_traced_mb']}MB tiered={c['tiered_ms']:.0f}ms({c['verdict_tier']}) {c['verdicts']['overall']}"
+            + (f" PROBLEM: {'; '.join(c['problems'])}" if c["problems"] else ""),
+            flush=True,
+        )
+    for t in report["throughput"]:
+        print(f"[bench] workers={t['workers']} {t['pages_per_s']} pages/s")
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
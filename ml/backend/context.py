@@ -0,0 +1,162 @@
+import hashlib
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict
+
+import cv2
+import numpy as np
+
+from . import metrics
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .alignment import Alignment
+
+
+def _nbytes(obj: Any) -> int:
+    """Approximate memory held by a memoized value (arrays dominate; containers are walked)."""
+    if isinstance(obj, np.memmap):
+        return 0  # file-backed: lives in the OS page cache, shared across processes
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if isinstance(obj, (list, tuple)):
+        return sum(_nbytes(o) for o in obj)
+    if isinstance(obj, dict):
+        return sum(_nbytes(o) for o in obj.values())
+    if isinstance(obj, PageImage):  # e.g. a downscaled copy memoized on a template
+        return obj.nbytes()
+    if isinstance(obj, (str, bytes)):
+        return len(obj)
+    return 0
+
+
+@metrics.stage("decode")
+def _read_image(image_path: str) -> np.ndarray:
+    image = cv2.imdecode(np.fromfile(image_path, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"Unable to read image: {image_path}")
+    return image
+
+
+class _Memoized:
+    """
+    Thread-safe compute-once storage. Models may run concurrently over the same
+    page (and cached templates are shared between requests), so each key gets
+    its own lock: concurrent callers wait for a single computation instead of
+    repeating it, while different keys still compute in parallel.
+    """
+
+    def __init__(self) -> None:
+        self._memo: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.Lock()
+            return lock
+
+    def memo(self, key: str, compute: Callable[[], Any]) -> Any:
+        if key in self._memo:
+            return self._memo[key]
+        with self._key_lock(key):
+            if key not in self._memo:
+                self._memo[key] = compute()
+        return self._memo[key]
+
+    def memoized(self) -> Dict[str, Any]:
+        """Snapshot of every value computed so far, by key."""
+        return dict(self._memo)
+
+    def seed(self, key: str, value: Any) -> None:
+        """Store a value computed elsewhere (e.g. loaded from the template store)."""
+        with self._key_lock(key):
+            self._memo[key] = value
+
+
+class PageImage(_Memoized):
+    """
+    A single decoded page (BGR) with lazily computed, cached derived views.
+
+    The page is decoded at most once; gray/HSV/edge views and any model-specific
+    features stored through `memo` are computed on first use and then shared by
+    every model that looks at the same page.
+    """
+
+    def __init__(
+        self,
+        image: np.ndarray | None = None,
+        path: str | None = None,
+        loader: Callable[[], np.ndarray] | None = None,
+    ):
+        if image is None and path is None and loader is None:
+            raise ValueError("PageImage needs an image, a path or a loader")
+        super().__init__()
+        self._image = image
+        self.path = path
+        self._loader = loader
+
+    @property
+    def image(self) -> np.ndarray:
+        # Decode lazily so read errors surface inside each model's error handling
+        if self._image is None:
+            with self._key_lock("image"):
+                if self._image is None:
+                    self._image = self._loader() if self._loader is not None else _read_image(self.path)
+        return self._image
+
+    @property
+    def shape(self) -> tuple:
+        return self.image.shape
+
+    def nbytes(self) -> int:
+        """Bytes held by the decoded page plus every cached view/feature."""
+        own = _nbytes(self._image) if self._image is not None else 0
+        return own + _nbytes(list(self._memo.values()))
+
+    @property
+    def digest(self) -> str:
+        """sha256 of the decoded pixels (and shape): identifies page content across requests."""
+
+        def compute() -> str:
+            h = hashlib.sha256(str(self.image.shape).encode())
+            h.update(np.ascontiguousarray(self.image).data)
+            return h.hexdigest()
+
+        return self.memo("digest", compute)
+
+    @property
+    def gray(self) -> np.ndarray:
+        return self.memo("gray", lambda: cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY))
+
+    @property
+    def hsv(self) -> np.ndarray:
+        return self.memo("hsv", lambda: cv2.cvtColor(self.image, cv2.COLOR_BGR2HSV))
+
+    @property
+    def edges(self) -> np.ndarray:
+        return self.memo("edges", lambda: cv2.Canny(self.gray, 50, 150))
+
+
+class DocumentPair(_Memoized):
+    """The original template page and the uploaded page for one verification."""
+
+    def __init__(self, original: PageImage, uploaded: PageImage):
+        super().__init__()
+        self.original = original
+        self.uploaded = uploaded
+
+    @property
+    def alignment(self) -> "Alignment":
+        """Upload registered onto the template; computed once and shared by every model."""
+        from .alignment import align_to_template
+
+        return self.memo("alignment", lambda: align_to_template(self.uploaded, self.original))
+
+    @classmethod
+    def from_paths(cls, original_path: str, uploaded_path: str) -> "DocumentPair":
+        return cls(PageImage(path=original_path), PageImage(path=uploaded_path))
+
+    @classmethod
+    def from_arrays(cls, original: np.ndarray, uploaded: np.ndarray) -> "DocumentPair":
+        return cls(PageImage(image=original), PageImage(image=uploaded))
@@ -0,0 +1,157 @@
+"""
+Per-request time budgets and cancellation.
+
+A caller that only waits so long sends its budget with the request
+(`X-ML-Deadline-Ms` header or `deadline_ms` form field). The pipeline checks
+the remaining time between stages against recent stage costs
+(`metrics.expected`):
+
+- models run cheapest first; a model that no longer fits is skipped and
+  reported "inconclusive", and so are pages of a multi-page request;
+- face detection and the layout model's SSIM run at DOWNGRADE_SCALE (both
+  sides resampled alike) and layout OCR is skipped when the full versions
+  would not fit;
+- a request whose budget ran out while it was queued is answered at once.
+
+A result shaped by its budget carries `partial: true` and a `deadline` block
+naming what was skipped or downgraded; it is never cached. When the client
+disconnects, its deadline is cancelled and the pipeline stops at the next stage
+boundary by raising `Cancelled`.
+
+The deadline travels in a ContextVar (into pools via metrics.submit) and to
+worker processes as an absolute wall-clock time plus a cancel flag.
+"""
+
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List
+
+MAX_BUDGET_MS = 600_000
+DOWNGRADE_SCALE = 0.5  # resolution of stages downgraded to fit a deadline
+
+
+class Cancelled(Exception):
+    """The caller went away, so nobody would read the verification's result."""
+
+
+class Deadline:
+    """Time budget of one request (None: unlimited, cancellation only) and what it cost the result."""
+
+    def __init__(self, budget_s: float | None, expires: float | None = None, cancel_flag: Any = None):
+        self.budget_s = budget_s
+        if expires is None:
+            expires = time.time() + budget_s if budget_s is not None else math.inf
+        self.expires = expires  # wall clock, so it means the same in worker processes
+        self._flag = cancel_flag if cancel_flag is not None else threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self.skipped: List[str] = []
+        self.downgraded: List[str] = []
+
+    def remaining(self) -> float:
+        return self.expires - time.time()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._flag.is_set()
+
+    def cancel(self) -> None:
+        with self._lock:
+            self._flag.set()
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Call `callback` on cancellation (at once if already cancelled); returns its unregister function."""
+        with self._lock:
+            self._callbacks.append(callback)
+            cancelled = self._flag.is_set()
+        if cancelled:
+            callback()
+
+        def remove() -> None:
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+
+        return remove
+
+    @property
+    def partial(self) -> bool:
+        return bool(self.skipped or self.downgraded)
+
+    def info(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "budget_ms": round(self.budget_s * 1000) if self.budget_s is not None else None,
+                "remaining_ms": round(self.remaining() * 1000) if self.budget_s is not None else None,
+                "skipped": list(self.skipped),
+                "downgraded": list(self.downgraded),
+            }
+
+
+_current: contextvars.ContextVar[Deadline | None] = contextvars.ContextVar("ml_deadline", default=None)
+
+
+def parse_ms(value: str | int | None) -> Deadline | None:
+    """Deadline from a budget in milliseconds, or None when none was sent; raises ValueError if malformed."""
+    if value is None or value == "":
+        return None
+    ms = int(value)
+    if not 0 < ms <= MAX_BUDGET_MS:
+        raise ValueError(f"deadline must be between 1 and {MAX_BUDGET_MS} ms")
+    return Deadline(ms / 1000)
+
+
+@contextmanager
+def within(deadline: Deadline | None) -> Iterator[Deadline | None]:
+    """Apply `deadline` to verifications started inside this block (and in pools fed by metrics.submit)."""
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def current() -> Deadline | None:
+    return _current.get()
+
+
+def check() -> None:
+    """Stage boundary: raise Cancelled if the client went away."""
+    deadline = _current.get()
+    if deadline is not None and deadline.cancelled:
+        raise Cancelled("Client disconnected")
+
+
+def allows(seconds: float) -> bool:
+    """Whether a stage expected to take `seconds` still fits the budget (always without one)."""
+    deadline = _current.get()
+    return deadline is None or deadline.remaining() >= seconds
+
+
+def expired() -> bool:
+    return not allows(0.0)
+
+
+def _note(kind: str, what: str) -> None:
+    deadline = _current.get()
+    if deadline is not None:
+        with deadline._lock:
+            notes = getattr(deadline, kind)
+            if what not in notes:
+                notes.append(what)
+
+
+def skip(what: str) -> None:
+    """Record that stage `what` did not run for lack of time."""
+    _note("skipped", what)
+
+
+def downgrade(what: str) -> None:
+    """Record that stage `what` ran in a cheaper, less precise mode."""
+    _note("downgraded", what)
@@ -0,0 +1,64 @@
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+
+from . import deadline, metrics, registry
+from .context import PageImage
+
+
+@metrics.stage("haar")
+def detect_faces(gray: np.ndarray) -> List[Tuple[int, int, int, int]]:
+    """Raw Haar frontal-face boxes (x, y, w, h) on a grayscale image."""
+    cascade = registry.face_cascade()
+    if cascade.empty():
+        return []
+    faces = cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(40, 40))
+    return [(int(x), int(y), int(w), int(h)) for (x, y, w, h) in faces]
+
+
+def _detect_full(page: PageImage) -> List[Tuple[int, int, int, int]]:
+    with metrics.stage("faces"):
+        return detect_faces(page.gray)
+
+
+def _detect_scaled(page: PageImage, scale: float) -> List[Tuple[int, int, int, int]]:
+    small = cv2.resize(page.gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return [tuple(int(round(v / scale)) for v in box) for box in detect_faces(small)]
+
+
+def face_seconds_saved() -> float:
+    """Expected time saved by detecting faces at DOWNGRADE_SCALE."""
+    return metrics.expected("faces") * (1 - deadline.DOWNGRADE_SCALE**2)
+
+
+def face_boxes(page: PageImage) -> List[Tuple[int, int, int, int]]:
+    """
+    Haar face boxes for a whole page, memoized so layout and photo share one detection.
+    When a full-resolution detection does not fit the request's deadline it runs on a
+    downscaled gray view (not kept). Those boxes are memoized on the same page under
+    "faces@<scale>", so a cached template keeps them for later deadline-limited
+    requests, but they never stand in for the full-resolution "faces".
+    """
+    if "faces" in page.memoized() or deadline.allows(metrics.expected("faces")):
+        return page.memo("faces", lambda: _detect_full(page))
+    scale = deadline.DOWNGRADE_SCALE
+    deadline.downgrade(f"faces@{scale}")
+    return page.memo(f"faces@{scale}", lambda: _detect_scaled(page, scale))
+
+
+@metrics.stage("phash")
+def perceptual_hash(page: PageImage) -> int:
+    """64-bit DCT perceptual hash of the page, memoized (cached templates keep theirs)."""
+
+    def compute() -> int:
+        small = cv2.resize(page.gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+        low = cv2.dct(small)[:8, :8].flatten()
+        bits = low > np.median(low[1:])
+        return int("".join("1" if b else "0" for b in bits), 2)
+
+    return page.memo("phash", compute)
+
+
+def hash_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
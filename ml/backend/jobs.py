@@ -0,0 +1,274 @@
+"""
+Durable local job queue for verifications that outlive an HTTP timeout.
+
+Jobs are rows in a SQLite database (ML_JOBS_DB), so queued and finished jobs
+survive restarts and several server processes on one host can share one queue
+without a broker. Runner threads (ML_JOB_RUNNERS per process) claim the
+highest-priority, oldest runnable job inside an immediate transaction and hold
+a lease on it that is renewed while it runs; a job whose process died is
+claimed again once its lease runs out.
+
+A failed attempt is retried with exponential backoff up to
+ML_JOB_MAX_ATTEMPTS times unless the handler raises `PermanentError` (bad
+input). Input documents are dropped as soon as a job finishes, and finished
+jobs with their results are deleted ML_JOB_RESULT_TTL_S after completion.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Tuple
+
+from . import DATA_DIR
+
+STATUSES = ("queued", "running", "done", "failed")
+RETRY_BASE_S = 2.0
+PURGE_EVERY_S = 60.0
+
+Handler = Callable[[Dict[str, Any], bytes | None, bytes], Dict[str, Any]]
+
+
+class PermanentError(Exception):
+    """The job can never succeed (e.g. unreadable PDF); do not retry it."""
+
+
+class QueueFull(Exception):
+    def __init__(self, queued: int):
+        super().__init__(f"Job queue is full ({queued} jobs waiting)")
+        self.queued = queued
+
+
+def _iso(ts: float | None) -> str | None:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(ts)) if ts else None
+
+
+class JobQueue:
+    def __init__(
+        self,
+        db_path: str,
+        max_attempts: int = 3,
+        lease_s: float = 300.0,
+        result_ttl_s: float = 86400.0,
+        max_queued: int = 1000,
+        poll_s: float = 1.0,
+    ):
+        self.db_path = db_path
+        self.max_attempts = max(1, max_attempts)
+        self.lease_s = lease_s
+        self.result_ttl_s = result_ttl_s
+        self.max_queued = max_queued
+        self.poll_s = poll_s
+        self._db: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._runners: List[threading.Thread] = []
+        self._last_purge = 0.0
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        # Opened on first use, so processes that never touch jobs (e.g. workers) create no file
+        if self._db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, priority INTEGER NOT NULL, status TEXT NOT NULL,"
+                "attempts INTEGER NOT NULL DEFAULT 0, params TEXT NOT NULL, original BLOB, uploaded BLOB,"
+                "created REAL NOT NULL, not_before REAL NOT NULL, started REAL, lease_until REAL,"
+                "finished REAL, expires REAL, result TEXT, error TEXT)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_runnable ON jobs (status, priority DESC, created)")
+            self._db = db
+        return self._db
+
+    def _execute(self, sql: str, args: Tuple[Any, ...] = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self.db.execute(sql, args)
+
+    def submit(self, params: Dict[str, Any], original: bytes | None, uploaded: bytes, priority: int = 0) -> Dict[str, Any]:
+        """Queue a job; raises QueueFull when ML_JOBS_MAX_QUEUED jobs are already waiting."""
+        queued = self.count("queued")
+        if self.max_queued > 0 and queued >= self.max_queued:
+            raise QueueFull(queued)
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._execute(
+            "INSERT INTO jobs (id, priority, status, params, original, uploaded, created, not_before) "
+            "VALUES (?, ?, 'queued', ?, ?, ?, ?, ?)",
+            (job_id, int(priority), json.dumps(params), original, uploaded, now, now),
+        )
+        self._wake.set()
+        return self.get(job_id)
+
+    def claim(self) -> Tuple[str, Dict[str, Any], bytes | None, bytes] | None:
+        """Take the next runnable job (or one whose runner's lease expired); None if there is none."""
+        now = time.time()
+        with self._lock:
+            db = self.db
+            db.execute("BEGIN IMMEDIATE")  # serialises claims across processes sharing the file
+            try:
+                while True:
+                    row = db.execute(
+                        "SELECT id, attempts, status FROM jobs "
+                        "WHERE (status = 'queued' AND not_before <= ?) OR (status = 'running' AND lease_until < ?) "
+                        "ORDER BY priority DESC, created LIMIT 1",
+                        (now, now),
+                    ).fetchone()
+                    if row is None:
+                        db.execute("COMMIT")
+                        return None
+                    job_id, attempts, status = row
+                    if status == "running" and attempts >= self.max_attempts:
+                        self._finish(db, job_id, "failed", error="Runner stopped responding on every attempt")
+                        continue
+                    db.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, started = ?, lease_until = ? "
+                        "WHERE id = ?",
+                        (now, now + self.lease_s, job_id),
+                    )
+                    params, original, uploaded = db.execute(
+                        "SELECT params, original, uploaded FROM jobs WHERE id = ?", (job_id,)
+                    ).fetchone()
+                    db.execute("COMMIT")
+                    return job_id, json.loads(params), original, uploaded
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+
+    def _finish(self, db: sqlite3.Connection, job_id: str, status: str, result: Dict[str, Any] | None = None, error: str | None = None) -> None:
+        now = time.time()
+        db.execute(
+            "UPDATE jobs SET status = ?, finished = ?, expires = ?, result = ?, error = ?, "
+            "original = NULL, uploaded = NULL, lease_until = NULL WHERE id = ?",
+            (status, now, now + self.result_ttl_s, json.dumps(result) if result is not None else None, error, job_id),
+        )
+
+    def complete(self, job_id: str, result: Dict[str, Any]) -> None:
+        with self._lock:
+            self._finish(self.db, job_id, "done", result=result)
+
+    def fail(self, job_id: str, error: str, retry: bool = True) -> None:
+        with self._lock:
+            row = self.db.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            if retry and row[0] < self.max_attempts:
+                delay = RETRY_BASE_S * 2 ** (row[0] - 1)
+                self.db.execute(
+                    "UPDATE jobs SET status = 'queued', not_before = ?, lease_until = NULL, error = ? WHERE id = ?",
+                    (time.time() + delay, error, job_id),
+                )
+            else:
+                self._finish(self.db, job_id, "failed", error=error)
+
+    def _renew(self, job_id: str) -> None:
+        self._execute(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND status = 'running'", (time.time() + self.lease_s, job_id)
+        )
+
+    def get(self, job_id: str) -> Dict[str, Any] | None:
+        """Public view of a job, or None if unknown or expired."""
+        row = self._execute(
+            "SELECT id, priority, status, attempts, created, started, finished, expires, result, error "
+            "FROM jobs WHERE id = ?",
+            (job_id,),
+        ).fetchone()
+        if row is None or (row[7] is not None and row[7] < time.time()):
+            return None
+        job_id, priority, status, attempts, created, started, finished, expires, result, error = row
+        out: Dict[str, Any] = {
+            "job_id": job_id,
+            "status": status,
+            "priority": priority,
+            "attempts": attempts,
+            "max_attempts": self.max_attempts,
+            "created_at": _iso(created),
+            "started_at": _iso(started),
+            "finished_at": _iso(finished),
+            "expires_at": _iso(expires),
+        }
+        if result is not None:
+            out["result"] = json.loads(result)
+        if error is not None:
+            out["error"] = error  # for a queued job: why the previous attempt failed
+        return out
+
+    def count(self, status: str) -> int:
+        return int(self._execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)).fetchone()[0])
+
+    def purge(self) -> int:
+        """Delete finished jobs whose result TTL has passed."""
+        return self._execute("DELETE FROM jobs WHERE expires IS NOT NULL AND expires < ?", (time.time(),)).rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        rows = self._execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {s: 0 for s in STATUSES}
+        counts.update({s: int(n) for s, n in rows})
+        return {"db": self.db_path, "runners": len(self._runners), **counts}
+
+    # ---- runners ----
+
+    def _run_one(self, handler: Handler) -> bool:
+        claimed = self.claim()
+        if claimed is None:
+            return False
+        job_id, params, original, uploaded = claimed
+        done = threading.Event()
+
+        def heartbeat() -> None:
+            while not done.wait(self.lease_s / 3):
+                self._renew(job_id)
+
+        threading.Thread(target=heartbeat, name="ml-job-lease", daemon=True).start()
+        try:
+            self.complete(job_id, handler(params, original, uploaded))
+        except PermanentError as e:
+            self.fail(job_id, str(e), retry=False)
+        except Exception as e:
+            self.fail(job_id, f"{type(e).__name__}: {e}")
+        finally:
+            done.set()
+        return True
+
+    def _runner(self, handler: Handler) -> None:
+        while not self._stop.is_set():
+            try:
+                if time.time() - self._last_purge >= PURGE_EVERY_S:
+                    self._last_purge = time.time()
+                    self.purge()
+                if self._run_one(handler):
+                    continue
+            except Exception as e:  # keep the runner alive through database hiccups
+                print(f"[ml] job runner error: {e}")
+            # Idle: a local submit wakes us at once; jobs submitted by other processes are seen on the next poll
+            self._wake.wait(self.poll_s)
+            self._wake.clear()
+
+    def start(self, handler: Handler, runners: int) -> None:
+        for i in range(runners):
+            t = threading.Thread(target=self._runner, args=(handler,), name=f"ml-job-{i}", daemon=True)
+            t.start()
+            self._runners.append(t)
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        for t in self._runners:
+            t.join(timeout=1)
+        self._runners.clear()
+
+
+JOB_RUNNERS = max(0, int(os.environ.get("ML_JOB_RUNNERS", "1")))
+
+job_queue = JobQueue(
+    os.environ.get("ML_JOBS_DB", os.path.join(DATA_DIR, "jobs.db")),
+    max_attempts=int(os.environ.get("ML_JOB_MAX_ATTEMPTS", "3")),
+    lease_s=float(os.environ.get("ML_JOB_LEASE_S", "300")),
+    result_ttl_s=float(os.environ.get("ML_JOB_RESULT_TTL_S", "86400")),
+    max_queued=int(os.environ.get("ML_JOBS_MAX_QUEUED", "1000")),
+)
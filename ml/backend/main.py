@@ -1,14 +1,166 @@
+
+
 import json
-from typing import Dict, Any
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, List, Tuple
+
+
+from . import deadline, metrics, profiling
+from .context import DocumentPair
+from .features import hash_distance, perceptual_hash
+from .models.layout_model import layout_min_seconds, verify_layout_pair
+from .models.photo_model import photo_min_seconds, verify_photo_pair
+from .models.seal_model import verify_seal_pair
+from .models.signature_model import verify_signature_pair
+
+
+# Fixed order: results are always assembled in this order regardless of completion order
+MODELS: List[Tuple[str, Callable[[DocumentPair], Dict[str, Any]]]] = [
+    ("layout", verify_layout_pair),
+    ("photo", verify_photo_pair),
+    ("seal", verify_seal_pair),
+    ("signature", verify_signature_pair),
+]
+
+# Bump whenever model logic or thresholds change; cached results from other versions are ignored
+PIPELINE_VERSION = "5"
+
+# Tiered mode (opt-in): cheap checks that can decide a verdict before any model runs. They
+# trade some agreement with the models for latency, see _precheck
+TIERED = os.environ.get("ML_TIERED", "0").lower() not in ("0", "false", "no")
+# Out of 64 bits. Unrelated pages sit near 32; the same layout with edits, scan noise or a
+# few degrees of rotation stays well below, so only grossly different pages are rejected
+PHASH_REJECT_DISTANCE = int(os.environ.get("ML_TIER_PHASH_REJECT", "24"))
+
+_pools: Dict[int, ThreadPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+def _default_workers() -> int:
+    # 1 keeps the historical sequential behaviour; >1 runs the models on a shared thread pool
+    try:
+        return max(1, int(os.environ.get("ML_MODEL_WORKERS", "1")))
+    except ValueError:
+        return 1
+
+
+def _model_pool(workers: int) -> ThreadPoolExecutor:
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = _pools[workers] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ml-model")
+        return pool
+
+
+# Expected cost of a model in its cheapest mode, for models that can downgrade stages under a deadline
+_MIN_SECONDS: Dict[str, Callable[[], float]] = {"layout": layout_min_seconds, "photo": photo_min_seconds}
+
+
+def _min_seconds(name: str) -> float:
+    cheapest = _MIN_SECONDS.get(name)
+    return cheapest() if cheapest is not None else metrics.expected(f"model.{name}")
+
+
+def _inconclusive(name: str, message: str) -> Dict[str, Any]:
+    return {"model": name, "status": "inconclusive", "message": message}
+
 
+def _run_model(name: str, fn: Callable[[DocumentPair], Dict[str, Any]], pair: DocumentPair) -> Dict[str, Any]:
+    deadline.check()
+    if not deadline.allows(_min_seconds(name)):
+        deadline.skip(f"model.{name}")
+        return _inconclusive(name, f"{name.capitalize()} not verified: time budget exhausted")
+    # Models handle their own errors; this only guards against anything escaping them
+    try:
+        with metrics.stage(f"model.{name}"):
+            return fn(pair)
+    except Exception as e:
+        metrics.ERRORS.inc("model_exception")
+        return {
+            "model": name,
+            "status": "tampered",
+            "message": f"{name.capitalize()} verification error: {str(e)}",
+            "error": True,
+        }
 
-from .models.layout_model import verify_layout
-from .models.photo_model import verify_photo
-from .models.seal_model import verify_seal
-from .models.signature_model import verify_signature
 
+def _precheck(pair: DocumentPair, prechecks: Dict[str, Any]) -> Tuple[str, str, str] | None:
+    """
+    Cheap tiers, in cost order. Returns (tier, overall_status, message) when one of them
+    decides the verdict, or None when the full models are needed.
 
-def verify_all(original_path: str, uploaded_path: str) -> Dict[str, Any]:
+    Only the alignment tier repeats what the models would conclude (the layout model
+    rejects every unaligned page). The digest tier accepts a pixel-identical upload even
+    where a model would not (e.g. a page with no face or seal to compare), and the phash
+    tier rejects on resemblance alone, so both can disagree with the full pipeline.
+    """
+    if pair.original.digest == pair.uploaded.digest:
+        prechecks["digest_match"] = True
+        return "digest", "authentic", "Upload is pixel-identical to the original"
+    prechecks["digest_match"] = False
+
+    distance = hash_distance(perceptual_hash(pair.original), perceptual_hash(pair.uploaded))
+    prechecks["phash_distance"] = distance
+    if distance >= PHASH_REJECT_DISTANCE:
+        return "phash", "tampered", f"Upload does not resemble the original (perceptual hash distance {distance}/64)"
+
+    # Alignment is shared with the models, so this tier costs nothing extra when it passes
+    alignment = pair.alignment
+    prechecks["inlier_ratio"] = alignment.inlier_ratio
+    if not alignment.aligned:
+        # The layout model always rejects an unaligned page
+        return "alignment", "tampered", "Layout could not be aligned to template"
+    return None
+
+
+def inconclusive_result(message: str) -> Dict[str, Any]:
+    """Result of a verification the deadline left no time for."""
+    results: Dict[str, Any] = {name: _inconclusive(name, message) for name, _ in MODELS}
+    results["verdict_tier"] = "deadline"
+    results["overall_status"] = "inconclusive"
+    metrics.VERDICTS.inc("deadline", "inconclusive")
+    return results
+
+
+def verify_all(
+    original_path: str, uploaded_path: str, workers: int | None = None, tiered: bool | None = None
+) -> Dict[str, Any]:
+    return verify_pair(DocumentPair.from_paths(original_path, uploaded_path), workers=workers, tiered=tiered)
+
+
+def verify_pair(pair: DocumentPair, workers: int | None = None, tiered: bool | None = None) -> Dict[str, Any]:
+    """
+    Run all four models over one shared DocumentPair (each page is decoded once).
+
+    With `workers` > 1 (default: ML_MODEL_WORKERS) the models run concurrently on a
+    thread pool; the heavy OpenCV calls release the GIL, so latency tends toward the
+    slowest model. Shared stages (decode, alignment) still run once.
+
+    In tiered mode (default: ML_TIERED, off) cheap pre-checks run first and may decide
+    the verdict without the models; `verdict_tier` records which tier did.
+
+    Under a deadline (see backend.deadline) models run cheapest first and any that
+    no longer fit are "inconclusive"; the page is then "inconclusive" unless a model
+    that did run found it tampered.
+
+    When profiling is on (see backend.profiling) the models run sequentially under
+    cProfile and `profile` holds the path of the saved profile.
+    """
+    if not profiling.active():
+        return _verify_pair(pair, workers, tiered)
+    with profiling.profile("verify") as saved:
+        results = _verify_pair(pair, 1, tiered)
+    results["profile"] = saved[0]
+    return results
+
+
+def _verify_pair(pair: DocumentPair, workers: int | None, tiered: bool | None) -> Dict[str, Any]:
+    deadline.check()
+    if deadline.expired():
+        deadline.skip("verification")
+        return inconclusive_result("Not verified: time budget exhausted")
     results: Dict[str, Any] = {
         "layout": {},
         "photo": {},
@@ -17,18 +169,54 @@ def verify_all(original_path: str, uploaded_path: str) -> Dict[str, Any]:
         "overall_status": "tampered",
     }
 
-    layout_res = verify_layout(original_path, uploaded_path)
-    photo_res = verify_photo(original_path, uploaded_path)
-    seal_res = verify_seal(original_path, uploaded_path)
-    sign_res = verify_signature(original_path, uploaded_path)
+    if TIERED if tiered is None else tiered:
+        prechecks: Dict[str, Any] = {}
+        try:
+            with metrics.stage("precheck"):
+                decided = _precheck(pair, prechecks)
+        except deadline.Cancelled:
+            raise
+        except Exception:
+            decided = None  # e.g. unreadable page: let the models report their own errors
+        results["prechecks"] = prechecks
+        if decided is not None:
+            tier, status, message = decided
+            model_status = "authentic" if status == "authentic" else "skipped"
+            for name, _ in MODELS:
+                results[name] = {"model": name, "status": model_status, "message": message}
+            if tier == "alignment":
+                results["alignment"] = pair.alignment.info()
+            results["verdict_tier"] = tier
+            results["overall_status"] = status
+            metrics.VERDICTS.inc(tier, status)
+            return results
+
+    # Cheapest first, so a short budget still yields as many verdicts as possible
+    ordered = sorted(MODELS, key=lambda m: metrics.expected(f"model.{m[0]}"))
+    workers = _default_workers() if workers is None else max(1, workers)
+    if workers == 1:
+        for name, fn in ordered:
+            results[name] = _run_model(name, fn, pair)
+    else:
+        pool = _model_pool(workers)
+        futures = [(name, metrics.submit(pool, _run_model, name, fn, pair)) for name, fn in ordered]
+        for name, fut in futures:
+            results[name] = fut.result()
 
-    results["layout"] = layout_res
-    results["photo"] = photo_res
-    results["seal"] = seal_res
-    results["signature"] = sign_res
+    try:
+        results["alignment"] = pair.alignment.info()
+    except Exception as e:
+        results["alignment"] = {"aligned": False, "reason": str(e)}
 
-    statuses = [layout_res.get("status"), photo_res.get("status"), seal_res.get("status"), sign_res.get("status")]
-    results["overall_status"] = "authentic" if all(s == "authentic" for s in statuses) else "tampered"
+    results["verdict_tier"] = "models"
+    statuses = [results[name].get("status") for name, _ in MODELS]
+    if all(s == "authentic" for s in statuses):
+        results["overall_status"] = "authentic"
+    elif all(s in ("authentic", "inconclusive") for s in statuses):
+        results["overall_status"] = "inconclusive"
+    else:
+        results["overall_status"] = "tampered"
+    metrics.VERDICTS.inc("models", results["overall_status"])
     return results
 
 
@@ -38,5 +226,3 @@ if __name__ == "__main__":
         print("Usage: python -m backend.main <original> <uploaded>")
         raise SystemExit(1)
     print(json.dumps(verify_all(sys.argv[1], sys.argv[2]), indent=2))
-
-
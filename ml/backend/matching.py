@@ -0,0 +1,94 @@
+"""
+Binary (ORB) descriptor matching with selectable backends.
+
+- `bf`:    brute-force Hamming with cross-check (the historical behaviour).
+- `knn`:   brute-force 2-NN with Lowe's ratio test; no reverse pass, and ambiguous
+           matches on repetitive text are dropped before RANSAC.
+- `flann`: FLANN multi-probe LSH 2-NN with the same ratio test; approximate,
+           sub-quadratic on feature-rich pages at the cost of a little recall.
+
+Matches come back as NumPy arrays, so filtering, ranking and point extraction
+never loop over DMatch objects in Python beyond the single conversion pass.
+"""
+
+import os
+from typing import Any, Dict
+
+import numpy as np
+
+from . import metrics, registry
+
+BACKENDS = ("bf", "knn", "flann")
+MATCHER = os.environ.get("ML_MATCHER", "bf").lower()
+RATIO = float(os.environ.get("ML_MATCH_RATIO", "0.8"))
+
+if MATCHER not in BACKENDS:
+    raise ValueError(f"ML_MATCHER must be one of {', '.join(BACKENDS)}, got {MATCHER!r}")
+
+
+class Matches:
+    """Parallel arrays of query index, train index and Hamming distance."""
+
+    def __init__(self, query: np.ndarray, train: np.ndarray, distance: np.ndarray, backend: str):
+        self.query = query
+        self.train = train
+        self.distance = distance
+        self.backend = backend
+
+    def __len__(self) -> int:
+        return int(self.query.shape[0])
+
+    def select(self, keep: np.ndarray) -> "Matches":
+        """Subset by boolean mask or index array."""
+        return Matches(self.query[keep], self.train[keep], self.distance[keep], self.backend)
+
+    def best(self, n: int) -> "Matches":
+        # Stable, so ties keep matcher order exactly like sorted() on DMatch lists
+        return self.select(np.argsort(self.distance, kind="stable")[:n])
+
+    def count_below(self, max_distance: float) -> int:
+        return int(np.count_nonzero(self.distance < max_distance))
+
+    def info(self, max_distance: float | None = None) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"backend": self.backend, "matches": len(self)}
+        if max_distance is not None:
+            out["good"] = self.count_below(max_distance)
+        return out
+
+
+def _empty(backend: str) -> Matches:
+    return Matches(np.empty(0, np.int32), np.empty(0, np.int32), np.empty(0, np.float32), backend)
+
+
+def _from_pairs(pairs: Any, backend: str) -> Matches:
+    # knnMatch returns up to 2 neighbours per query (FLANN-LSH may return fewer)
+    rows = [(p[0].queryIdx, p[0].trainIdx, p[0].distance, p[1].distance if len(p) > 1 else np.inf) for p in pairs if p]
+    if not rows:
+        return _empty(backend)
+    arr = np.array(rows, dtype=np.float64)
+    keep = arr[:, 2] < RATIO * arr[:, 3]
+    arr = arr[keep]
+    return Matches(arr[:, 0].astype(np.int32), arr[:, 1].astype(np.int32), arr[:, 2].astype(np.float32), backend)
+
+
+@metrics.stage("match")
+def match(des_query: np.ndarray, des_train: np.ndarray, backend: str | None = None) -> Matches:
+    """Match uint8 ORB descriptors of the query image against the train image."""
+    backend = (backend or MATCHER).lower()
+    if des_query is None or des_train is None or len(des_query) == 0 or len(des_train) == 0:
+        return _empty(backend)
+    if backend == "bf":
+        found = registry.hamming_matcher().match(des_query, des_train)
+        if not found:
+            return _empty(backend)
+        arr = np.array([(m.queryIdx, m.trainIdx, m.distance) for m in found], dtype=np.float64)
+        return Matches(arr[:, 0].astype(np.int32), arr[:, 1].astype(np.int32), arr[:, 2].astype(np.float32), backend)
+    if backend == "knn":
+        if len(des_train) < 2:
+            return match(des_query, des_train, "bf")
+        return _from_pairs(registry.hamming_knn_matcher().knnMatch(des_query, des_train, k=2), backend)
+    if backend == "flann":
+        if len(des_train) < 2:
+            return match(des_query, des_train, "bf")
+        return _from_pairs(registry.flann_lsh_matcher().knnMatch(des_query, des_train, k=2), backend)
+    raise ValueError(f"Unknown matcher backend: {backend}")
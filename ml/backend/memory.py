@@ -0,0 +1,217 @@
+"""
+Per-request memory budget and peak-memory accounting.
+
+The working set of one verification grows with the page area: template and
+upload rasters with their gray/HSV/edge views, the warped upload and its views,
+SSIM strips and diff maps. Measured peaks are about BYTES_PER_PX bytes per
+template pixel on top of FIXED_BYTES at 150-600 DPI (SSIM is already float32
+and strip-tiled, see backend.ssim), so the footprint is estimated before any
+rendering.
+
+- ML_MEMORY_BUDGET_MB caps one verification. Above it, pages are processed at a
+  reduced scale, down to MIN_SCALE. Both sides are resampled the same way (the
+  template is downscaled once and cached with its features; the upload is
+  rendered, downscaled and the full-size raster dropped), since pages resampled
+  differently no longer compare as identical.
+- ML_MEMORY_POOL_MB caps the estimates of all verifications running in this
+  process; a verification that does not fit waits for running ones to finish,
+  at most until its deadline passes. Cancellation ends the wait with
+  `deadline.Cancelled`; a verification whose deadline passed enters without a
+  reservation, and callers answer it inconclusive before rendering anything.
+- `track()` measures the peak resident size during a request. Peaks are exact
+  when the request ran alone in its process (always so in worker processes);
+  otherwise they include overlapping requests and are marked `isolated: false`.
+"""
+
+import math
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+
+import cv2
+import numpy as np
+
+from . import deadline
+from .context import PageImage
+
+BUDGET_MB = float(os.environ.get("ML_MEMORY_BUDGET_MB", "0"))  # 0: unlimited
+POOL_MB = float(os.environ.get("ML_MEMORY_POOL_MB", "0"))  # 0: unlimited
+BYTES_PER_PX = 40
+FIXED_BYTES = 64 * 2**20
+RENDER_BYTES_PER_PX = 3  # a BGR page rendered at full size before being downscaled
+MIN_SCALE = 0.25
+
+_MB = 2**20
+
+
+def estimate(pixels: int) -> int:
+    """Estimated peak bytes of one verification whose larger page has `pixels` pixels."""
+    return FIXED_BYTES + BYTES_PER_PX * int(pixels)
+
+
+class Plan:
+    """Processing scale chosen for a request and the estimate it was chosen from."""
+
+    def __init__(self, pixels: int, dpi: int, concurrency: int = 1, render_px: int = 0):
+        # render_px: pixels of a page rendered at full size and then downscaled when degraded
+        self.full_bytes = estimate(pixels) * concurrency
+        scale = 1.0
+        if BUDGET_MB > 0 and self.full_bytes > BUDGET_MB * _MB:
+            room = BUDGET_MB * _MB / concurrency - FIXED_BYTES - RENDER_BYTES_PER_PX * render_px
+            scale = math.sqrt(room / (BYTES_PER_PX * pixels)) if room > 0 else 0.0
+        # Whole DPI steps: the renderer takes an integer DPI and the template is scaled to match
+        self.dpi = max(1, int(dpi * max(MIN_SCALE, min(1.0, scale))))
+        self.scale = self.dpi / dpi
+        transient = RENDER_BYTES_PER_PX * render_px if self.degraded else 0
+        self.bytes = (estimate(int(pixels * self.scale**2)) + transient) * concurrency
+
+    @property
+    def degraded(self) -> bool:
+        return self.scale < 1.0
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "budget_mb": BUDGET_MB or None,
+            "estimated_mb": round(self.bytes / _MB, 1),
+            "full_estimate_mb": round(self.full_bytes / _MB, 1),
+            "scale": round(self.scale, 4),
+            "dpi": self.dpi,
+            "degraded": self.degraded,
+        }
+
+
+def scaled_image(image: np.ndarray, scale: float) -> np.ndarray:
+    if scale >= 1.0:
+        return image
+    h, w = image.shape[:2]
+    size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def scaled_page(page: PageImage, scale: float) -> PageImage:
+    """`page` resized by `scale`, memoized on it so cached templates keep the small copy and its features."""
+    if scale >= 1.0:
+        return page
+    return page.memo(f"scaled@{scale:.4f}", lambda: PageImage(image=scaled_image(page.image, scale)))
+
+
+class _Pool:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._cond = threading.Condition()
+        self.reserved = 0
+        self.peak_reserved = 0
+        self.waits = 0
+
+    def _fits(self, nbytes: int) -> bool:
+        # One verification always runs, even if its estimate alone exceeds the pool
+        return self.capacity <= 0 or not self.reserved or self.reserved + nbytes <= self.capacity
+
+    def _wake(self) -> None:
+        with self._cond:
+            self._cond.notify_all()
+
+    @contextmanager
+    def reserve(self, nbytes: int) -> Iterator[None]:
+        limited = deadline.current()
+        held = 0
+        try:
+            with self._cond:
+                if not self._fits(nbytes):
+                    self.waits += 1
+                    unregister = limited.on_cancel(self._wake) if limited is not None else None
+                    timeout = limited.remaining() if limited is not None and limited.budget_s is not None else None
+                    try:
+                        self._cond.wait_for(
+                            lambda: self._fits(nbytes) or (limited is not None and limited.cancelled),
+                            timeout=None if timeout is None else max(0.0, timeout),
+                        )
+                    finally:
+                        if unregister is not None:
+                            unregister()
+                if self._fits(nbytes):
+                    held = nbytes
+                    self.reserved += held
+                    self.peak_reserved = max(self.peak_reserved, self.reserved)
+            deadline.check()
+            yield
+        finally:
+            if held:
+                with self._cond:
+                    self.reserved -= held
+                    self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "budget_mb": BUDGET_MB or None,
+                "pool_mb": POOL_MB or None,
+                "reserved_mb": round(self.reserved / _MB, 1),
+                "peak_reserved_mb": round(self.peak_reserved / _MB, 1),
+                "waits": self.waits,
+            }
+
+
+pool = _Pool(int(POOL_MB * _MB))
+
+
+def reserve(nbytes: int):
+    """Hold `nbytes` of the process-wide pool (ML_MEMORY_POOL_MB) for the enclosed block."""
+    return pool.reserve(nbytes)
+
+
+# ---- peak measurement ----
+
+_track_lock = threading.Lock()
+_active = 0
+_epoch = 0
+
+
+def _status_mb(field: str) -> float | None:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak() -> bool:
+    # Linux: writing 5 resets VmHWM (the process's peak RSS) to the current RSS
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+@contextmanager
+def track() -> Iterator[Dict[str, Any]]:
+    """Yields a dict that is filled with the request's peak memory when the block exits."""
+    global _active, _epoch
+    out: Dict[str, Any] = {}
+    with _track_lock:
+        _active += 1
+        _epoch += 1
+        epoch = _epoch
+        alone = _active == 1 and _reset_peak()
+        start = _status_mb("VmRSS")
+    try:
+        yield out
+    finally:
+        with _track_lock:
+            _active -= 1
+            isolated = alone and _epoch == epoch
+            peak = _status_mb("VmHWM")
+        if peak is not None and start is not None:
+            out.update(
+                {
+                    "peak_rss_mb": round(peak, 1),
+                    "peak_delta_mb": round(peak - start, 1),
+                    "isolated": isolated,
+                }
+            )
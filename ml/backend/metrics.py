@@ -0,0 +1,256 @@
+"""
+Stage timing and Prometheus metrics, without a client-library dependency.
+
+Code wraps interesting work in `stage("name")`. Every stage observation feeds the
+process-wide `ml_stage_seconds` histogram; when a request has opened a
+`collect()` block, it is also summed into that request's `Timings`, which can be
+returned in the response. Stages nest (e.g. `model.layout` contains `ssim` and
+`ocr`), so per-request values are not additive.
+
+Each stage's recent cost is also kept as an exponentially weighted average
+(`expected`), which deadline-aware verification plans with.
+
+Requests are tracked through a ContextVar. Thread pools do not propagate it on
+their own, so work fanned out inside a request is submitted through `submit()`.
+"""
+
+import contextvars
+import threading
+import time
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+# Seconds; spans a fast cached lookup up to a slow multi-page verification
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    # Label values in the text exposition format: backslash, double quote and newline are escaped
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def _label_str(self, values: Labels, extra: str = "") -> str:
+        pairs = [f'{k}="{_escape(v)}"' for k, v in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{self._label_str(k)} {v}" for k, v in sorted(self._values.items())]
+
+    def _drain(self) -> Dict[Labels, float]:
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def _merge(self, values: Dict[Labels, float]) -> None:
+        for labels, amount in values.items():
+            self.inc(*labels, amount=amount)
+
+
+class Gauge(_Metric):
+    """A value set directly, or read from `source` at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, source: Callable[[], float] | None = None):
+        super().__init__(name, help_text)
+        self._value = 0.0
+        self._source = source
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.inc(-amount)
+
+    def samples(self) -> List[str]:
+        value = self._source() if self._source is not None else self._value
+        return [f"{self.name} {value}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = buckets
+        self._series: Dict[Labels, List[float]] = {}  # per-bucket counts, then +Inf count and sum
+
+    def observe(self, *labels: str, value: float) -> None:
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def samples(self) -> List[str]:
+        out: List[str] = []
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    le = self._label_str(labels, 'le="%s"' % bound)
+                    out.append(f"{self.name}_bucket{le} {count}")
+                le = self._label_str(labels, 'le="+Inf"')
+                out.append(f"{self.name}_bucket{le} {series[-2]}")
+                out.append(f"{self.name}_count{self._label_str(labels)} {series[-2]}")
+                out.append(f"{self.name}_sum{self._label_str(labels)} {series[-1]}")
+        return out
+
+    def _drain(self) -> Dict[Labels, List[float]]:
+        with self._lock:
+            series, self._series = self._series, {}
+        return series
+
+    def _merge(self, series: Dict[Labels, List[float]]) -> None:
+        with self._lock:
+            for labels, values in series.items():
+                mine = self._series.setdefault(labels, [0.0] * len(values))
+                for i, v in enumerate(values):
+                    mine[i] += v
+
+
+_registry: List[_Metric] = []
+
+
+def register(metric: _Metric) -> _Metric:
+    _registry.append(metric)
+    return metric
+
+
+STAGE_SECONDS: Histogram = register(Histogram("ml_stage_seconds", "Wall time of pipeline stages", ("stage",)))
+REQUEST_SECONDS: Histogram = register(Histogram("ml_request_seconds", "Wall time of HTTP requests", ("path",)))
+REQUESTS: Counter = register(Counter("ml_requests_total", "HTTP requests by path and status code", ("path", "code")))
+IN_FLIGHT: Gauge = register(Gauge("ml_requests_in_flight", "Verification requests currently being handled"))
+ERRORS: Counter = register(Counter("ml_errors_total", "Errors by kind", ("kind",)))
+VERDICTS: Counter = register(Counter("ml_verdicts_total", "Page verdicts by deciding tier", ("tier", "status")))
+
+
+def drain() -> Dict[str, Any]:
+    """
+    Counter and histogram values recorded since the last call, which are reset; a
+    worker process sends these to the server process with each job's result.
+    """
+    return {m.name: m._drain() for m in _registry if isinstance(m, (Counter, Histogram))}
+
+
+def merge(values: Dict[str, Any]) -> None:
+    """Add values drained in another process to this process's metrics."""
+    for metric in _registry:
+        if metric.name in values:
+            metric._merge(values[metric.name])
+
+
+def render() -> str:
+    """Prometheus text exposition (format 0.0.4) of every registered metric."""
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class Timings:
+    """Per-request stage totals (seconds); safe to update from several threads."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.stages: Dict[str, float] = {}
+        self.started = time.perf_counter()
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "total_ms": round((time.perf_counter() - self.started) * 1000, 2),
+                "stages_ms": {k: round(v * 1000, 2) for k, v in sorted(self.stages.items())},
+            }
+
+
+# Weight of the newest observation in `expected`; per process and never drained
+EXPECTED_ALPHA = 0.3
+
+_expected: Dict[str, float] = {}
+_expected_lock = threading.Lock()
+
+
+def expected(name: str) -> float:
+    """Recent wall time of stage `name` in seconds (0.0 until it has run in this process)."""
+    return _expected.get(name, 0.0)
+
+
+def _observe_expected(name: str, seconds: float) -> None:
+    with _expected_lock:
+        previous = _expected.get(name)
+        _expected[name] = seconds if previous is None else previous + EXPECTED_ALPHA * (seconds - previous)
+
+
+_current: contextvars.ContextVar[Timings | None] = contextvars.ContextVar("ml_timings", default=None)
+
+
+@contextmanager
+def collect() -> Iterator[Timings]:
+    """Collect the stages run by this request (including work passed through `submit`)."""
+    timings = Timings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        STAGE_SECONDS.observe(name, value=elapsed)
+        _observe_expected(name, elapsed)
+        timings = _current.get()
+        if timings is not None:
+            timings.add(name, elapsed)
+
+
+def submit(pool: Executor, fn: Callable[..., Any], *args: Any) -> Future:
+    """`pool.submit` that carries the caller's request context into the worker thread."""
+    return pool.submit(contextvars.copy_context().run, fn, *args)
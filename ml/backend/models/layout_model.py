@@ -3,59 +3,36 @@ from typing import Dict, Any, List, Tuple
 
 import cv2
 import numpy as np
-from skimage.metrics import structural_similarity as ssim
 import os
 
-try:
-    import pytesseract  # Optional, used for auxiliary text consistency check
-except Exception:  # pragma: no cover
-    pytesseract = None
+from .. import deadline, metrics
+from ..context import DocumentPair, PageImage
+from ..features import face_boxes, face_seconds_saved
+from ..ocr import ocr_available, region_texts
+from ..ssim import diff_map, ssim
 
+# OCR runs only inside changed regions plus optional fixed zones (fractions of the page:
+# "x,y,w,h;x,y,w,h"), e.g. the name/grade fields of a known certificate layout. Without
+# zones a page SSIM already flagged is not read at all, since OCR could not change its verdict.
+OCR_ZONES = os.environ.get("ML_OCR_ZONES", "")
+OCR_MAX_REGIONS = int(os.environ.get("ML_OCR_MAX_REGIONS", "8"))
+OCR_REGION_PAD = 8
+SSIM_MIN = 0.92  # layout similarity below this (after masking photo regions) is tampered
 
-def _read_image(image_path: str) -> np.ndarray:
-    image = cv2.imdecode(np.fromfile(image_path, dtype=np.uint8), cv2.IMREAD_COLOR)
-    if image is None:
-        raise ValueError(f"Unable to read image: {image_path}")
-    return image
 
+def layout_min_seconds() -> float:
+    """Expected cost of the layout model with every deadline downgrade applied."""
+    shed = (
+        metrics.expected("layout.ocr")
+        + metrics.expected("layout.ssim") * (1 - deadline.DOWNGRADE_SCALE**2)
+        + face_seconds_saved()
+    )
+    return max(0.0, metrics.expected("model.layout") - shed)
 
-def _align_to_template(uploaded: np.ndarray, template: np.ndarray) -> Tuple[np.ndarray, Dict[str, Any]]:
-    gray_u = cv2.cvtColor(uploaded, cv2.COLOR_BGR2GRAY)
-    gray_t = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
 
-    # Fewer keypoints for speed
-    orb = cv2.ORB_create(2000)
-    keypoints_u, descriptors_u = orb.detectAndCompute(gray_u, None)
-    keypoints_t, descriptors_t = orb.detectAndCompute(gray_t, None)
-
-    if descriptors_u is None or descriptors_t is None:
-        return uploaded, {"aligned": False, "reason": "Insufficient features for alignment"}
-
-    matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
-    matches = matcher.match(descriptors_u, descriptors_t)
-    if len(matches) < 8:
-        return uploaded, {"aligned": False, "reason": "Not enough matches for homography"}
-
-    matches = sorted(matches, key=lambda m: m.distance)[:200]
-    pts_u = np.float32([keypoints_u[m.queryIdx].pt for m in matches]).reshape(-1, 1, 2)
-    pts_t = np.float32([keypoints_t[m.trainIdx].pt for m in matches]).reshape(-1, 1, 2)
-
-    H, mask = cv2.findHomography(pts_u, pts_t, cv2.RANSAC, 5.0)
-    if H is None:
-        return uploaded, {"aligned": False, "reason": "Homography estimation failed"}
-
-    height, width = template.shape[:2]
-    aligned = cv2.warpPerspective(uploaded, H, (width, height))
-    return aligned, {"aligned": True, "matches": int(len(matches))}
-
-
-def _detect_face_regions(image: np.ndarray) -> List[Tuple[int, int, int, int]]:
+def _detect_face_regions(page: PageImage) -> List[Tuple[int, int, int, int]]:
     try:
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        if cascade.empty():
-            return []
-        faces = cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(40, 40))
+        faces = face_boxes(page)
         out: List[Tuple[int, int, int, int]] = []
         for (x, y, w, h) in faces:
             # expand slightly to cover portrait frame
@@ -67,9 +44,9 @@ def _detect_face_regions(image: np.ndarray) -> List[Tuple[int, int, int, int]]:
         return []
 
 
-def _compute_ssim_and_diff(template: np.ndarray, aligned: np.ndarray, ignore_boxes: List[Tuple[int, int, int, int]] | None = None) -> Tuple[float, np.ndarray]:
-    gray_t = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
-    gray_a = cv2.cvtColor(aligned, cv2.COLOR_BGR2GRAY)
+def _compute_ssim_and_diff(template: PageImage, aligned: PageImage, ignore_boxes: List[Tuple[int, int, int, int]] | None = None, downscale: float = 1.0) -> Tuple[float, np.ndarray]:
+    gray_t = template.gray
+    gray_a = aligned.gray
 
     if gray_t.shape != gray_a.shape:
         gray_a = cv2.resize(gray_a, (gray_t.shape[1], gray_t.shape[0]))
@@ -85,9 +62,8 @@ def _compute_ssim_and_diff(template: np.ndarray, aligned: np.ndarray, ignore_box
         gray_a = gray_a.copy()
         gray_a[mask == 1] = gray_t[mask == 1]
 
-    score, diff = ssim(gray_t, gray_a, full=True)
-    diff = (1 - diff)  # invert: higher means more different
-    diff = (diff * 255).astype("uint8")
+    score, smap = ssim(gray_t, gray_a, full=True, downscale=downscale)
+    diff = diff_map(smap)  # invert: higher means more different
     return float(score), diff
 
 
@@ -106,21 +82,36 @@ def _locate_tampered_regions(diff: np.ndarray, min_area: int = 500) -> List[Tupl
     return boxes
 
 
-def _ocr_text(image: np.ndarray) -> str:
-    # Allow disabling OCR for speed via env var
-    if os.environ.get('ML_DISABLE_OCR', '').lower() in ('1', 'true', 'yes'):
-        return ""
-    if pytesseract is None:
-        return ""
-    try:
-        rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        text = pytesseract.image_to_string(rgb)
-        return text.strip()
-    except Exception:
-        return ""
+def _ocr_zones(shape: Tuple[int, ...]) -> List[Tuple[int, int, int, int]]:
+    h, w = shape[:2]
+    zones: List[Tuple[int, int, int, int]] = []
+    for spec in OCR_ZONES.split(";"):
+        try:
+            fx, fy, fw, fh = (float(v) for v in spec.split(","))
+        except ValueError:
+            continue
+        zones.append((int(fx * w), int(fy * h), int(fw * w), int(fh * h)))
+    return zones
+
+
+def _ocr_boxes(shape: Tuple[int, ...], changed: List[Tuple[int, int, int, int]]) -> List[Tuple[int, int, int, int]]:
+    """Configured zones plus the largest changed regions (padded, clipped to the page)."""
+    h, w = shape[:2]
+    boxes = _ocr_zones(shape)
+    for (x, y, bw, bh) in sorted(changed, key=lambda b: b[2] * b[3], reverse=True):
+        if len(boxes) >= OCR_MAX_REGIONS:
+            break
+        x0, y0 = max(0, x - OCR_REGION_PAD), max(0, y - OCR_REGION_PAD)
+        x1, y1 = min(w, x + bw + OCR_REGION_PAD), min(h, y + bh + OCR_REGION_PAD)
+        boxes.append((x0, y0, x1 - x0, y1 - y0))
+    return boxes
 
 
 def verify_layout(original_path: str, uploaded_path: str) -> Dict[str, Any]:
+    return verify_layout_pair(DocumentPair.from_paths(original_path, uploaded_path))
+
+
+def verify_layout_pair(pair: DocumentPair) -> Dict[str, Any]:
     """
     Cross-check uploaded certificate layout against the original template.
 
@@ -131,6 +122,7 @@ def verify_layout(original_path: str, uploaded_path: str) -> Dict[str, Any]:
     - aligned: bool
     - tampered_regions: list of [x, y, w, h]
     - ocr_text_similarity: float (0-1) when available
+    - ocr_regions: number of regions OCR'd on each side
     """
     result: Dict[str, Any] = {
         "model": "layout",
@@ -140,14 +132,14 @@ def verify_layout(original_path: str, uploaded_path: str) -> Dict[str, Any]:
         "aligned": 0,
         "tampered_regions": [],
         "ocr_text_similarity": None,
+        "ocr_regions": 0,
     }
 
     try:
-        template = _read_image(original_path)
-        uploaded = _read_image(uploaded_path)
-
-        aligned, align_info = _align_to_template(uploaded, template)
-        result["aligned"] = 1 if align_info.get("aligned") else 0
+        template = pair.original
+        alignment = pair.alignment
+        aligned = alignment.page
+        result["aligned"] = 1 if alignment.aligned else 0
 
         # Build ignore regions from detected face/photo areas in both images (to avoid penalizing portrait changes)
         ignore_regions: List[Tuple[int, int, int, int]] = []
@@ -158,7 +150,13 @@ def verify_layout(original_path: str, uploaded_path: str) -> Dict[str, Any]:
         except Exception:
             ignore_regions = []
 
-        ssim_score, diff = _compute_ssim_and_diff(template, aligned, ignore_regions)
+        # Short of time: SSIM at reduced resolution; the map is upsampled, so regions keep page coordinates
+        if deadline.allows(metrics.expected("layout.ssim") + metrics.expected("layout.ocr")):
+            with metrics.stage("layout.ssim"):
+                ssim_score, diff = _compute_ssim_and_diff(template, aligned, ignore_regions)
+        else:
+            deadline.downgrade(f"layout.ssim@{deadline.DOWNGRADE_SCALE}")
+            ssim_score, diff = _compute_ssim_and_diff(template, aligned, ignore_regions, deadline.DOWNGRADE_SCALE)
         result["ssim_score"] = float(ssim_score)
         boxes = _locate_tampered_regions(diff)
         # Filter out tampered boxes that lie mostly within ignore regions
@@ -178,9 +176,21 @@ def verify_layout(original_path: str, uploaded_path: str) -> Dict[str, Any]:
             boxes = [b for b in boxes if not intersects_ignored(b)]
         result["tampered_regions"] = [list(b) for b in boxes]
 
-        # Optional OCR text consistency check
-        text_t = _ocr_text(template)
-        text_a = _ocr_text(aligned)
+        # Optional OCR text consistency check, restricted to changed regions and configured
+        # zones. Both pages share the template's frame, so the same boxes apply to each, and
+        # both are read whole with word boxes (the template's read is cached by digest)
+        flagged = not alignment.aligned or ssim_score < SSIM_MIN or bool(boxes)
+        text_t = text_a = ""
+        if not ocr_available() or (flagged and not OCR_ZONES):
+            pass  # nothing OCR could find would change the verdict
+        elif not deadline.allows(metrics.expected("layout.ocr")):
+            deadline.skip("layout.ocr")
+        else:
+            with metrics.stage("layout.ocr"):
+                ocr_boxes = _ocr_boxes(template.shape, boxes)
+                result["ocr_regions"] = len(ocr_boxes)
+                text_t = "\n".join(region_texts(template, ocr_boxes)).strip()
+                text_a = "\n".join(region_texts(aligned, ocr_boxes, cache=False)).strip()
         text_sim = None
         if text_t and text_a:
             try:
@@ -195,11 +205,11 @@ def verify_layout(original_path: str, uploaded_path: str) -> Dict[str, Any]:
         tampered = False
         tamper_reasons = []
 
-        if not align_info.get("aligned"):
+        if not alignment.aligned:
             tampered = True
             tamper_reasons.append("Layout could not be aligned to template")
 
-        if ssim_score < 0.92:  # strict threshold for layout similarity (after masking photo regions)
+        if ssim_score < SSIM_MIN:  # strict threshold for layout similarity (after masking photo regions)
             tampered = True
             tamper_reasons.append(f"Low SSIM score: {ssim_score:.3f}")
 
@@ -221,6 +231,7 @@ def verify_layout(original_path: str, uploaded_path: str) -> Dict[str, Any]:
     except Exception as e:  # graceful error handling
         result["status"] = "tampered"
         result["message"] = f"Layout verification error: {str(e)}"
+        result["error"] = True
 
     return result
 
@@ -229,6 +240,6 @@ if __name__ == "__main__":  # manual test
     import sys
 
     if len(sys.argv) != 3:
-        print("Usage: python layout_model.py <original> <uploaded>")
+        print("Usage: python -m backend.models.layout_model <original> <uploaded>")
         sys.exit(1)
     print(json.dumps(verify_layout(sys.argv[1], sys.argv[2]), indent=2))
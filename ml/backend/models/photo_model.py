@@ -4,24 +4,18 @@ from typing import Dict, Any, List, Tuple
 import cv2
 import numpy as np
 
+from .. import matching, metrics, registry
+from ..context import DocumentPair
+from ..features import detect_faces, face_boxes, face_seconds_saved
+from ..ssim import ssim
 
-def _read_image(image_path: str) -> np.ndarray:
-    image = cv2.imdecode(np.fromfile(image_path, dtype=np.uint8), cv2.IMREAD_COLOR)
-    if image is None:
-        raise ValueError(f"Unable to read image: {image_path}")
-    return image
 
+def photo_min_seconds() -> float:
+    """Expected cost of the photo model with face detection downgraded for a deadline."""
+    return max(0.0, metrics.expected("model.photo") - face_seconds_saved())
 
-def _detect_faces_haar(image: np.ndarray) -> List[Tuple[int, int, int, int]]:
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-    if cascade.empty():
-        return []
-    faces = cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(40, 40))
-    return [(int(x), int(y), int(w), int(h)) for (x, y, w, h) in faces]
 
-
-def _largest_face_roi(image: np.ndarray, faces: List[Tuple[int, int, int, int]]) -> np.ndarray:
+def _largest_face_box(shape: Tuple[int, ...], faces: List[Tuple[int, int, int, int]]) -> Tuple[int, int, int, int] | None:
     if not faces:
         return None
     x, y, w, h = max(faces, key=lambda b: b[2] * b[3])
@@ -29,36 +23,37 @@ def _largest_face_roi(image: np.ndarray, faces: List[Tuple[int, int, int, int]])
     pad = max(8, int(max(w, h) * 0.3))
     x0 = max(0, x - pad)
     y0 = max(0, y - pad)
-    x1 = min(image.shape[1], x + w + pad)
-    y1 = min(image.shape[0], y + h + pad)
+    x1 = min(shape[1], x + w + pad)
+    y1 = min(shape[0], y + h + pad)
+    return x0, y0, x1, y1
+
+
+def _largest_face_roi(image: np.ndarray, faces: List[Tuple[int, int, int, int]]) -> np.ndarray:
+    box = _largest_face_box(image.shape, faces)
+    if box is None:
+        return None
+    x0, y0, x1, y1 = box
     return image[y0:y1, x0:x1]
 
 
-def _orb_match_similarity(a: np.ndarray, b: np.ndarray) -> float:
+def _orb_match_similarity(gray_a: np.ndarray, gray_b: np.ndarray) -> Tuple[float, Dict[str, Any] | None]:
+    """Share of good (distance < 50) matches, plus the matcher report."""
     try:
-        gray_a = cv2.cvtColor(a, cv2.COLOR_BGR2GRAY)
-        gray_b = cv2.cvtColor(b, cv2.COLOR_BGR2GRAY)
-        orb = cv2.ORB_create(1000)
+        orb = registry.orb(1000)
         kps1, des1 = orb.detectAndCompute(gray_a, None)
         kps2, des2 = orb.detectAndCompute(gray_b, None)
         if des1 is None or des2 is None:
-            return 0.0
-        bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
-        matches = bf.match(des1, des2)
-        if not matches:
-            return 0.0
-        matches = sorted(matches, key=lambda m: m.distance)
-        good = [m for m in matches if m.distance < 50]
-        return float(len(good)) / float(len(matches))
+            return 0.0, None
+        matches = matching.match(des1, des2)
+        if len(matches) == 0:
+            return 0.0, matches.info(max_distance=50)
+        return float(matches.count_below(50)) / float(len(matches)), matches.info(max_distance=50)
     except Exception:
-        return 0.0
+        return 0.0, None
 
 
-def _ssim_similarity(a: np.ndarray, b: np.ndarray) -> float:
+def _ssim_similarity(gray_a: np.ndarray, gray_b: np.ndarray) -> float:
     try:
-        from skimage.metrics import structural_similarity as ssim
-        gray_a = cv2.cvtColor(a, cv2.COLOR_BGR2GRAY)
-        gray_b = cv2.cvtColor(b, cv2.COLOR_BGR2GRAY)
         if gray_a.shape != gray_b.shape:
             gray_b = cv2.resize(gray_b, (gray_a.shape[1], gray_a.shape[0]))
         score = ssim(gray_a, gray_b)
@@ -67,10 +62,8 @@ def _ssim_similarity(a: np.ndarray, b: np.ndarray) -> float:
         return 0.0
 
 
-def _edge_change_ratio(a: np.ndarray, b: np.ndarray) -> float:
+def _edge_change_ratio(g1: np.ndarray, g2: np.ndarray) -> float:
     try:
-        g1 = cv2.cvtColor(a, cv2.COLOR_BGR2GRAY)
-        g2 = cv2.cvtColor(b, cv2.COLOR_BGR2GRAY)
         if g1.shape != g2.shape:
             g2 = cv2.resize(g2, (g1.shape[1], g1.shape[0]))
         e1 = cv2.Canny(g1, 50, 150)
@@ -83,10 +76,16 @@ def _edge_change_ratio(a: np.ndarray, b: np.ndarray) -> float:
 
 
 def verify_photo(original_path: str, uploaded_path: str) -> Dict[str, Any]:
+    return verify_photo_pair(DocumentPair.from_paths(original_path, uploaded_path))
+
+
+def verify_photo_pair(pair: DocumentPair) -> Dict[str, Any]:
     """
     Cross-check photos between original and uploaded certificate using OpenCV only.
     - Detect if face-like region exists; require presence parity.
     - If both present, compare ORB descriptors in the detected face regions.
+    - When the upload is aligned, the portrait is looked up in template coordinates
+      (same box as the original) instead of being re-detected across the raw upload.
     """
     result: Dict[str, Any] = {
         "model": "photo",
@@ -102,11 +101,17 @@ def verify_photo(original_path: str, uploaded_path: str) -> Dict[str, Any]:
     }
 
     try:
-        original = _read_image(original_path)
-        uploaded = _read_image(uploaded_path)
-
-        orig_boxes = _detect_faces_haar(original)
-        up_boxes = _detect_faces_haar(uploaded)
+        orig_boxes = face_boxes(pair.original)
+        alignment = pair.alignment
+        # all three comparison signals work on grayscale, so crop straight from the cached gray views
+        o_roi = _largest_face_roi(pair.original.gray, orig_boxes)
+        u_roi = None
+        if alignment.aligned and orig_boxes:
+            x0, y0, x1, y1 = _largest_face_box(pair.original.gray.shape, orig_boxes)
+            u_roi = alignment.page.gray[y0:y1, x0:x1]
+            up_boxes = detect_faces(u_roi)
+        else:
+            up_boxes = face_boxes(alignment.page)
         result["photo_present_in_original"] = 1 if len(orig_boxes) > 0 else 0
         result["photo_present_in_uploaded"] = 1 if len(up_boxes) > 0 else 0
         result["num_photos_in_uploaded"] = int(len(up_boxes))
@@ -126,14 +131,16 @@ def verify_photo(original_path: str, uploaded_path: str) -> Dict[str, Any]:
             return result
 
         # Compare largest faces using multiple signals focused on the portrait region
-        o_roi = _largest_face_roi(original, orig_boxes)
-        u_roi = _largest_face_roi(uploaded, up_boxes)
+        if u_roi is None:
+            u_roi = _largest_face_roi(alignment.page.gray, up_boxes)
         if o_roi is None or u_roi is None:
             result["status"] = "tampered"
             result["message"] = "Unable to crop face regions for comparison"
             return result
 
-        sim = _orb_match_similarity(o_roi, u_roi)
+        sim, match_info = _orb_match_similarity(o_roi, u_roi)
+        if match_info is not None:
+            result["matching"] = match_info
         ssim_val = _ssim_similarity(o_roi, u_roi)
         edge_diff = _edge_change_ratio(o_roi, u_roi)
         result["similarity"] = float(sim)
@@ -160,6 +167,7 @@ def verify_photo(original_path: str, uploaded_path: str) -> Dict[str, Any]:
     except Exception as e:
         result["status"] = "tampered"
         result["message"] = f"Photo verification error: {str(e)}"
+        result["error"] = True
 
     return result
 
@@ -167,6 +175,6 @@ def verify_photo(original_path: str, uploaded_path: str) -> Dict[str, Any]:
 if __name__ == "__main__":
     import sys
     if len(sys.argv) != 3:
-        print("Usage: python photo_model.py <original> <uploaded>")
+        print("Usage: python -m backend.models.photo_model <original> <uploaded>")
         raise SystemExit(1)
     print(json.dumps(verify_photo(sys.argv[1], sys.argv[2]), indent=2))
@@ -1,43 +1,25 @@
 import json
+import os
 from typing import Dict, Any, Tuple, List
 
 import cv2
 import numpy as np
 
+from .. import matching, metrics, registry
+from ..context import DocumentPair, PageImage
 
-def _read_image(image_path: str) -> np.ndarray:
-    image = cv2.imdecode(np.fromfile(image_path, dtype=np.uint8), cv2.IMREAD_COLOR)
-    if image is None:
-        raise ValueError(f"Unable to read image: {image_path}")
-    return image
-
-
-def _align_to_template(uploaded: np.ndarray, template: np.ndarray) -> Tuple[np.ndarray, Dict[str, Any]]:
-    gray_u = cv2.cvtColor(uploaded, cv2.COLOR_BGR2GRAY)
-    gray_t = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
-    orb = cv2.ORB_create(2000)
-    keypoints_u, descriptors_u = orb.detectAndCompute(gray_u, None)
-    keypoints_t, descriptors_t = orb.detectAndCompute(gray_t, None)
-    if descriptors_u is None or descriptors_t is None:
-        return uploaded, {"aligned": False, "reason": "Insufficient features for alignment"}
-    matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
-    matches = matcher.match(descriptors_u, descriptors_t)
-    if len(matches) < 8:
-        return uploaded, {"aligned": False, "reason": "Not enough matches for homography"}
-    matches = sorted(matches, key=lambda m: m.distance)[:200]
-    pts_u = np.float32([keypoints_u[m.queryIdx].pt for m in matches]).reshape(-1, 1, 2)
-    pts_t = np.float32([keypoints_t[m.trainIdx].pt for m in matches]).reshape(-1, 1, 2)
-    H, mask = cv2.findHomography(pts_u, pts_t, cv2.RANSAC, 5.0)
-    if H is None:
-        return uploaded, {"aligned": False, "reason": "Homography estimation failed"}
-    height, width = template.shape[:2]
-    aligned = cv2.warpPerspective(uploaded, H, (width, height))
-    return aligned, {"aligned": True, "matches": int(len(matches))}
-
-
-def _detect_circular_regions(image: np.ndarray) -> np.ndarray:
+
+# Seal search: Hough runs on crops around connected components of the seal-colour mask,
+# downscaled so their long side is at most SEAL_CROP_PX; only pages without colour
+# proposals get the full-page search
+SEAL_CROP_PX = int(os.environ.get("ML_SEAL_CROP_PX", "320"))
+SEAL_MAX_PROPOSALS = int(os.environ.get("ML_SEAL_MAX_PROPOSALS", "8"))
+PROPOSAL_PX = 1000  # long side of the mask used to find colour blobs
+MIN_RADIUS, MAX_RADIUS, MIN_DIST = 10, 400, 40
+
+
+def _seal_color_mask(hsv: np.ndarray) -> np.ndarray:
     # Prefer likely seal colors (red/blue hues) to boost detection
-    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
     # red ranges
     lower_red1 = np.array([0, 60, 60]); upper_red1 = np.array([10, 255, 255])
     lower_red2 = np.array([160, 60, 60]); upper_red2 = np.array([179, 255, 255])
@@ -45,28 +27,101 @@ def _detect_circular_regions(image: np.ndarray) -> np.ndarray:
     # blue range
     lower_blue = np.array([90, 60, 60]); upper_blue = np.array([130, 255, 255])
     mask_blue = cv2.inRange(hsv, lower_blue, upper_blue)
-    mask = cv2.bitwise_or(mask_red, mask_blue)
-    if np.count_nonzero(mask) < 500:  # fallback to grayscale if color weak
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = cv2.GaussianBlur(mask, (9, 9), 2)
+    return cv2.bitwise_or(mask_red, mask_blue)
+
+
+def _hough(gray: np.ndarray, min_dist: float, min_radius: int, max_radius: int) -> np.ndarray:
+    """(cx, cy, r, votes) rows, strongest first."""
     gray = cv2.medianBlur(gray, 5)
-    circles = cv2.HoughCircles(
-        gray, cv2.HOUGH_GRADIENT, dp=1.2, minDist=40, param1=100, param2=25, minRadius=10, maxRadius=400
+    circles = cv2.HoughCirclesWithAccumulator(
+        gray, cv2.HOUGH_GRADIENT, dp=1.2, minDist=min_dist, param1=100, param2=25,
+        minRadius=min_radius, maxRadius=max_radius,
     )
     if circles is None:
-        return np.empty((0, 3))
-    return np.round(circles[0, :]).astype("int")
-
-
+        return np.empty((0, 4), np.float32)
+    return circles[0]
+
+
+def _color_proposals(mask: np.ndarray) -> List[Tuple[int, int, int, int]]:
+    """Boxes (x, y, w, h) of seal-sized colour blobs, largest first, nested blobs dropped."""
+    # Blobs are found on a reduced mask (any colour in a cell keeps it set)
+    p = min(1.0, PROPOSAL_PX / float(max(mask.shape)))
+    small = cv2.resize(mask, None, fx=p, fy=p, interpolation=cv2.INTER_AREA) if p < 1.0 else mask
+    small = (small > 0).astype(np.uint8)
+    # Close small gaps so a ring drawn in broken strokes becomes one component
+    closed = cv2.morphologyEx(small, cv2.MORPH_CLOSE, np.ones((5, 5), np.uint8))
+    n, _, stats, _ = cv2.connectedComponentsWithStats(closed, connectivity=8)
+    boxes: List[Tuple[int, int, int, int]] = []
+    for i in np.argsort(-stats[1:, cv2.CC_STAT_AREA], kind="stable") + 1:
+        sx, sy, sw, sh, area = (int(v) for v in stats[i])
+        x, y = int(sx / p), int(sy / p)
+        w, h = int(np.ceil((sx + sw) / p)) - x, int(np.ceil((sy + sh) / p)) - y
+        if min(w, h) < 2 * MIN_RADIUS or max(w, h) > 2 * MAX_RADIUS * 1.25 or area < 100 * p * p:
+            continue
+        if any(x >= bx and y >= by and x + w <= bx + bw and y + h <= by + bh for bx, by, bw, bh in boxes):
+            continue  # e.g. the text or inner ring of a seal already proposed
+        boxes.append((x, y, w, h))
+        if len(boxes) >= SEAL_MAX_PROPOSALS:
+            break
+    return boxes
+
+
+def _search_proposal(mask: np.ndarray, box: Tuple[int, int, int, int]) -> np.ndarray:
+    """Hough circles in full-page coordinates for one proposal, at reduced resolution."""
+    x, y, w, h = box
+    margin = max(10, int(0.2 * max(w, h)))
+    x0, y0 = max(0, x - margin), max(0, y - margin)
+    x1, y1 = min(mask.shape[1], x + w + margin), min(mask.shape[0], y + h + margin)
+    crop = mask[y0:y1, x0:x1]
+    s = min(1.0, SEAL_CROP_PX / float(max(crop.shape)))
+    if s < 1.0:
+        crop = cv2.resize(crop, None, fx=s, fy=s, interpolation=cv2.INTER_AREA)
+    crop = cv2.GaussianBlur(crop, (9, 9), 2)
+    max_radius = min(MAX_RADIUS, int(0.6 * max(w, h)) + 1)
+    circles = _hough(crop, MIN_DIST * s, max(3, int(round(MIN_RADIUS * s))), max(4, int(round(max_radius * s))))
+    # Votes grow with the circumference in pixels, so rescale them to be comparable
+    # with full-resolution votes from other proposals
+    circles = circles / s
+    circles[:, 0] += x0
+    circles[:, 1] += y0
+    return circles
+
+
+@metrics.stage("hough")
+def _detect_circular_regions(page: PageImage) -> np.ndarray:
+    """Candidate seal circles as (cx, cy, r) rows in page coordinates, most likely first."""
+    mask = _seal_color_mask(page.hsv)
+    if np.count_nonzero(mask) < 500:  # fallback to grayscale if color weak
+        circles = _hough(page.gray, MIN_DIST, MIN_RADIUS, MAX_RADIUS)
+    else:
+        proposals = _color_proposals(mask)
+        if not proposals:
+            circles = _hough(cv2.GaussianBlur(mask, (9, 9), 2), MIN_DIST, MIN_RADIUS, MAX_RADIUS)
+        else:
+            # Rank every candidate by votes, as a single full-page search would, and keep
+            # the full-page minDist between circles found in different proposals
+            found = np.concatenate([_search_proposal(mask, box) for box in proposals])
+            kept: List[np.ndarray] = []
+            for c in found[np.argsort(-found[:, 3], kind="stable")]:
+                if all(np.hypot(c[0] - k[0], c[1] - k[1]) >= MIN_DIST for k in kept):
+                    kept.append(c)
+            circles = np.array(kept, np.float32).reshape(-1, 4)
+    return np.round(circles[:, :3]).astype("int")
+
+
+@metrics.stage("orb")
 def _compute_orb_descriptor(image: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
     gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    orb = cv2.ORB_create(1500)
+    orb = registry.orb(1500)
     kps, des = orb.detectAndCompute(gray, None)
     return kps, des
 
 
 def verify_seal(original_path: str, uploaded_path: str) -> Dict[str, Any]:
+    return verify_seal_pair(DocumentPair.from_paths(original_path, uploaded_path))
+
+
+def verify_seal_pair(pair: DocumentPair) -> Dict[str, Any]:
     """
     Detect seals/stamps by circularity and compare descriptors with original.
     """
@@ -80,14 +135,14 @@ def verify_seal(original_path: str, uploaded_path: str) -> Dict[str, Any]:
     }
 
     try:
-        original = _read_image(original_path)
-        uploaded = _read_image(uploaded_path)
-        # align uploaded to template coordinates for stable ROI comparison
-        aligned, align_info = _align_to_template(uploaded, original)
+        original = pair.original.image
+        # compare in template coordinates (shared alignment stage) for stable ROI comparison
+        aligned_page = pair.alignment.page
+        aligned = aligned_page.image
 
         # Try to find likely seal regions (circular)
-        orig_circles = _detect_circular_regions(original)
-        up_circles = _detect_circular_regions(aligned)
+        orig_circles = pair.original.memo("seal_circles", lambda: _detect_circular_regions(pair.original))
+        up_circles = _detect_circular_regions(aligned_page)
         result["seal_present_in_original"] = 1 if len(orig_circles) > 0 else 0
         result["seal_present_in_uploaded"] = 1 if len(up_circles) > 0 else 0
 
@@ -105,36 +160,30 @@ def verify_seal(original_path: str, uploaded_path: str) -> Dict[str, Any]:
             result["message"] = "Missing seal in uploaded certificate"
             return result
 
-        # If we found a circle in the template, crop around it and compare same region on aligned image
-        if len(orig_circles) > 0:
-            (cx, cy, r) = orig_circles[0]
-            pad = int(r * 0.25)
-            x0 = max(0, cx - r - pad); y0 = max(0, cy - r - pad)
-            x1 = min(original.shape[1], cx + r + pad); y1 = min(original.shape[0], cy + r + pad)
-            roi_o = original[y0:y1, x0:x1]
-            roi_u = aligned[y0:y1, x0:x1]
-        else:
-            roi_o = original
-            roi_u = aligned
+        # Crop around the template's circle and compare the same region on the aligned image
+        (cx, cy, r) = orig_circles[0]
+        pad = int(r * 0.25)
+        x0 = max(0, cx - r - pad); y0 = max(0, cy - r - pad)
+        x1 = min(original.shape[1], cx + r + pad); y1 = min(original.shape[0], cy + r + pad)
+        roi_o = original[y0:y1, x0:x1]
+        roi_u = aligned[y0:y1, x0:x1]
 
         # Descriptor comparison within ROI
-        orig_kps, orig_des = _compute_orb_descriptor(roi_o)
+        orig_des = pair.original.memo(f"seal_orb:{x0},{y0},{x1},{y1}", lambda: _compute_orb_descriptor(roi_o)[1])
         up_kps, up_des = _compute_orb_descriptor(roi_u)
         if orig_des is None or up_des is None:
             result["status"] = "tampered"
             result["message"] = "Unable to compute descriptors for seal comparison"
             return result
 
-        bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
-        matches = bf.match(orig_des, up_des)
+        matches = matching.match(orig_des, up_des)
+        result["matching"] = matches.info(max_distance=45)
         if len(matches) == 0:
             result["status"] = "tampered"
             result["message"] = "No descriptor matches for seal"
             return result
 
-        matches = sorted(matches, key=lambda m: m.distance)
-        good = [m for m in matches if m.distance < 45]
-        is_match = len(good) >= max(10, int(0.04 * len(matches)))
+        is_match = result["matching"]["good"] >= max(10, int(0.04 * len(matches)))
 
         result["matched"] = 1 if is_match else 0
         if is_match:
@@ -147,6 +196,7 @@ def verify_seal(original_path: str, uploaded_path: str) -> Dict[str, Any]:
     except Exception as e:
         result["status"] = "tampered"
         result["message"] = f"Seal verification error: {str(e)}"
+        result["error"] = True
 
     return result
 
@@ -154,7 +204,7 @@ def verify_seal(original_path: str, uploaded_path: str) -> Dict[str, Any]:
 if __name__ == "__main__":
     import sys
     if len(sys.argv) != 3:
-        print("Usage: python seal_model.py <original> <uploaded>")
+        print("Usage: python -m backend.models.seal_model <original> <uploaded>")
         raise SystemExit(1)
     print(json.dumps(verify_seal(sys.argv[1], sys.argv[2]), indent=2))
 
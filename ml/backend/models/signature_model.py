@@ -4,25 +4,26 @@ from typing import Dict, Any, Tuple
 
 import cv2
 import numpy as np
-from skimage.metrics import structural_similarity as ssim
+from .. import metrics
+from ..context import DocumentPair, PageImage
+from ..ssim import diff_map, ssim
 
+# Local refinement window around the template signature box, as a fraction of page width
+# (about 25 px at 150 DPI); unaligned uploads get a wider window
+SIG_SEARCH_FRAC = float(os.environ.get("ML_SIG_SEARCH_FRAC", "0.02"))
+UNALIGNED_SEARCH_SCALE = 4
+MIN_MATCH_SCORE = 0.5  # weaker correlation peaks (e.g. blank windows) keep the mapped box
 
-def _read_image(image_path: str) -> np.ndarray:
-    image = cv2.imdecode(np.fromfile(image_path, dtype=np.uint8), cv2.IMREAD_COLOR)
-    if image is None:
-        raise ValueError(f"Unable to read image: {image_path}")
-    return image
 
-
-def _extract_signature_region(image: np.ndarray) -> np.ndarray:
+def _signature_box(page: PageImage) -> Tuple[int, int, int, int] | None:
+    """Bounding box (x0, y0, x1, y1) of the likely signature, or None if nothing found."""
     # Heuristic: use edge map and bottom area bias, assuming signature near bottom
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    edges = cv2.Canny(gray, 50, 150)
+    edges = page.edges
     h, w = edges.shape
     bottom = edges[int(h * 0.5) : h, 0:w]
     contours, _ = cv2.findContours(bottom, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     if not contours:
-        return image
+        return None
     largest = max(contours, key=cv2.contourArea)
     x, y, cw, ch = cv2.boundingRect(largest)
     y = y + int(h * 0.5)
@@ -30,9 +31,39 @@ def _extract_signature_region(image: np.ndarray) -> np.ndarray:
     y0 = max(0, y - 10)
     x1 = min(w, x + cw + 10)
     y1 = min(h, y + ch + 10)
+    return x0, y0, x1, y1
+
+
+def _crop(image: np.ndarray, box: Tuple[int, int, int, int] | None) -> np.ndarray:
+    if box is None:
+        return image
+    x0, y0, x1, y1 = box
     return image[y0:y1, x0:x1]
 
 
+@metrics.stage("signature_roi")
+def _refine_in_window(
+    image: np.ndarray, template_gray: np.ndarray, box: Tuple[int, int, int, int], margin: int
+) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """
+    Crop `box` from `image`, shifted by at most `margin` px to where the template
+    signature matches best (normalized cross-correlation). Returns (crop, (dx, dy)).
+    """
+    x0, y0, x1, y1 = box
+    h, w = image.shape[:2]
+    wx0, wy0 = max(0, x0 - margin), max(0, y0 - margin)
+    wx1, wy1 = min(w, x1 + margin), min(h, y1 + margin)
+    window = cv2.cvtColor(image[wy0:wy1, wx0:wx1], cv2.COLOR_BGR2GRAY)
+    dx = dy = 0
+    if window.shape[0] >= template_gray.shape[0] and window.shape[1] >= template_gray.shape[1]:
+        scores = cv2.matchTemplate(window, template_gray, cv2.TM_CCOEFF_NORMED)
+        _, best, _, (bx, by) = cv2.minMaxLoc(scores)
+        if np.isfinite(best) and best >= MIN_MATCH_SCORE:
+            dx, dy = wx0 + bx - x0, wy0 + by - y0
+    sx0, sy0 = min(max(0, x0 + dx), w - 1), min(max(0, y0 + dy), h - 1)
+    return image[sy0 : sy0 + (y1 - y0), sx0 : sx0 + (x1 - x0)], (int(dx), int(dy))
+
+
 def _resize_to_match(a: np.ndarray, b: np.ndarray) -> np.ndarray:
     """Resize image b to the width/height of a."""
     if a.shape[:2] == b.shape[:2]:
@@ -46,13 +77,16 @@ def _ssim_diff(a_bgr: np.ndarray, b_bgr: np.ndarray) -> Tuple[float, np.ndarray]
     b_gray = cv2.cvtColor(b_bgr, cv2.COLOR_BGR2GRAY)
     if a_gray.shape != b_gray.shape:
         b_gray = cv2.resize(b_gray, (a_gray.shape[1], a_gray.shape[0]))
-    score, diff = ssim(a_gray, b_gray, full=True)
-    # skimage returns similarity map in [0,1]; convert so 255 = different
-    diff_inv = (1.0 - diff) * 255.0
-    return float(score), diff_inv.astype("uint8")
+    score, smap = ssim(a_gray, b_gray, full=True)
+    # similarity map is in [0,1] (can dip below 0); convert so 255 = different
+    return float(score), diff_map(smap)
 
 
 def verify_signature(original_path: str, uploaded_path: str) -> Dict[str, Any]:
+    return verify_signature_pair(DocumentPair.from_paths(original_path, uploaded_path))
+
+
+def verify_signature_pair(pair: DocumentPair) -> Dict[str, Any]:
     """
     Compare signature regions using SSIM difference and contour-based tamper map.
 
@@ -74,12 +108,26 @@ def verify_signature(original_path: str, uploaded_path: str) -> Dict[str, Any]:
     }
 
     try:
-        original = _read_image(original_path)
-        uploaded = _read_image(uploaded_path)
-
-        # Focus on likely signature area from both images
-        orig_sig = _extract_signature_region(original)
-        up_sig_raw = _extract_signature_region(uploaded)
+        # Focus on likely signature area: found once on the template (and cached with it). The
+        # upload is never searched: the template box is mapped through the alignment homography
+        # (the aligned page is already in template coordinates) and refined within a small window.
+        orig_box = pair.original.memo("signature_box", lambda: _signature_box(pair.original))
+        orig_sig = _crop(pair.original.image, orig_box)
+        if orig_box is None:
+            up_sig_raw = pair.uploaded.image
+        else:
+            orig_gray = pair.original.memo(f"signature_gray:{orig_box}", lambda: cv2.cvtColor(orig_sig, cv2.COLOR_BGR2GRAY))
+            alignment = pair.alignment
+            margin = max(2, int(SIG_SEARCH_FRAC * pair.original.shape[1]))
+            if alignment.aligned:
+                up_sig_raw, shift = _refine_in_window(alignment.page.image, orig_gray, orig_box, margin)
+            else:
+                # No homography: map the box by page size and search a wider window
+                up_page = pair.uploaded.image
+                if up_page.shape[:2] != pair.original.shape[:2]:
+                    up_page = cv2.resize(up_page, (pair.original.shape[1], pair.original.shape[0]))
+                up_sig_raw, shift = _refine_in_window(up_page, orig_gray, orig_box, margin * UNALIGNED_SEARCH_SCALE)
+            result["roi_shift"] = list(shift)
         up_sig = _resize_to_match(orig_sig, up_sig_raw)
 
         # Presence: simple ink density heuristic
@@ -110,11 +158,11 @@ def verify_signature(original_path: str, uploaded_path: str) -> Dict[str, Any]:
             return result
 
         # SSIM-based difference map
-        score, diff_map = _ssim_diff(orig_sig, up_sig)
+        score, diff = _ssim_diff(orig_sig, up_sig)
         result["ssim"] = float(score)
 
         # Threshold differences: high value -> more different; keep only significant diffs
-        _, thresh = cv2.threshold(diff_map, 200, 255, cv2.THRESH_BINARY)
+        _, thresh = cv2.threshold(diff, 200, 255, cv2.THRESH_BINARY)
         # Clean up small noise
         kernel = np.ones((3, 3), np.uint8)
         thresh = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel, iterations=1)
@@ -162,6 +210,7 @@ def verify_signature(original_path: str, uploaded_path: str) -> Dict[str, Any]:
     except Exception as e:
         result["status"] = "tampered"
         result["message"] = f"Signature verification error: {str(e)}"
+        result["error"] = True
 
     return result
 
@@ -169,6 +218,6 @@ def verify_signature(original_path: str, uploaded_path: str) -> Dict[str, Any]:
 if __name__ == "__main__":
     import sys
     if len(sys.argv) != 3:
-        print("Usage: python signature_model.py <original> <uploaded>")
+        print("Usage: python -m backend.models.signature_model <original> <uploaded>")
         raise SystemExit(1)
     print(json.dumps(verify_signature(sys.argv[1], sys.argv[2]), indent=2))
@@ -0,0 +1,118 @@
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List
+
+from . import deadline, metrics
+from .context import DocumentPair, PageImage
+from .main import verify_pair
+
+PAGE_WORKERS = max(1, int(os.environ.get("ML_PAGE_WORKERS", "2")))
+
+_page_pool: ThreadPoolExecutor | None = None
+_page_pool_lock = threading.Lock()
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is None:
+            _page_pool = ThreadPoolExecutor(max_workers=PAGE_WORKERS, thread_name_prefix="ml-page")
+        return _page_pool
+
+
+def _page_only_result(index: int, status: str, message: str, error: bool = False) -> Dict[str, Any]:
+    result = {"page": index, "overall_status": status, "message": message}
+    if error:
+        result["error"] = True
+    return result
+
+
+def verify_pages(
+    original_count: int,
+    uploaded_count: int,
+    original_page: Callable[[int], PageImage],
+    uploaded_page: Callable[[int], PageImage],
+    full_report: bool = False,
+) -> Dict[str, Any]:
+    """
+    Verify every page of a multi-page document pair, pairing pages by index.
+
+    Pages are obtained through the `original_page`/`uploaded_page` callables only
+    when their verification starts, and run in parallel on a page pool
+    (ML_PAGE_WORKERS). Unless `full_report` is set, verification stops as soon as a
+    page is conclusively tampered (or the page counts differ); pages that never ran
+    are reported as "skipped". Pages the request's deadline leaves no time for are
+    "inconclusive", and so is the document if no page was found tampered.
+    """
+    results: Dict[str, Any] = {
+        "overall_status": "tampered",
+        "page_count": {"original": int(original_count), "uploaded": int(uploaded_count)},
+        "pages": [],
+        "short_circuited": False,
+    }
+    pages: List[Dict[str, Any] | None] = [None] * max(original_count, uploaded_count)
+
+    # Unpaired pages are conclusive on their own
+    for i in range(min(original_count, uploaded_count), len(pages)):
+        if i >= uploaded_count:
+            pages[i] = _page_only_result(i, "tampered", "Page missing in uploaded document")
+        else:
+            pages[i] = _page_only_result(i, "tampered", "Extra page in uploaded document")
+    tampered = original_count != uploaded_count or original_count == 0
+
+    paired = min(original_count, uploaded_count)
+    if paired and not (tampered and not full_report):
+
+        def run(i: int) -> Dict[str, Any]:
+            deadline.check()
+            if deadline.expired():  # not worth rendering
+                deadline.skip(f"page.{i}")
+                return _page_only_result(i, "inconclusive", "Not verified: time budget exhausted")
+            res = verify_pair(DocumentPair(original_page(i), uploaded_page(i)))
+            return {"page": i, **res}
+
+        pool = _pool()
+        futures: Dict[Future, int] = {metrics.submit(pool, run, i): i for i in range(paired)}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                i = futures[fut]
+                try:
+                    pages[i] = fut.result()
+                except deadline.Cancelled:
+                    raise
+                except Exception as e:
+                    pages[i] = _page_only_result(i, "tampered", f"Page verification error: {str(e)}", error=True)
+                if pages[i]["overall_status"] == "tampered":
+                    tampered = True
+            if tampered and not full_report and pending:
+                # Conclusive: drop pages that have not started yet
+                for fut in pending:
+                    fut.cancel()
+                results["short_circuited"] = True
+                break
+        # Pages already running when we short-circuited are still collected
+        for fut, i in futures.items():
+            if pages[i] is None and not fut.cancelled():
+                try:
+                    pages[i] = fut.result()
+                except deadline.Cancelled:
+                    raise
+                except Exception as e:
+                    pages[i] = _page_only_result(i, "tampered", f"Page verification error: {str(e)}", error=True)
+    elif paired:
+        results["short_circuited"] = True
+
+    for i, page in enumerate(pages):
+        if page is None:
+            pages[i] = _page_only_result(i, "skipped", "Not verified: document already found tampered")
+    results["pages"] = pages
+    if tampered:
+        results["overall_status"] = "tampered"
+    elif all(p["overall_status"] == "authentic" for p in pages):
+        results["overall_status"] = "authentic"
+    else:
+        results["overall_status"] = "inconclusive"
+    return results
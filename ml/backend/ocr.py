@@ -0,0 +1,165 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+from . import metrics
+from .context import PageImage
+
+try:  # Preferred: in-process Tesseract API, one long-lived instance per OCR worker
+    from tesserocr import RIL, PyTessBaseAPI, iterate_level
+    from PIL import Image
+except Exception:  # pragma: no cover
+    PyTessBaseAPI = None
+
+try:  # Fallback: spawns a tesseract process per call
+    import pytesseract
+except Exception:  # pragma: no cover
+    pytesseract = None
+
+Box = Tuple[int, int, int, int]  # x, y, w, h
+Word = Tuple[int, int, int, int, str]  # x, y, w, h, text
+
+OCR_WORKERS = max(1, int(os.environ.get("ML_OCR_WORKERS", "2")))
+# Template pages whose word boxes are kept
+OCR_CACHE_ENTRIES = int(os.environ.get("ML_OCR_CACHE_ENTRIES", "256"))
+
+_pool: ThreadPoolExecutor | None = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+_cache: "OrderedDict[str, List[Word]]" = OrderedDict()
+_cache_lock = threading.Lock()
+_tesserocr_failed = False
+
+
+def ocr_disabled() -> bool:
+    # Allow disabling OCR for speed via env var
+    return os.environ.get('ML_DISABLE_OCR', '').lower() in ('1', 'true', 'yes')
+
+
+def ocr_available() -> bool:
+    return not ocr_disabled() and (PyTessBaseAPI is not None or pytesseract is not None)
+
+
+def _worker_pool() -> ThreadPoolExecutor:
+    # Bounded: at most OCR_WORKERS tesseract engines/processes run at once across all requests
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=OCR_WORKERS, thread_name_prefix="ml-ocr")
+        return _pool
+
+
+def _api() -> Any:
+    # One engine per OCR worker thread; None (pytesseract) if tesserocr is missing or cannot start
+    global _tesserocr_failed
+    if PyTessBaseAPI is None or _tesserocr_failed:
+        return None
+    api = getattr(_local, "api", None)
+    if api is None:
+        try:
+            api = _local.api = PyTessBaseAPI()
+        except Exception:  # e.g. no tessdata found
+            _tesserocr_failed = True
+            return None
+    return api
+
+
+def preload() -> None:
+    """Start this OCR worker thread's Tesseract engine (tesserocr; pytesseract keeps none)."""
+    _api()
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split())
+
+
+def _words_in_worker(image: np.ndarray) -> List[Word]:
+    words: List[Word] = []
+    try:
+        rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        api = _api()
+        if api is not None:
+            api.SetImage(Image.fromarray(rgb))
+            api.Recognize()
+            for word in iterate_level(api.GetIterator(), RIL.WORD):
+                text = (word.GetUTF8Text(RIL.WORD) or "").strip()
+                box = word.BoundingBox(RIL.WORD)
+                if text and box:
+                    x0, y0, x1, y1 = box
+                    words.append((x0, y0, x1 - x0, y1 - y0, text))
+            return words
+        if pytesseract is None:
+            return words
+        data = pytesseract.image_to_data(rgb, output_type=pytesseract.Output.DICT)
+        for x, y, w, h, text in zip(data["left"], data["top"], data["width"], data["height"], data["text"]):
+            if text.strip():
+                words.append((int(x), int(y), int(w), int(h), text.strip()))
+    except Exception:
+        pass
+    return words
+
+
+def _cache_put(key: str, words: List[Word]) -> None:
+    with _cache_lock:
+        _cache[key] = words
+        _cache.move_to_end(key)
+        while len(_cache) > OCR_CACHE_ENTRIES:
+            _cache.popitem(last=False)
+
+
+def page_words(page: PageImage, cache: bool = True) -> List[Word]:
+    """
+    Word boxes of the whole page from one OCR pass on the shared worker pool. With
+    `cache` set they are cached by page digest, so a template is read once however
+    many uploads (and regions) it is compared with.
+    """
+    key = page.digest
+    if cache:
+        with _cache_lock:
+            words = _cache.get(key)
+            if words is not None:
+                _cache.move_to_end(key)
+                return words
+    with metrics.stage("ocr"):
+        words = _worker_pool().submit(_words_in_worker, page.image).result()
+    if cache:
+        _cache_put(key, words)
+    return words
+
+
+def region_texts(page: PageImage, boxes: List[Box], cache: bool = True) -> List[str]:
+    """
+    Text of each box: the words of one whole-page read (see `page_words`) whose centre
+    lies inside it. Both sides of a comparison are read this way, so identical pages
+    give identical texts.
+    """
+    if not boxes or not ocr_available():
+        return ["" for _ in boxes]
+    words = page_words(page, cache)
+    texts: List[str] = []
+    for (x, y, w, h) in boxes:
+        inside = [t for (wx, wy, ww, wh, t) in words if x <= wx + ww / 2 < x + w and y <= wy + wh / 2 < y + h]
+        texts.append(" ".join(inside))
+    return texts
+
+
+def cached_words(page: PageImage) -> List[Word]:
+    """Cached word boxes of `page` (empty if it was never read), for persisting with a registered template."""
+    with _cache_lock:
+        return list(_cache.get(page.digest, []))
+
+
+def seed(page: PageImage, words: List[Any]) -> None:
+    """Put words saved by `cached_words` back into the cache."""
+    _cache_put(page.digest, [(int(x), int(y), int(w), int(h), str(t)) for x, y, w, h, t in words])
+
+
+def cache_stats() -> Dict[str, Any]:
+    with _cache_lock:
+        return {"entries": len(_cache), "max_entries": OCR_CACHE_ENTRIES}
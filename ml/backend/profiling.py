@@ -0,0 +1,97 @@
+"""
+Opt-in cProfile capture of single verifications.
+
+A verification is profiled when ML_PROFILE=1 (every verification) or when the
+server marks the request with `requested()` (an `X-ML-Profile` header matching
+ML_PROFILE_TOKEN). While profiled, models run sequentially on the calling thread
+so the profile sees all of their work, including the OpenCV calls each makes.
+Profiles go to ML_PROFILE_DIR as `.prof` files (load with pstats or snakeviz)
+next to a cumulative-time text summary; only the newest ML_PROFILE_KEEP are kept.
+
+When profiling is off the only cost is one flag check per verification.
+"""
+
+import contextvars
+import cProfile
+import hmac
+import io
+import itertools
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, List
+
+from . import DATA_DIR
+
+ENABLED = os.environ.get("ML_PROFILE", "").lower() in ("1", "true", "yes")
+TOKEN = os.environ.get("ML_PROFILE_TOKEN", "")
+PROFILE_DIR = os.environ.get("ML_PROFILE_DIR", os.path.join(DATA_DIR, "profiles"))
+PROFILE_KEEP = max(1, int(os.environ.get("ML_PROFILE_KEEP", "20")))
+
+_requested: contextvars.ContextVar[bool] = contextvars.ContextVar("ml_profile", default=False)
+_counter = itertools.count()
+_prune_lock = threading.Lock()
+
+
+def header_allows(value: str | None) -> bool:
+    """Per-request profiling needs ML_PROFILE_TOKEN to be set and the header to match it."""
+    # Constant-time, so response timing does not reveal how much of a guess was right
+    return bool(TOKEN) and value is not None and hmac.compare_digest(value.encode(), TOKEN.encode())
+
+
+@contextmanager
+def requested() -> Iterator[None]:
+    """Profile verifications started inside this block (and in pools fed by metrics.submit)."""
+    token = _requested.set(True)
+    try:
+        yield
+    finally:
+        _requested.reset(token)
+
+
+def active() -> bool:
+    return ENABLED or _requested.get()
+
+
+def _prune() -> None:
+    with _prune_lock:
+        try:
+            profiles = sorted(
+                (os.path.join(PROFILE_DIR, f) for f in os.listdir(PROFILE_DIR) if f.endswith(".prof")),
+                key=os.path.getmtime,
+            )
+        except FileNotFoundError:
+            return
+        for path in profiles[: max(0, len(profiles) - PROFILE_KEEP)]:
+            for victim in (path, path[: -len(".prof")] + ".txt"):
+                try:
+                    os.remove(victim)
+                except FileNotFoundError:
+                    pass
+
+
+@contextmanager
+def profile(label: str) -> Iterator[List[str]]:
+    """
+    Profile the enclosed block on this thread. Yields a list that holds the `.prof`
+    path once the block has finished.
+    """
+    out: List[str] = []
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield out
+    finally:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_counter):04d}-{label}"
+        path = os.path.join(PROFILE_DIR, name + ".prof")
+        profiler.dump_stats(path)
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(60)
+        with open(os.path.join(PROFILE_DIR, name + ".txt"), "w") as f:
+            f.write(summary.getvalue())
+        out.append(path)
+        _prune()
@@ -0,0 +1,56 @@
+import threading
+from typing import Any, Callable, Dict
+
+import cv2
+
+# Reusable OpenCV objects. Loading a Haar cascade parses a ~1 MB XML file, so it must not
+# happen per call. OpenCV does not guarantee that detectors/matchers are safe to share
+# between threads, so each worker thread gets its own instance, created once and reused
+# for the life of the process.
+_local = threading.local()
+
+FACE_CASCADE_PATH = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+
+
+def _get(key: str, create: Callable[[], Any]) -> Any:
+    objects: Dict[str, Any] | None = getattr(_local, "objects", None)
+    if objects is None:
+        objects = _local.objects = {}
+    obj = objects.get(key)
+    if obj is None:
+        obj = objects[key] = create()
+    return obj
+
+
+def face_cascade() -> "cv2.CascadeClassifier":
+    return _get("face_cascade", lambda: cv2.CascadeClassifier(FACE_CASCADE_PATH))
+
+
+def orb(n_features: int) -> "cv2.ORB":
+    return _get(f"orb:{n_features}", lambda: cv2.ORB_create(n_features))
+
+
+def hamming_matcher() -> "cv2.BFMatcher":
+    return _get("bf_hamming", lambda: cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True))
+
+
+def hamming_knn_matcher() -> "cv2.BFMatcher":
+    # knnMatch needs crossCheck off
+    return _get("bf_hamming_knn", lambda: cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=False))
+
+
+def flann_lsh_matcher() -> "cv2.FlannBasedMatcher":
+    # FLANN_INDEX_LSH (6); multi-probe LSH parameters recommended for ORB's 256-bit descriptors
+    index = dict(algorithm=6, table_number=6, key_size=12, multi_probe_level=1)
+    return _get("flann_lsh", lambda: cv2.FlannBasedMatcher(index, dict(checks=50)))
+
+
+def preload() -> None:
+    """Load every reusable object on the calling thread; raises if the cascade is missing."""
+    if face_cascade().empty():
+        raise RuntimeError(f"Unable to load Haar cascade: {FACE_CASCADE_PATH}")
+    for n in (1000, 1500, 2000):
+        orb(n)
+    hamming_matcher()
+    hamming_knn_matcher()
+    flann_lsh_matcher()
@@ -0,0 +1,88 @@
+import threading
+
+import cv2
+import fitz  # PyMuPDF
+import numpy as np
+
+from . import metrics
+
+
+def pixmap_to_bgr(pix: "fitz.Pixmap") -> np.ndarray:
+    """
+    BGR uint8 array from a PyMuPDF pixmap without any PNG encode/decode.
+
+    The RGB samples are viewed in place (honouring the row stride); the only copy
+    is the channel swap into the BGR layout the models expect, so the result owns
+    its memory and outlives the pixmap.
+    """
+    if pix.alpha or pix.n != 3:
+        pix = fitz.Pixmap(fitz.csRGB, pix, 0)
+    rgb = np.frombuffer(pix.samples_mv, dtype=np.uint8)
+    rgb = rgb.reshape(pix.height, pix.stride)[:, : pix.width * 3].reshape(pix.height, pix.width, 3)
+    return cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+
+
+@metrics.stage("render")
+def render_page(doc: "fitz.Document", index: int, dpi: int) -> np.ndarray:
+    page = doc.load_page(index)
+    return pixmap_to_bgr(page.get_pixmap(dpi=dpi, alpha=False))
+
+
+def _pixels(page: "fitz.Page", dpi: int) -> int:
+    rect = page.rect
+    return int(round(rect.width * dpi / 72.0)) * int(round(rect.height * dpi / 72.0))
+
+
+def page_pixels(data: bytes, dpi: int) -> int:
+    """Pixel count of the first page rendered at `dpi`, from its size alone (nothing is rasterized)."""
+    doc = fitz.open(stream=data, filetype="pdf")
+    try:
+        if doc.page_count == 0:
+            raise ValueError("Empty PDF")
+        return _pixels(doc.load_page(0), dpi)
+    finally:
+        doc.close()
+
+
+def render_first_page(data: bytes, dpi: int) -> np.ndarray:
+    doc = fitz.open(stream=data, filetype="pdf")
+    try:
+        if doc.page_count == 0:
+            raise ValueError("Empty PDF")
+        return render_page(doc, 0, dpi)
+    finally:
+        doc.close()
+
+
+class PdfPages:
+    """
+    One in-memory PDF whose pages are rendered on demand.
+
+    Paired with PageImage(loader=...) this keeps multi-page verification lazy: a
+    page is only rasterized when a model first touches it, so short-circuited pages
+    cost nothing. PyMuPDF documents are not thread-safe, so rendering is serialized
+    per document (the models that follow still run in parallel).
+    """
+
+    def __init__(self, data: bytes, dpi: int):
+        self.data = data
+        self.dpi = dpi
+        self._doc = fitz.open(stream=data, filetype="pdf")
+        self._lock = threading.Lock()
+
+    @property
+    def page_count(self) -> int:
+        return self._doc.page_count
+
+    def pixels(self, index: int) -> int:
+        """Pixel count of page `index` at the current DPI, without rendering it."""
+        with self._lock:
+            return _pixels(self._doc.load_page(index), self.dpi)
+
+    def render(self, index: int) -> np.ndarray:
+        with self._lock:
+            return render_page(self._doc, index, self.dpi)
+
+    def close(self) -> None:
+        with self._lock:
+            self._doc.close()
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+from .main import PIPELINE_VERSION
+
+# Settings that change verdicts; a different value means a different cache key
+CONFIG_ENV = (
+    "ML_TIERED",
+    "ML_TIER_PHASH_REJECT",
+    "ML_DISABLE_OCR",
+    "ML_OCR_ZONES",
+    "ML_OCR_MAX_REGIONS",
+    "ML_ALIGN_WORKING_PX",
+    "ML_ALIGN_LEVELS",
+    "ML_ALIGN_REFINE_RATIO",
+    "ML_MATCHER",
+    "ML_MATCH_RATIO",
+    "ML_SEAL_CROP_PX",
+    "ML_SEAL_MAX_PROPOSALS",
+    "ML_SIG_SEARCH_FRAC",
+    "ML_MEMORY_BUDGET_MB",
+)
+
+
+def pipeline_version() -> str:
+    """PIPELINE_VERSION plus a short hash of the verdict-relevant settings."""
+    config = ";".join(f"{k}={os.environ.get(k, '')}" for k in CONFIG_ENV)
+    return f"{PIPELINE_VERSION}-{hashlib.sha256(config.encode()).hexdigest()[:8]}"
+
+
+def result_key(original_sha: str, uploaded_sha: str, dpi: int, mode: str = "first") -> str:
+    """Cache key for one verification: both documents' SHA-256, render DPI, mode and pipeline version."""
+    return f"{original_sha}:{uploaded_sha}:dpi={dpi}:{mode}:v={pipeline_version()}"
+
+
+class ResultCache:
+    """
+    Verification results by key: an in-memory LRU in front of an optional SQLite
+    table that survives restarts. Results are stored as JSON, so every hit returns
+    a fresh dict the caller may annotate.
+    """
+
+    def __init__(self, max_entries: int, db_path: str = ""):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()  # separate, so memory hits never wait on SQLite
+        self._db: sqlite3.Connection | None = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results "
+                "(key TEXT PRIMARY KEY, result TEXT NOT NULL, compute_ms REAL NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 or self._db is not None
+
+    @property
+    def persistent(self) -> bool:
+        return self._db is not None
+
+    def get(self, key: str) -> Tuple[Dict[str, Any], float, str] | None:
+        """(result, original compute ms, "memory" | "disk") or None; may block on SQLite."""
+        return self.get_memory(key) or self.get_disk(key)
+
+    def get_memory(self, key: str) -> Tuple[Dict[str, Any], float, str] | None:
+        """In-memory LRU only; cheap enough for the event loop."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                if self._db is None:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return json.loads(entry[0]), entry[1], "memory"
+
+    def get_disk(self, key: str) -> Tuple[Dict[str, Any], float, str] | None:
+        """SQLite lookup after a `get_memory` miss (blocking); a hit is promoted to memory."""
+        row = None
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute("SELECT result, compute_ms FROM results WHERE key = ?", (key,)).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            entry = (row[0], float(row[1]))
+            self._remember(key, entry)
+            self.hits += 1
+            self.disk_hits += 1
+        return json.loads(entry[0]), entry[1], "disk"
+
+    def put(self, key: str, result: Dict[str, Any], compute_ms: float, disk: bool = True) -> str:
+        """
+        Store `result`; returns its JSON. With `disk` False the SQLite write is left to
+        the caller (`put_disk`, e.g. from a thread), so the event loop never waits on it.
+        """
+        entry = (json.dumps(result), compute_ms)
+        with self._lock:
+            self._remember(key, entry)
+        if disk:
+            self.put_disk(key, entry[0], compute_ms)
+        return entry[0]
+
+    def put_disk(self, key: str, encoded: str, compute_ms: float) -> None:
+        if self._db is None:
+            return
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (key, result, compute_ms, created) VALUES (?, ?, ?, ?)",
+                (key, encoded, compute_ms, time.time()),
+            )
+            self._db.commit()
+
+    def _remember(self, key: str, entry: Tuple[str, float]) -> None:
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "persistent": self._db is not None,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "version": pipeline_version(),
+            }
+
+
+result_cache = ResultCache(
+    int(os.environ.get("ML_RESULT_CACHE_ENTRIES", "1024")),
+    os.environ.get("ML_RESULT_CACHE_DB", ""),
+)
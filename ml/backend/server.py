@@ -1,12 +1,117 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
-import tempfile
+import asyncio
+import threading
+from contextlib import asynccontextmanager, nullcontext
+from typing import Any, Callable, List, Tuple
+from fastapi import FastAPI, Header, Request, UploadFile, File, Form, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
+import numpy as np
 import os
-import fitz  # PyMuPDF
-from .main import verify_all
+from . import deadline, memory, metrics, ocr, profiling, template_store, workers
+from .admission import Overloaded, verify_executor
+from .jobs import JOB_RUNNERS, PermanentError, QueueFull, job_queue
+from .context import DocumentPair, PageImage
+from .main import inconclusive_result, verify_pair
+from .multipage import PAGE_WORKERS, verify_pages
+from .render import PdfPages, page_pixels, render_first_page
+from .result_cache import result_cache, result_key
+from .template_cache import hash_key, template_cache
+from .warmup import warm_pools, warm_up
+import hashlib
 import time
 
-app = FastAPI(title="Certificate ML Verification Service")
+RENDER_DPI = 150
+BATCH_MAX_ITEMS = int(os.environ.get("ML_BATCH_MAX_ITEMS", "50"))
+DISCONNECT_POLL_S = 0.25
+
+_readiness = {"ready": False, "warmup_s": None, "error": None}
+
+
+def _warm_up_workers() -> None:
+    # Every verification worker thread (or process) loads its detectors and runs one synthetic
+    # verification; the shared model, page and OCR pool threads then preload theirs
+    t0 = time.perf_counter()
+    try:
+        if workers.pool is not None:
+            workers.pool.start()
+        else:
+            verify_executor.broadcast(warm_up)
+            warm_pools()
+    except Exception as e:
+        _readiness["error"] = str(e)
+        print(f"[ml] warm-up failed: {e}")
+        if workers.pool is not None and not workers.pool.stats()["alive"]:
+            workers.stop_pool()  # serve on threads rather than queue for workers that never come
+    _readiness["warmup_s"] = round(time.perf_counter() - t0, 3)
+    _readiness["ready"] = True
+    print(f"[ml] warm-up done in {_readiness['warmup_s']}s")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm = os.environ.get("ML_WARMUP", "1").lower() not in ("0", "false", "no")
+    if workers.create_pool(warm) is None and not warm:
+        _readiness["ready"] = True
+    else:
+        # Run in the background so /health answers immediately; /ready flips once done
+        threading.Thread(target=_warm_up_workers, name="ml-warmup", daemon=True).start()
+    if JOB_RUNNERS:
+        job_queue.start(_run_queued_job, JOB_RUNNERS)
+    yield
+    job_queue.stop()
+    workers.stop_pool()
+
+
+app = FastAPI(title="Certificate ML Verification Service", lifespan=lifespan)
+
+# Queue gauges are read from the executor at scrape time
+metrics.register(metrics.Gauge("ml_queue_depth", "Verifications waiting for a worker", lambda: verify_executor.stats()["queued"]))
+metrics.register(metrics.Gauge("ml_queue_running", "Verifications running on a worker", lambda: verify_executor.stats()["running"]))
+metrics.register(metrics.Gauge("ml_memory_reserved_bytes", "Estimated memory held by running verifications", lambda: memory.pool.reserved))
+metrics.register(metrics.Gauge("ml_jobs_queued", "Asynchronous jobs waiting in the durable queue", lambda: job_queue.count("queued")))
+
+
+class TrackRequests:
+    """
+    Request counts, latencies and the in-flight gauge. Plain ASGI rather than
+    @app.middleware("http"): that wrapper hides client disconnects from handlers,
+    which /verify needs to see to cancel abandoned work.
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        path = scope.get("path", "")
+        if scope["type"] != "http" or path == "/metrics":
+            await self.app(scope, receive, send)
+            return
+        verifying = path.startswith("/verify")
+        if verifying:
+            metrics.IN_FLIGHT.inc()
+        t0 = time.perf_counter()
+        code = 500
+
+        async def send_status(message: dict) -> None:
+            nonlocal code
+            if message["type"] == "http.response.start":
+                code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            if verifying:
+                metrics.IN_FLIGHT.dec()
+            # Label by route template so ids in paths (/jobs/{job_id}) don't create a series each;
+            # unmatched paths (scanners, typos) share one label
+            label = getattr(scope.get("route"), "path", "<unmatched>")
+            metrics.REQUEST_SECONDS.observe(label, value=time.perf_counter() - t0)
+            metrics.REQUESTS.inc(label, str(code))
+            if code >= 500:
+                metrics.ERRORS.inc("http_5xx")
+
+
+app.add_middleware(TrackRequests)
 
 
 @app.get("/health")
@@ -14,42 +119,501 @@ def health():
     return {"status": "ok"}
 
 
-def pdf_first_page_to_png_tmpfile(data: bytes) -> str:
+@app.get("/ready")
+def ready():
+    if not _readiness["ready"]:
+        return JSONResponse({"status": "warming_up"}, status_code=503)
+    return {"status": "ready", **_readiness}
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/stats")
+def stats():
+    return {
+        "template_cache": template_cache.stats(),
+        "ocr_cache": ocr.cache_stats(),
+        "result_cache": result_cache.stats(),
+        "template_store": template_store.stats(),
+        "queue": verify_executor.stats(),
+        "jobs": job_queue.stats(),
+        "memory": memory.pool.stats(),
+        **({"workers": workers.pool.stats()} if workers.pool is not None else {}),
+    }
+
+
+def pdf_first_page_to_array(data: bytes, dpi: int = RENDER_DPI) -> np.ndarray:
     try:
-        doc = fitz.open(stream=data, filetype="pdf")
-        if doc.page_count == 0:
-            raise ValueError("Empty PDF")
-        page = doc.load_page(0)
-        pix = page.get_pixmap(dpi=150)
-        fd, path = tempfile.mkstemp(suffix=".png")
-        os.close(fd)
-        pix.save(path)
-        return path
+        return render_first_page(data, dpi)
     except Exception as e:
+        metrics.ERRORS.inc("render")
         raise HTTPException(status_code=400, detail=f"PDF render error: {e}")
 
 
+def _verify_budgeted(o_page: PageImage, u_bytes: bytes) -> dict:
+    """Render the upload and verify it against `o_page` at the scale the memory budget allows."""
+    # The larger page sets the footprint; without a budget the upload's size is not worth a PDF parse
+    pixels = u_pixels = o_page.shape[0] * o_page.shape[1]
+    if memory.BUDGET_MB > 0:
+        try:
+            u_pixels = page_pixels(u_bytes, RENDER_DPI)
+        except Exception as e:
+            metrics.ERRORS.inc("render")
+            raise HTTPException(status_code=400, detail=f"PDF render error: {e}")
+        pixels = max(pixels, u_pixels)
+    plan = memory.Plan(pixels, RENDER_DPI, render_px=u_pixels)
+    with memory.reserve(plan.bytes):
+        if deadline.expired():  # spent its budget waiting for memory; not worth rendering
+            deadline.skip("verification")
+            return inconclusive_result("Not verified: time budget exhausted")
+        u_image = memory.scaled_image(pdf_first_page_to_array(u_bytes), plan.scale)
+        result = verify_pair(DocumentPair(memory.scaled_page(o_page, plan.scale), PageImage(image=u_image)))
+    result["memory"] = plan.info()
+    return result
+
+
+def _load_template(o_sha: str, data: bytes | None) -> PageImage:
+    # A registered template is memory-mapped with its stored features; a stale entry
+    # (other DPI or pipeline settings) is rebuilt from its stored PDF
+    page = template_store.load(o_sha, RENDER_DPI)
+    if page is not None:
+        return page
+    if data is None:
+        data = template_store.original_pdf(o_sha)
+        if data is None:
+            raise HTTPException(status_code=404, detail=f"Unknown template_id: {o_sha}")
+        return template_store.register(o_sha, data, pdf_first_page_to_array(data), RENDER_DPI)
+    return PageImage(image=pdf_first_page_to_array(data))
+
+
+def template_page(o_sha: str, data: bytes | None = None) -> PageImage:
+    """
+    Rendered original page, shared across requests with its precomputed features.
+    Without `data` the page must have been registered through POST /templates.
+    """
+    key = hash_key(o_sha, RENDER_DPI)
+    return template_cache.get_or_create(key, lambda: _load_template(o_sha, data))
+
+
+def _register_template(data: bytes) -> dict:
+    o_sha = _sha256(data)
+    meta = template_store.info(o_sha)
+    created = not template_store.is_current(meta, RENDER_DPI)
+    if created:
+        page = template_store.register(o_sha, data, pdf_first_page_to_array(data), RENDER_DPI)
+        template_cache.get_or_create(hash_key(o_sha, RENDER_DPI), lambda: page)
+        meta = template_store.info(o_sha)
+    return {**template_store.describe(meta, RENDER_DPI), "created": created}
+
+
+def _shared_template(o_sha: str, o_bytes: bytes | None) -> workers.SharedPage:
+    # Server process, dispatch thread: registered templates are mapped by each worker from the
+    # store; any other template is rendered here once into shared memory for every worker.
+    # The ref must go back through workers.release once its jobs are done
+    stored = template_store.is_current(template_store.info(o_sha), RENDER_DPI)
+    if o_bytes is None or stored:
+        if not stored:
+            _load_template(o_sha, None)  # rebuilds a stale entry, or 404
+        return workers.SharedPage(hash_key(o_sha, RENDER_DPI), store_id=o_sha, dpi=RENDER_DPI)
+    return workers.publish(hash_key(o_sha, RENDER_DPI), lambda: pdf_first_page_to_array(o_bytes))
+
+
+def _verify_pdfs(o_sha: str, o_bytes: bytes | None, u_bytes: bytes) -> dict:
+    return _verify_rendered(lambda: template_page(o_sha, o_bytes), u_bytes)
+
+
+def _verify_shared(o_ref: workers.SharedPage, u_bytes: bytes) -> dict:
+    # Worker process: only the upload's bytes were sent; the template is mapped
+    return _verify_rendered(lambda: workers.shared_page(o_ref), u_bytes)
+
+
+def _verify_rendered(template: Callable[[], PageImage], u_bytes: bytes) -> dict:
+    # CPU-bound: rendering and models run on the verification executor, never on the event loop
+    if deadline.expired():  # spent its budget in the queue; not worth rendering
+        deadline.skip("verification")
+        return inconclusive_result("Not verified: time budget exhausted")
+    t0 = time.perf_counter()
+    o_page = template()
+    t1 = time.perf_counter()
+    result = _verify_budgeted(o_page, u_bytes)
+    t2 = time.perf_counter()
+    print(f"[ml] template={t1-t0:.2f}s verify={t2-t1:.2f}s total={t2-t0:.2f}s scale={result['memory']['scale']}")
+    return result
+
+
+def _verify_pdf_pages(o_bytes: bytes, u_bytes: bytes, full_report: bool) -> dict:
+    t0 = time.perf_counter()
+    try:
+        o_pdf = PdfPages(o_bytes, RENDER_DPI)
+        u_pdf = PdfPages(u_bytes, RENDER_DPI)
+    except Exception as e:
+        metrics.ERRORS.inc("render")
+        raise HTTPException(status_code=400, detail=f"PDF render error: {e}")
+
+    o_sha = _sha256(o_bytes)
+    try:
+        # Up to PAGE_WORKERS pages are in flight at once, each sized by the largest page
+        paired = min(o_pdf.page_count, u_pdf.page_count)
+        pixels = max([o_pdf.pixels(i) for i in range(o_pdf.page_count)] + [u_pdf.pixels(i) for i in range(u_pdf.page_count)] + [0])
+        plan = memory.Plan(pixels, RENDER_DPI, concurrency=max(1, min(PAGE_WORKERS, paired)))
+        o_pdf.dpi = u_pdf.dpi = plan.dpi
+
+        def original_page(i: int) -> PageImage:
+            if i == 0 and not plan.degraded:
+                return template_page(o_sha, o_bytes)
+            return template_cache.get_or_create(hash_key(o_sha, plan.dpi, page=i), lambda: PageImage(image=o_pdf.render(i)))
+
+        def uploaded_page(i: int) -> PageImage:
+            return PageImage(loader=lambda: u_pdf.render(i))
+
+        with memory.reserve(plan.bytes):
+            result = verify_pages(o_pdf.page_count, u_pdf.page_count, original_page, uploaded_page, full_report)
+        result["memory"] = plan.info()
+    finally:
+        o_pdf.close()
+        u_pdf.close()
+    verified = sum(1 for p in result["pages"] if p["overall_status"] != "skipped")
+    print(f"[ml] pages={len(result['pages'])} verified={verified} total={time.perf_counter()-t0:.2f}s")
+    return result
+
+
+def _run_job(profile: bool, fn: Callable[..., dict], *args: Any) -> Tuple[dict, dict]:
+    # Collects every stage run for this request, including work fanned out to model/page pools;
+    # a profiled request marks its verifications for cProfile the same way
+    deadline.check()
+    with metrics.collect() as timings, memory.track() as peak, (profiling.requested() if profile else nullcontext()):
+        result = fn(*args)
+    result.setdefault("memory", {}).update(peak)
+    limited = deadline.current()
+    if limited is not None and (limited.budget_s is not None or limited.partial):
+        result["partial"] = limited.partial
+        result["deadline"] = limited.info()
+    return result, timings.as_dict()
+
+
+def _first_page_job(
+    profile: bool, limited: deadline.Deadline | None, o_sha: str, o_bytes: bytes | None, u_bytes: bytes
+) -> Tuple[dict, dict]:
+    with deadline.within(limited):
+        if workers.pool is None:
+            return _run_job(profile, _verify_pdfs, o_sha, o_bytes, u_bytes)
+        o_ref = _shared_template(o_sha, o_bytes)
+        try:
+            return workers.run(_run_job, profile, _verify_shared, o_ref, u_bytes)
+        finally:
+            workers.release(o_ref)
+
+
+def _pages_job(
+    profile: bool, limited: deadline.Deadline | None, o_bytes: bytes, u_bytes: bytes, full_report: bool
+) -> Tuple[dict, dict]:
+    with deadline.within(limited):
+        return workers.run(_run_job, profile, _verify_pdf_pages, o_bytes, u_bytes, full_report)
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _cache_hit(hit: Tuple[dict, float, str] | None) -> dict | None:
+    if hit is None:
+        return None
+    result, compute_ms, source = hit
+    result["cache"] = {"hit": True, "source": source, "compute_ms": round(compute_ms, 1)}
+    return result
+
+
+def _cached_result(key: str) -> dict | None:
+    # Verification is deterministic for a given key, so repeats are answered without rendering
+    if not result_cache.enabled:
+        return None
+    return _cache_hit(result_cache.get(key))
+
+
+async def _cached_result_async(key: str) -> dict | None:
+    # _cached_result for handlers: the in-memory LRU on the loop, SQLite in a thread
+    if not result_cache.enabled:
+        return None
+    hit = result_cache.get_memory(key)
+    if hit is None and result_cache.persistent:
+        hit = await asyncio.to_thread(result_cache.get_disk, key)
+    return _cache_hit(hit)
+
+
+def _has_error(result: dict) -> bool:
+    # A model or page that raised reports a provisional "tampered" flagged with "error": true.
+    # The failure may be transient, so such results are never cached (see _cache_entry)
+    if any(isinstance(v, dict) and v.get("error") for v in result.values()):
+        return True
+    return any(page.get("error") or _has_error(page) for page in result.get("pages", []))
+
+
+def _cache_entry(result: dict) -> dict | None:
+    # What the result cache keeps of a fresh result, or None when it must not be cached.
+    # Memory use and deadline describe this computation, not the verdict; hits report neither
+    if not result_cache.enabled or _has_error(result):
+        return None
+    return {k: v for k, v in result.items() if k not in ("memory", "partial", "deadline")}
+
+
+def _store_result(key: str, result: dict, compute_ms: float) -> dict:
+    entry = _cache_entry(result)
+    if entry is not None:
+        result_cache.put(key, entry, compute_ms)
+    result["cache"] = {"hit": False, "compute_ms": round(compute_ms, 1)}
+    return result
+
+
+async def _store_result_async(key: str, result: dict, compute_ms: float) -> dict:
+    # _store_result for handlers: the in-memory LRU on the loop, the SQLite write in a thread
+    entry = _cache_entry(result)
+    if entry is not None:
+        encoded = result_cache.put(key, entry, compute_ms, disk=False)
+        if result_cache.persistent:
+            await asyncio.to_thread(result_cache.put_disk, key, encoded, compute_ms)
+    result["cache"] = {"hit": False, "compute_ms": round(compute_ms, 1)}
+    return result
+
+
+def _overloaded_response(e: Overloaded) -> JSONResponse:
+    metrics.ERRORS.inc("overloaded")
+    return JSONResponse(
+        {"detail": str(e), "queue": verify_executor.stats()},
+        status_code=503,
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+async def _original_source(original: UploadFile | None, template_id: str | None) -> Tuple[str, bytes | None]:
+    """(SHA-256, bytes or None) of the original: an uploaded PDF, or a registered template id."""
+    if (original is None) == (template_id is None):
+        raise HTTPException(status_code=422, detail="Send exactly one of 'original' or 'template_id'")
+    if original is not None:
+        data = await original.read()
+        return _sha256(data), data
+    o_sha = template_id.strip().lower()
+    if not template_store.valid_id(o_sha):
+        raise HTTPException(status_code=422, detail="template_id must be the SHA-256 hex digest returned by POST /templates")
+    if template_store.info(o_sha) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown template_id: {o_sha}")
+    return o_sha, None
+
+
+@app.post("/templates")
+async def register_template_endpoint(
+    original: UploadFile = File(..., description="Original template PDF"),
+):
+    data = await original.read()
+    try:
+        result, _ = await verify_executor.run(workers.run, _register_template, data)
+    except Overloaded as e:
+        return _overloaded_response(e)
+    return JSONResponse(result, status_code=201 if result["created"] else 200)
+
+
+@app.get("/templates/{template_id}")
+def template_info(template_id: str):
+    meta = template_store.info(template_id.lower()) if template_store.valid_id(template_id.lower()) else None
+    if meta is None:
+        raise HTTPException(status_code=404, detail=f"Unknown template_id: {template_id}")
+    return template_store.describe(meta, RENDER_DPI)
+
+
+async def _cancel_on_disconnect(request: Request, limited: deadline.Deadline) -> None:
+    # A verification nobody will read stops at its next stage boundary (deadline.Cancelled)
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_S)
+    limited.cancel()
+
+
+def _verify_mode(all_pages: bool, full_report: bool) -> str:
+    return ("pages-full" if full_report else "pages") if all_pages else "first"
+
+
 @app.post("/verify")
 async def verify_endpoint(
-    original: UploadFile = File(..., description="Original template PDF"),
+    request: Request,
+    original: UploadFile | None = File(None, description="Original template PDF (or send template_id)"),
+    template_id: str | None = Form(None, description="Id of an original registered through POST /templates"),
     uploaded: UploadFile = File(..., description="Scanned/uploaded PDF to verify"),
+    all_pages: bool = Form(False, description="Verify every page instead of only the first"),
+    full_report: bool = Form(False, description="With all_pages, keep verifying after a tampered page"),
+    timings: bool = Form(False, description="Include per-stage timings in the response"),
+    deadline_ms: int | None = Form(None, description="Time budget; past it, partial results are returned"),
+    x_ml_profile: str | None = Header(None, description="ML_PROFILE_TOKEN, to cProfile this request"),
+    x_ml_deadline_ms: str | None = Header(None, description="Time budget in ms (alternative to deadline_ms)"),
 ):
     try:
-        t0 = time.perf_counter()
-        o_bytes = await original.read()
-        u_bytes = await uploaded.read()
-        o_img = pdf_first_page_to_png_tmpfile(o_bytes)
-        u_img = pdf_first_page_to_png_tmpfile(u_bytes)
-        t1 = time.perf_counter()
-        result = verify_all(o_img, u_img)
-        t2 = time.perf_counter()
-        print(f"[ml] convert={t1-t0:.2f}s models={t2-t1:.2f}s total={t2-t0:.2f}s")
-        return JSONResponse(result)
+        limited = deadline.parse_ms(deadline_ms if deadline_ms is not None else x_ml_deadline_ms)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    # Without a budget the deadline only carries cancellation
+    limited = limited or deadline.Deadline(None)
+    o_sha, o_bytes = await _original_source(original, template_id)
+    u_bytes = await uploaded.read()
+    key = result_key(o_sha, _sha256(u_bytes), RENDER_DPI, _verify_mode(all_pages, full_report))
+    # A profiled request must really run, and its result (with profile paths) is not cached
+    profile = profiling.ENABLED or profiling.header_allows(x_ml_profile)
+    cached = None if profile else await _cached_result_async(key)
+    if cached is not None:
+        return JSONResponse(cached, headers={"X-Queue-Wait-Ms": "0"})
+
+    t0 = time.perf_counter()
+    watcher = asyncio.ensure_future(_cancel_on_disconnect(request, limited))
+    try:
+        if all_pages:
+            if o_bytes is None:
+                o_bytes = template_store.original_pdf(o_sha)
+                if o_bytes is None:
+                    raise HTTPException(status_code=404, detail=f"Unknown template_id: {o_sha}")
+            (result, stage_timings), waited = await verify_executor.run(
+                _pages_job, profile, limited, o_bytes, u_bytes, full_report
+            )
+        else:
+            (result, stage_timings), waited = await verify_executor.run(
+                _first_page_job, profile, limited, o_sha, o_bytes, u_bytes
+            )
+    except Overloaded as e:
+        return _overloaded_response(e)
+    except deadline.Cancelled:
+        metrics.ERRORS.inc("client_disconnected")
+        return JSONResponse({"detail": "Client closed request"}, status_code=499)
     finally:
-        # cleanup temp files
-        for p in locals().get("o_img", None), locals().get("u_img", None):
-            if p and isinstance(p, str):
-                try:
-                    os.remove(p)
-                except Exception:
-                    pass
+        watcher.cancel()
+    compute_ms = (time.perf_counter() - t0 - waited) * 1000
+    if profile or result.get("partial"):
+        # Profiled runs and results cut short by the deadline are not what a repeat should get
+        result["cache"] = {"hit": False, "compute_ms": round(compute_ms, 1)}
+    else:
+        result = await _store_result_async(key, result, compute_ms)
+    if timings:
+        result["timings"] = {"queue_wait_ms": round(waited * 1000, 2), **stage_timings}
+    return JSONResponse(result, headers={"X-Queue-Wait-Ms": str(int(waited * 1000))})
+
+
+def _verify_batch_item(o_page: PageImage | workers.SharedPage, u_bytes: bytes) -> Tuple[dict, float]:
+    t0 = time.perf_counter()
+    if isinstance(o_page, workers.SharedPage):
+        o_page = workers.shared_page(o_page)
+    with memory.track() as peak:
+        result = _verify_budgeted(o_page, u_bytes)
+    result["memory"].update(peak)
+    return result, (time.perf_counter() - t0) * 1000
+
+
+@app.post("/verify/batch")
+async def verify_batch_endpoint(
+    original: UploadFile | None = File(None, description="Original template PDF (or send template_id)"),
+    template_id: str | None = Form(None, description="Id of an original registered through POST /templates"),
+    uploaded: List[UploadFile] = File(..., description="Scanned/uploaded PDFs to verify against the original"),
+):
+    if len(uploaded) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch too large: {len(uploaded)} > {BATCH_MAX_ITEMS} files")
+    o_sha, o_bytes = await _original_source(original, template_id)
+    u_items = [(f.filename, await f.read()) for f in uploaded]
+    keys = [result_key(o_sha, _sha256(b), RENDER_DPI) for _, b in u_items]
+    outcomes = [await _cached_result_async(k) for k in keys]
+    pending = [i for i, o in enumerate(outcomes) if o is None]
+    if len(pending) > verify_executor.capacity:
+        # Would be rejected as Overloaded forever, so say so rather than ask for a retry
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: {len(pending)} uncached files > queue capacity {verify_executor.capacity}",
+        )
+
+    t0 = time.perf_counter()
+    waited = 0.0
+    if pending:
+        try:
+            # Render the template (and seed the cache) once before fanning out; every item then
+            # shares the same PageImage, so template-side features are computed a single time.
+            # With worker processes the template is shared by reference instead
+            prepare = _shared_template if workers.pool is not None else template_page
+            o_page, _ = await verify_executor.run(prepare, o_sha, o_bytes)
+            try:
+                computed, waited = await verify_executor.run_many(
+                    workers.run, [(_verify_batch_item, o_page, u_items[i][1]) for i in pending]
+                )
+            finally:
+                if isinstance(o_page, workers.SharedPage):
+                    workers.release(o_page)
+        except Overloaded as e:
+            return _overloaded_response(e)
+        for i, outcome in zip(pending, computed):
+            outcomes[i] = outcome if isinstance(outcome, Exception) else await _store_result_async(keys[i], *outcome)
+
+    items = []
+    counts = {"authentic": 0, "tampered": 0, "inconclusive": 0, "error": 0}
+    for i, ((filename, _), outcome) in enumerate(zip(u_items, outcomes)):
+        item = {"index": i, "filename": filename}
+        if isinstance(outcome, Exception):
+            detail = outcome.detail if isinstance(outcome, HTTPException) else str(outcome)
+            item["error"] = detail
+            counts["error"] += 1
+        else:
+            item["result"] = outcome
+            status = outcome.get("overall_status", "tampered")
+            counts[status if status in counts else "tampered"] += 1
+        items.append(item)
+    print(f"[ml] batch items={len(items)} cached={len(items) - len(pending)} total={time.perf_counter()-t0:.2f}s")
+    return JSONResponse(
+        {"count": len(items), "summary": counts, "items": items},
+        headers={"X-Queue-Wait-Ms": str(int(waited * 1000))},
+    )
+
+
+def _run_queued_job(params: dict, o_bytes: bytes | None, u_bytes: bytes) -> dict:
+    # Job runner thread: same computation and result cache as /verify, outside the admission queue
+    o_sha = params["original_sha256"]
+    all_pages, full_report = params["all_pages"], params["full_report"]
+    key = result_key(o_sha, _sha256(u_bytes), RENDER_DPI, _verify_mode(all_pages, full_report))
+    cached = _cached_result(key)
+    if cached is not None:
+        return cached
+    t0 = time.perf_counter()
+    try:
+        if all_pages:
+            o_bytes = o_bytes if o_bytes is not None else template_store.original_pdf(o_sha)
+            if o_bytes is None:
+                raise HTTPException(status_code=404, detail=f"Unknown template_id: {o_sha}")
+            result, _ = _pages_job(False, None, o_bytes, u_bytes, full_report)
+        else:
+            result, _ = _first_page_job(False, None, o_sha, o_bytes, u_bytes)
+    except HTTPException as e:
+        if e.status_code < 500:
+            raise PermanentError(e.detail)
+        raise
+    return _store_result(key, result, (time.perf_counter() - t0) * 1000)
+
+
+@app.post("/jobs")
+async def submit_job_endpoint(
+    original: UploadFile | None = File(None, description="Original template PDF (or send template_id)"),
+    template_id: str | None = Form(None, description="Id of an original registered through POST /templates"),
+    uploaded: UploadFile = File(..., description="Scanned/uploaded PDF to verify"),
+    all_pages: bool = Form(False, description="Verify every page instead of only the first"),
+    full_report: bool = Form(False, description="With all_pages, keep verifying after a tampered page"),
+    priority: int = Form(0, description="Higher runs first; equal priorities run in submission order"),
+):
+    o_sha, o_bytes = await _original_source(original, template_id)
+    u_bytes = await uploaded.read()
+    params = {"original_sha256": o_sha, "all_pages": all_pages, "full_report": full_report}
+    try:
+        # An SQLite write of both PDFs (busy timeout 30 s): keep it off the event loop
+        job = await asyncio.to_thread(job_queue.submit, params, o_bytes, u_bytes, priority)
+    except QueueFull as e:
+        metrics.ERRORS.inc("jobs_full")
+        return JSONResponse({"detail": str(e)}, status_code=503, headers={"Retry-After": "30"})
+    return JSONResponse(job, status_code=202, headers={"Location": f"/jobs/{job['job_id']}"})
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    # Plain def: FastAPI runs it (and its SQLite read) on the threadpool, like /metrics and /stats
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired job: {job_id}")
+    return job
@@ -0,0 +1,188 @@
+"""
+Float32 SSIM built on separable OpenCV box/Gaussian filters.
+
+Matches `skimage.metrics.structural_similarity` defaults for 2-D uint8 input
+(7x7 uniform window, sample covariance, K1=0.01, K2=0.03, data_range=255,
+reflect borders, mean taken over the map with a 3-pixel border cropped), but:
+
+- works in float32 (skimage promotes to float64), centring pixels on 128
+  before forming second moments to limit float32 cancellation;
+- processes the image in row strips (with a halo of filter radius rows), so
+  temporaries are strip-sized instead of page-sized;
+- can return only the score, without ever allocating the full map;
+- can optionally downscale both inputs first.
+
+Agreement with skimage (checked by `python -m backend.ssim`): on 8-bit pages
+and crops the score differs by < 1e-5 and the map by < 1e-4 absolute, well
+below the 2-3 decimal thresholds the models use. Gaussian mode (sigma 1.5,
+11 taps, population covariance) corresponds to skimage's
+`gaussian_weights=True, use_sample_covariance=False`.
+"""
+
+import os
+from typing import Tuple
+
+import cv2
+import numpy as np
+
+from . import metrics
+
+K1 = 0.01
+K2 = 0.03
+WIN_SIZE = 7
+GAUSS_SIGMA = 1.5
+GAUSS_RADIUS = 5  # int(3.5 * 1.5 + 0.5), skimage's truncate=3.5
+
+TILE_ROWS = int(os.environ.get("ML_SSIM_TILE_ROWS", "512"))
+
+
+def _strip_ssim(x: np.ndarray, y: np.ndarray, gaussian: bool, data_range: float) -> np.ndarray:
+    """SSIM map (float32) of one strip; borders reflect like scipy's 'reflect' mode."""
+    if gaussian:
+        k = 2 * GAUSS_RADIUS + 1
+
+        def filt(img: np.ndarray) -> np.ndarray:
+            return cv2.GaussianBlur(img, (k, k), GAUSS_SIGMA, borderType=cv2.BORDER_REFLECT)
+
+        cov_norm = 1.0
+    else:
+
+        def filt(img: np.ndarray) -> np.ndarray:
+            return cv2.boxFilter(img, cv2.CV_32F, (WIN_SIZE, WIN_SIZE), normalize=True, borderType=cv2.BORDER_REFLECT)
+
+        n = WIN_SIZE * WIN_SIZE
+        cov_norm = n / (n - 1.0)
+
+    # Centre on mid-grey: variances/covariance are shift-invariant and the smaller
+    # magnitudes keep E[x^2] - E[x]^2 accurate in float32
+    xc = x.astype(np.float32)
+    xc -= 128.0
+    yc = y.astype(np.float32)
+    yc -= 128.0
+
+    ux = filt(xc)
+    uy = filt(yc)
+    vx = filt(xc * xc)
+    vx -= ux * ux
+    vy = filt(yc * yc)
+    vy -= uy * uy
+    vxy = filt(xc * yc)
+    vxy -= ux * uy
+    if cov_norm != 1.0:
+        vx *= cov_norm
+        vy *= cov_norm
+        vxy *= cov_norm
+    ux += 128.0
+    uy += 128.0
+
+    c1 = (K1 * data_range) ** 2
+    c2 = (K2 * data_range) ** 2
+    num = (2.0 * ux * uy + c1) * (2.0 * vxy + c2)
+    den = (ux * ux + uy * uy + c1) * (vx + vy + c2)
+    num /= den
+    return num
+
+
+@metrics.stage("ssim")
+def ssim(
+    a: np.ndarray,
+    b: np.ndarray,
+    full: bool = False,
+    gaussian: bool = False,
+    downscale: float = 1.0,
+    tile_rows: int | None = None,
+    data_range: float = 255.0,
+) -> float | Tuple[float, np.ndarray]:
+    """
+    SSIM of two same-shaped single-channel images.
+
+    Returns the mean score, or (score, float32 map at the input resolution) when
+    `full` is set. `downscale` < 1 computes on resized inputs (INTER_AREA) and
+    upsamples the map back; `tile_rows` bounds the strip height (default
+    ML_SSIM_TILE_ROWS).
+    """
+    if a.shape != b.shape:
+        raise ValueError("Input images must have the same dimensions.")
+    if a.ndim != 2:
+        raise ValueError("ssim expects single-channel images")
+    out_shape = a.shape
+    if downscale < 1.0:
+        a = cv2.resize(a, None, fx=downscale, fy=downscale, interpolation=cv2.INTER_AREA)
+        b = cv2.resize(b, None, fx=downscale, fy=downscale, interpolation=cv2.INTER_AREA)
+
+    h, w = a.shape
+    radius = GAUSS_RADIUS if gaussian else (WIN_SIZE - 1) // 2
+    win = 2 * radius + 1
+    if h < win or w < win:
+        raise ValueError("win_size exceeds image extent")
+
+    tile = max(win, tile_rows or TILE_ROWS)
+    pad = radius  # border excluded from the mean, as skimage does
+    smap = np.empty((h, w), np.float32) if full else None
+    total = 0.0
+    for r0 in range(0, h, tile):
+        r1 = min(h, r0 + tile)
+        # Halo rows make the strip's interior identical to a whole-image computation
+        h0 = max(0, r0 - radius)
+        h1 = min(h, r1 + radius)
+        s = _strip_ssim(a[h0:h1], b[h0:h1], gaussian, data_range)[r0 - h0 : r0 - h0 + (r1 - r0)]
+        if smap is not None:
+            smap[r0:r1] = s
+        c0 = max(r0, pad)
+        c1 = min(r1, h - pad)
+        if c1 > c0:
+            total += float(s[c0 - r0 : c1 - r0, pad : w - pad].sum(dtype=np.float64))
+
+    score = total / float((h - 2 * pad) * (w - 2 * pad))
+    if not full:
+        return score
+    if smap.shape != out_shape:
+        smap = cv2.resize(smap, (out_shape[1], out_shape[0]), interpolation=cv2.INTER_LINEAR)
+    return score, smap
+
+
+def diff_map(smap: np.ndarray) -> np.ndarray:
+    """uint8 difference image from an SSIM map: 0 = identical, 255 = maximally different."""
+    diff = 1.0 - smap
+    diff *= 255.0
+    np.clip(diff, 0, 255, out=diff)
+    return diff.astype(np.uint8)
+
+
+if __name__ == "__main__":  # agreement check against scikit-image
+    import time
+
+    from skimage.metrics import structural_similarity
+
+    from .synthetic import synthetic_certificate
+
+    page = cv2.cvtColor(synthetic_certificate(), cv2.COLOR_BGR2GRAY)
+    rng = np.random.default_rng(0)
+    noisy = np.clip(page.astype(np.int16) + rng.normal(0, 12, page.shape), 0, 255).astype(np.uint8)
+    edited = page.copy()
+    cv2.putText(edited, "EDITED", (300, 700), cv2.FONT_HERSHEY_SIMPLEX, 2.0, 0, 4)
+    shifted = np.roll(page, 3, axis=1)
+    cases = {"identical": page, "noise": noisy, "edit": edited, "shift": shifted}
+    worst_score = worst_map = 0.0
+    for name, other in cases.items():
+        for crop in (np.s_[:, :], np.s_[90:330, 950:1150], np.s_[1300:1500, 800:1200]):
+            x, y = page[crop], other[crop]
+            t0 = time.perf_counter()
+            ref_score, ref_map = structural_similarity(x, y, full=True)
+            t1 = time.perf_counter()
+            score, smap = ssim(x, y, full=True)
+            t2 = time.perf_counter()
+            d_score = abs(score - ref_score)
+            d_map = float(np.abs(smap - ref_map).max())
+            worst_score, worst_map = max(worst_score, d_score), max(worst_map, d_map)
+            print(
+                f"{name:9s} {str(x.shape):12s} skimage={ref_score:.6f} ours={score:.6f} "
+                f"|d|={d_score:.2e} map|d|max={d_map:.2e} t_skimage={t1-t0:.3f}s t_ours={t2-t1:.3f}s"
+            )
+        g_ref = structural_similarity(page, other, gaussian_weights=True, sigma=1.5, use_sample_covariance=False)
+        g_ours = ssim(page, other, gaussian=True)
+        worst_score = max(worst_score, abs(g_ours - g_ref))
+        print(f"{name:9s} gaussian  skimage={g_ref:.6f} ours={g_ours:.6f} |d|={abs(g_ours - g_ref):.2e}")
+    ok = worst_score < 1e-5 and worst_map < 1e-4
+    print(f"max |score diff|={worst_score:.2e} max |map diff|={worst_map:.2e} -> {'OK' if ok else 'MISMATCH'}")
+    raise SystemExit(0 if ok else 1)
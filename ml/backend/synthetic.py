@@ -0,0 +1,116 @@
+from typing import Tuple
+
+import cv2
+import numpy as np
+
+# Synthetic certificate pages for warm-up and benchmarking. Geometry is laid out for a
+# US-letter page at 150 DPI (1275 x 1650) and scaled to the requested DPI.
+BASE_DPI = 150
+PAGE_INCHES = (8.5, 11.0)
+
+
+def page_size(dpi: int) -> Tuple[int, int]:
+    """(width, height) in pixels of a letter page at `dpi`."""
+    return int(round(PAGE_INCHES[0] * dpi)), int(round(PAGE_INCHES[1] * dpi))
+
+
+def _portrait() -> np.ndarray:
+    # A real face crop (bundled with scikit-image) so the Haar detector has something to find
+    from skimage.data import astronaut
+
+    rgb = astronaut()[20:260, 130:330]
+    return cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+
+
+def synthetic_certificate(dpi: int = BASE_DPI, rows: int = 25) -> np.ndarray:
+    """
+    Render a deterministic certificate page (BGR uint8) with a title, text rows,
+    a portrait photo, a red circular seal and a blue signature stroke.
+    """
+    width, height = page_size(BASE_DPI)
+    img = np.full((height, width, 3), 250, np.uint8)
+    cv2.rectangle(img, (40, 40), (width - 40, height - 40), (30, 30, 30), 4)
+    cv2.putText(img, "UNIVERSITY TRANSCRIPT", (250, 180), cv2.FONT_HERSHEY_DUPLEX, 1.8, (10, 10, 10), 3)
+    for i in range(rows):
+        text = f"Line {i}: Course CS{100 + i}  Grade A  Credits 4"
+        cv2.putText(img, text, (120, 300 + i * 40), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (20, 20, 20), 2)
+
+    # photo
+    img[90:330, 950:1150] = _portrait()
+    cv2.rectangle(img, (948, 88), (1152, 332), (60, 60, 60), 2)
+
+    # seal
+    cv2.circle(img, (300, 1400), 110, (30, 30, 200), 6)
+    cv2.circle(img, (300, 1400), 80, (30, 30, 200), 3)
+    cv2.putText(img, "SEAL", (250, 1410), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (30, 30, 200), 3)
+
+    # signature
+    pts = np.array([[850 + i * 4, 1400 + int(30 * np.sin(i / 5.0))] for i in range(80)], np.int32)
+    cv2.polylines(img, [pts], False, (120, 40, 10), 3)
+
+    if dpi != BASE_DPI:
+        img = cv2.resize(img, page_size(dpi), interpolation=cv2.INTER_CUBIC)
+    return img
+
+
+def _s(v: float, dpi: int) -> int:
+    return int(round(v * dpi / BASE_DPI))
+
+
+def _tamper_text(img: np.ndarray, dpi: int) -> None:
+    # Overwrite one grade: blank a text row and redraw it with different content
+    cv2.rectangle(img, (_s(110, dpi), _s(300 + 5 * 40 - 28, dpi)), (_s(1150, dpi), _s(300 + 5 * 40 + 10, dpi)), (250, 250, 250), -1)
+    cv2.putText(img, "Line 5: Course CS105  Grade A+ Credits 6", (_s(120, dpi), _s(300 + 5 * 40, dpi)),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.9 * dpi / BASE_DPI, (20, 20, 20), max(1, _s(2, dpi)))
+
+
+def _tamper_photo(img: np.ndarray, dpi: int) -> None:
+    # Swap the portrait for a different face region
+    y0, y1, x0, x1 = _s(90, dpi), _s(330, dpi), _s(950, dpi), _s(1150, dpi)
+    from skimage.data import astronaut
+
+    other = cv2.cvtColor(astronaut()[200:440, 280:480], cv2.COLOR_RGB2BGR)
+    img[y0:y1, x0:x1] = cv2.resize(other, (x1 - x0, y1 - y0))
+
+
+def _tamper_seal(img: np.ndarray, dpi: int) -> None:
+    # Remove the seal
+    c, r = (_s(300, dpi), _s(1400, dpi)), _s(125, dpi)
+    cv2.circle(img, c, r, (250, 250, 250), -1)
+
+
+def _tamper_signature(img: np.ndarray, dpi: int) -> None:
+    # Replace the signature with a different stroke
+    cv2.rectangle(img, (_s(840, dpi), _s(1360, dpi)), (_s(1180, dpi), _s(1440, dpi)), (250, 250, 250), -1)
+    pts = np.array([[_s(850 + i * 4, dpi), _s(1400 + 25 * np.cos(i / 3.0), dpi)] for i in range(80)], np.int32)
+    cv2.polylines(img, [pts], False, (120, 40, 10), max(1, _s(3, dpi)))
+
+
+def _rescan(img: np.ndarray, dpi: int) -> None:
+    # Benign re-capture: slight rotation, blur and sensor noise; no content change
+    h, w = img.shape[:2]
+    m = cv2.getRotationMatrix2D((w / 2, h / 2), 0.4, 1.0)
+    warped = cv2.warpAffine(img, m, (w, h), flags=cv2.INTER_LINEAR, borderValue=(250, 250, 250))
+    warped = cv2.GaussianBlur(warped, (3, 3), 0)
+    noise = np.random.default_rng(0).normal(0, 3, warped.shape)
+    img[:] = np.clip(warped.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+
+
+# Variant name -> (in-place edit, whether the full pipeline is expected to flag it)
+VARIANTS = {
+    "identical": (None, False),
+    "rescan": (_rescan, None),  # expectation not fixed: depends on thresholds, tracked by baseline
+    "text": (_tamper_text, True),
+    "photo": (_tamper_photo, True),
+    "seal": (_tamper_seal, True),
+    "signature": (_tamper_signature, True),
+}
+
+
+def variant(page: np.ndarray, name: str, dpi: int = BASE_DPI) -> np.ndarray:
+    """A copy of a synthetic page with one controlled edit (see VARIANTS)."""
+    edit, _ = VARIANTS[name]
+    out = page.copy()
+    if edit is not None:
+        edit(out, dpi)
+    return out
@@ -0,0 +1,78 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict
+
+from .context import PageImage
+
+
+def hash_key(pdf_sha256: str, dpi: int, page: int = 0) -> str:
+    """Cache key for a rendered template page: content hash (or registered template id) plus render settings."""
+    return f"{pdf_sha256}:dpi={dpi}:page={page}"
+
+
+class TemplateCache:
+    """
+    Memory-bounded LRU of rendered template pages.
+
+    Entries are PageImage objects, so every feature a model memoizes on the
+    template (ORB descriptors, face boxes, seal circles, signature box, OCR text)
+    is kept alongside the raster and reused by later requests. Sizes are
+    re-measured on each access because features are filled in lazily.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, PageImage]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_create(self, key: str, create: Callable[[], PageImage]) -> PageImage:
+        with self._lock:
+            page = self._entries.get(key)
+            if page is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                self._evict()
+                return page
+            self.misses += 1
+
+        # Render outside the lock so one slow template doesn't block cache hits
+        page = create()
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is not None:
+                return existing
+            self._entries[key] = page
+            self._evict()
+        return page
+
+    def _evict(self) -> None:
+        # Never evict the most recently used entry; it is in use by the caller
+        total = sum(p.nbytes() for p in self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            _, page = self._entries.popitem(last=False)
+            total -= page.nbytes()
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(p.nbytes() for p in self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+template_cache = TemplateCache(int(float(os.environ.get("ML_TEMPLATE_CACHE_MB", "256")) * 1024 * 1024))
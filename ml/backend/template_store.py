@@ -0,0 +1,228 @@
+"""
+On-disk store of registered templates.
+
+An original is registered once (POST /templates): its first page is rendered,
+every template-side feature the models use is computed by verifying the page
+against an identical copy, and the result is written to
+ML_TEMPLATE_STORE_DIR/<sha256 of the PDF>/:
+
+    image.npy       the rendered BGR raster
+    NN-<key>.npy    memoized feature arrays (gray view, ORB keypoints and
+                    descriptors per alignment level, face boxes, seal circles and
+                    descriptors, signature crop)
+    meta.json       manifest: render DPI, pipeline version, scalar features
+                    (digest, perceptual hash, signature box) and template OCR text
+    original.pdf    the source, so a stale entry can be rebuilt in place
+
+Loading memory-maps every array read-only, so all worker processes on a host
+share one copy through the OS page cache and a restart costs neither rendering
+nor feature extraction. Entries are written to a temporary directory and
+renamed into place, so readers never see a half-written template.
+"""
+
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from . import DATA_DIR, deadline, ocr
+from .context import DocumentPair, PageImage
+from .features import perceptual_hash
+from .main import verify_pair
+from .result_cache import pipeline_version
+
+STORE_DIR = os.environ.get("ML_TEMPLATE_STORE_DIR", os.path.join(DATA_DIR, "template_store"))
+FORMAT_VERSION = 2
+
+# Views that are cheap to recompute, or only feed features that are stored anyway
+_SKIP_PREFIXES = ("hsv", "edges", "gray@")
+_ID = re.compile(r"^[0-9a-f]{64}$")
+
+
+def valid_id(template_id: str) -> bool:
+    """Template ids are the lowercase hex SHA-256 of the original PDF."""
+    return bool(_ID.match(template_id or ""))
+
+
+def _path(template_id: str, *parts: str) -> str:
+    if not valid_id(template_id):
+        raise ValueError(f"Invalid template id: {template_id!r}")
+    return os.path.join(STORE_DIR, template_id, *parts)
+
+
+def _encode(value: Any, name: str, out_dir: str) -> Dict[str, Any] | None:
+    """Manifest entry for one memoized value (arrays saved next to it), or None to skip it."""
+
+    def save(arr: np.ndarray, suffix: str = "") -> str:
+        fname = f"{name}{suffix}.npy"
+        np.save(os.path.join(out_dir, fname), np.ascontiguousarray(arr))
+        return fname
+
+    if isinstance(value, np.ndarray):
+        return {"kind": "array", "file": save(value)}
+    if isinstance(value, tuple) and len(value) == 2 and isinstance(value[0], np.ndarray):
+        # ORB (points, descriptors); descriptors are None on featureless pages
+        des = value[1]
+        return {"kind": "pair", "files": [save(value[0], "-a"), save(des, "-b") if des is not None else None]}
+    if isinstance(value, list) and all(isinstance(b, tuple) and len(b) == 4 for b in value):
+        return {"kind": "boxes", "file": save(np.array(value, np.int32).reshape(-1, 4))}
+    if isinstance(value, tuple) and all(isinstance(v, (int, np.integer)) for v in value):
+        return {"kind": "tuple", "value": [int(v) for v in value]}
+    if value is None or isinstance(value, (str, int, float)):
+        return {"kind": "json", "value": value}
+    return None
+
+
+def _decode(template_dir: str, spec: Dict[str, Any]) -> Any:
+    def load(fname: str) -> np.ndarray:
+        return np.load(os.path.join(template_dir, fname), mmap_mode="r")
+
+    kind = spec["kind"]
+    if kind == "array":
+        return load(spec["file"])
+    if kind == "pair":
+        a, b = spec["files"]
+        return load(a), (load(b) if b is not None else None)
+    if kind == "boxes":
+        return [tuple(int(v) for v in row) for row in load(spec["file"])]
+    if kind == "tuple":
+        return tuple(spec["value"])
+    return spec["value"]
+
+
+def info(template_id: str) -> Dict[str, Any] | None:
+    """The stored manifest, or None if the template is not registered."""
+    try:
+        with open(_path(template_id, "meta.json")) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def is_current(meta: Dict[str, Any] | None, dpi: int) -> bool:
+    """Stored features are only reused for the same render DPI, format and pipeline settings."""
+    return (
+        meta is not None
+        and meta.get("format") == FORMAT_VERSION
+        and meta.get("dpi") == dpi
+        and meta.get("pipeline") == pipeline_version()
+    )
+
+
+def describe(meta: Dict[str, Any], dpi: int) -> Dict[str, Any]:
+    """Public summary of a manifest; `current` says whether it is reused as-is at `dpi`."""
+    return {
+        "template_id": meta["template_id"],
+        "dpi": meta["dpi"],
+        "shape": meta["shape"],
+        "pipeline": meta["pipeline"],
+        "registered_at": meta["created"],
+        "features": sorted(meta["features"]),
+        "ocr_words": len(meta.get("ocr", [])),
+        "bytes": meta.get("bytes", 0),
+        "current": is_current(meta, dpi),
+    }
+
+
+def original_pdf(template_id: str) -> bytes | None:
+    try:
+        with open(_path(template_id, "original.pdf"), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def load(template_id: str, dpi: int) -> PageImage | None:
+    """Memory-mapped template page with every stored feature pre-seeded, or None if absent or stale."""
+    meta = info(template_id)
+    if not is_current(meta, dpi):
+        return None
+    template_dir = _path(template_id)
+    page = PageImage(image=np.load(os.path.join(template_dir, "image.npy"), mmap_mode="r"))
+    for key, spec in meta["features"].items():
+        page.seed(key, _decode(template_dir, spec))
+    ocr.seed(page, meta.get("ocr", []))
+    return page
+
+
+def _precompute(page: PageImage) -> None:
+    # Verifying against an identical copy memoizes exactly the template-side features a
+    # real verification uses (not tiered: the digest check would stop it before the models).
+    # Outside the calling request's deadline, which could downgrade, skip or cancel stages
+    # whose results every later request would then reuse
+    with deadline.within(None):
+        verify_pair(DocumentPair(page, PageImage(image=page.image)), workers=1, tiered=False)
+    page.digest
+    perceptual_hash(page)
+
+
+def _publish(tmp_dir: str, final_dir: str) -> None:
+    # rename() is atomic; a previous (stale) entry is moved aside first. Processes that
+    # still map its files keep reading them until they drop the old page.
+    old = None
+    if os.path.isdir(final_dir):
+        old = f"{final_dir}.old-{os.getpid()}-{time.time_ns()}"
+        os.rename(final_dir, old)
+    try:
+        os.rename(tmp_dir, final_dir)
+    except OSError:
+        # Another process published the same template first; keep theirs
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    if old is not None:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def register(template_id: str, pdf_bytes: bytes, image: np.ndarray, dpi: int) -> PageImage:
+    """Compute and persist the features of a rendered original; returns the stored (mapped) page."""
+    page = PageImage(image=image)
+    _precompute(page)
+
+    os.makedirs(STORE_DIR, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=f".{template_id}-", dir=STORE_DIR)
+    try:
+        os.chmod(tmp_dir, 0o755)  # mkdtemp is owner-only; workers may run as another user
+        np.save(os.path.join(tmp_dir, "image.npy"), np.ascontiguousarray(image))
+        features: Dict[str, Any] = {}
+        for i, (key, value) in enumerate(sorted(page.memoized().items())):
+            if key.startswith(_SKIP_PREFIXES):
+                continue
+            spec = _encode(value, f"{i:02d}-{re.sub(r'[^A-Za-z0-9_.-]', '_', key)}", tmp_dir)
+            if spec is not None:
+                features[key] = spec
+        with open(os.path.join(tmp_dir, "original.pdf"), "wb") as f:
+            f.write(pdf_bytes)
+        meta = {
+            "format": FORMAT_VERSION,
+            "template_id": template_id,
+            "dpi": dpi,
+            "shape": list(image.shape),
+            "pipeline": pipeline_version(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "features": features,
+            "ocr": ocr.cached_words(page),
+        }
+        meta["bytes"] = sum(os.path.getsize(os.path.join(tmp_dir, f)) for f in os.listdir(tmp_dir))
+        # The manifest goes last: a directory without one is never loaded
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump(meta, f)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    _publish(tmp_dir, _path(template_id))
+    return load(template_id, dpi) or page
+
+
+def template_ids() -> List[str]:
+    try:
+        return sorted(d for d in os.listdir(STORE_DIR) if valid_id(d))
+    except FileNotFoundError:
+        return []
+
+
+def stats() -> Dict[str, Any]:
+    return {"dir": STORE_DIR, "templates": len(template_ids())}
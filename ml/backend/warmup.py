@@ -0,0 +1,49 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from . import main, multipage, ocr, registry
+from .context import DocumentPair
+from .main import verify_pair
+from .synthetic import synthetic_certificate
+
+
+def warm_up() -> float:
+    """
+    Preload the detector registry on this thread and run one full verification on a
+    synthetic page pair, so lazy imports, OpenCV initialisation and per-thread
+    detectors are paid for before real traffic arrives. Returns elapsed seconds.
+    """
+    t0 = time.perf_counter()
+    registry.preload()
+    page = synthetic_certificate()
+    # Not tiered: the identical copy would otherwise stop at the digest check
+    verify_pair(DocumentPair.from_arrays(page, page.copy()), tiered=False)
+    return time.perf_counter() - t0
+
+
+def _on_every_thread(pool: ThreadPoolExecutor, threads: int, fn: Callable[[], None]) -> None:
+    # The barrier holds each call until all of them run at once, so each gets its own thread
+    barrier = threading.Barrier(threads)
+
+    def call() -> None:
+        barrier.wait(timeout=60)
+        fn()
+
+    for future in [pool.submit(call) for _ in range(threads)]:
+        future.result()
+
+
+def warm_pools() -> None:
+    """
+    Preload per-thread state on every thread of the shared model (ML_MODEL_WORKERS > 1),
+    page and OCR pools. `warm_up` only reaches the threads its one verification happens
+    to use; these pools are process-wide, so this runs once per process.
+    """
+    model_workers = main._default_workers()
+    if model_workers > 1:
+        _on_every_thread(main._model_pool(model_workers), model_workers, registry.preload)
+    _on_every_thread(multipage._pool(), multipage.PAGE_WORKERS, registry.preload)
+    if ocr.ocr_available():
+        _on_every_thread(ocr._worker_pool(), ocr.OCR_WORKERS, ocr.preload)
@@ -0,0 +1,488 @@
+"""
+Process-pool serving mode (ML_WORKER_PROCESSES > 0).
+
+The server process keeps HTTP, admission and the result cache; verifications run
+in long-lived worker processes so models are not serialised by the GIL. Each
+worker is pinned to one core (ML_WORKER_PIN), caps OpenCV at
+ML_WORKER_CV2_THREADS threads, warms up once, and is replaced after
+ML_WORKER_MAX_JOBS jobs or once its resident memory passes ML_WORKER_MAX_RSS_MB.
+
+Template rasters are never pickled. A registered template (template_store) is
+memory-mapped by each worker straight from disk; any other template is rendered
+once in the server process into a `multiprocessing.shared_memory` segment that
+every worker maps read-only. Only the upload's PDF bytes travel to the worker,
+which renders it locally, and only the result dict (plus the worker's metric
+deltas) travels back. A request's deadline goes along as an absolute time; each
+worker has a cancel flag the server sets when that request's client disconnects.
+
+Nothing waits on a worker forever: a request that finds no idle worker within
+ML_WORKER_WAIT_S, or whose worker does not answer within ML_WORKER_JOB_TIMEOUT_S
+(the worker is then killed and replaced), gets a 503. A worker that fails to
+start is retried with exponential backoff.
+"""
+
+import multiprocessing as mp
+import os
+import queue
+import threading
+from collections import OrderedDict
+from multiprocessing import shared_memory
+from multiprocessing.connection import Connection
+from typing import Any, Callable, Dict, List, Tuple
+
+import cv2
+import numpy as np
+from fastapi import HTTPException
+
+from . import deadline, metrics, template_store
+from .context import PageImage
+
+PROCESSES = max(0, int(os.environ.get("ML_WORKER_PROCESSES", "0")))
+CV2_THREADS = max(1, int(os.environ.get("ML_WORKER_CV2_THREADS", "1")))
+PIN = os.environ.get("ML_WORKER_PIN", "1").lower() not in ("0", "false", "no")
+MAX_JOBS = int(os.environ.get("ML_WORKER_MAX_JOBS", "500"))  # 0: never recycle by count
+MAX_RSS_MB = float(os.environ.get("ML_WORKER_MAX_RSS_MB", "0"))  # 0: no memory limit
+SHM_MAX_BYTES = int(float(os.environ.get("ML_WORKER_SHM_MB", "512")) * 1024 * 1024)
+WAIT_S = float(os.environ.get("ML_WORKER_WAIT_S", "30"))  # longest wait for an idle worker
+JOB_TIMEOUT_S = float(os.environ.get("ML_WORKER_JOB_TIMEOUT_S", "300"))  # a worker silent this long is killed
+START_TIMEOUT_S = 120.0  # spawn plus warm-up
+SPAWN_BACKOFF_MAX_S = 60.0
+ATTACH_ENTRIES = 32  # template pages a worker keeps mapped (with their features)
+
+
+class WorkerCrashed(RuntimeError):
+    pass
+
+
+class WorkerUnavailable(HTTPException):
+    """No worker process could run the job in time; retryable, so answered with 503."""
+
+    def __init__(self, detail: str):
+        super().__init__(status_code=503, detail=detail, headers={"Retry-After": "30"})
+
+
+class SharedPage:
+    """Picklable handle to a template page a worker can map without copying."""
+
+    def __init__(
+        self,
+        key: str,
+        store_id: str | None = None,
+        dpi: int = 0,
+        shm: str | None = None,
+        shape: Tuple[int, ...] = (),
+        dtype: str = "uint8",
+    ):
+        self.key = key
+        self.store_id = store_id
+        self.dpi = dpi
+        self.shm = shm
+        self.shape = shape
+        self.dtype = dtype
+
+
+def _rss_mb() -> float:
+    # Current (not peak) resident size; recycling must see memory that is released again
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# ---- server side: shared-memory template rasters ---------------------------------------
+
+class _Segment:
+    def __init__(self, shm: shared_memory.SharedMemory, ref: SharedPage):
+        self.shm = shm
+        self.ref = ref
+        self.pins = 0  # refs handed out whose jobs have not finished (workers may not have mapped it yet)
+        self.evicted = False
+
+
+_published: "OrderedDict[str, _Segment]" = OrderedDict()
+_segments: Dict[str, _Segment] = {}  # by shm name, including evicted ones still pinned
+_published_lock = threading.Lock()
+
+
+def _unlink(segment: _Segment) -> None:
+    # Unlinking only removes the name; workers that already map the segment keep it until they drop it
+    del _segments[segment.shm.name]
+    segment.shm.close()
+    segment.shm.unlink()
+
+
+def publish(key: str, render: Callable[[], np.ndarray]) -> SharedPage:
+    """
+    Shared-memory copy of a template raster, rendered on first use and kept in an LRU.
+    The returned ref is pinned: pass it to `release` once the jobs using it are done, so
+    eviction never unlinks a segment a worker has yet to map.
+    """
+    with _published_lock:
+        segment = _published.get(key)
+        if segment is not None:
+            _published.move_to_end(key)
+            segment.pins += 1
+            return segment.ref
+    image = render()
+    with _published_lock:
+        segment = _published.get(key)
+        if segment is not None:
+            segment.pins += 1
+            return segment.ref
+        shm = shared_memory.SharedMemory(create=True, size=max(1, image.nbytes))
+        np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf)[...] = image
+        segment = _Segment(shm, SharedPage(key, shm=shm.name, shape=tuple(image.shape), dtype=str(image.dtype)))
+        segment.pins = 1
+        _published[key] = segment
+        _segments[shm.name] = segment
+        total = sum(s.shm.size for s in _published.values())
+        while total > SHM_MAX_BYTES and len(_published) > 1:
+            _, old = _published.popitem(last=False)
+            total -= old.shm.size
+            old.evicted = True
+            if old.pins == 0:
+                _unlink(old)
+    return segment.ref
+
+
+def _pin(ref: SharedPage) -> None:
+    with _published_lock:
+        segment = _segments.get(ref.shm) if ref.shm is not None else None
+        if segment is not None:
+            segment.pins += 1
+
+
+def release(ref: SharedPage) -> None:
+    """Unpin a ref from `publish`; an evicted segment is unlinked once its last job is done."""
+    if ref.shm is None:
+        return
+    with _published_lock:
+        segment = _segments.get(ref.shm)
+        if segment is None:
+            return
+        segment.pins -= 1
+        if segment.evicted and segment.pins <= 0:
+            _unlink(segment)
+
+
+def _release_published() -> None:
+    with _published_lock:
+        _published.clear()
+        for segment in list(_segments.values()):
+            _unlink(segment)
+
+
+# ---- worker side ---------------------------------------------------------------------
+
+_attached: "OrderedDict[str, Tuple[shared_memory.SharedMemory | None, PageImage]]" = OrderedDict()
+
+
+def shared_page(ref: SharedPage) -> PageImage:
+    """
+    The template page behind `ref`, mapped (not copied) in this worker. Pages stay
+    attached across jobs, so template features are still computed once per worker.
+    """
+    cache_key = ref.shm or ref.key
+    entry = _attached.get(cache_key)
+    if entry is not None:
+        _attached.move_to_end(cache_key)
+        return entry[1]
+    shm = None
+    if ref.store_id is not None:
+        page = template_store.load(ref.store_id, ref.dpi)
+        if page is None:
+            raise HTTPException(status_code=404, detail=f"Unknown template_id: {ref.store_id}")
+    else:
+        # Spawned workers share the server's resource tracker, which only unlinks at server exit
+        shm = shared_memory.SharedMemory(name=ref.shm)
+        image = np.ndarray(ref.shape, dtype=ref.dtype, buffer=shm.buf)
+        image.flags.writeable = False
+        page = PageImage(image=image)
+    _attached[cache_key] = (shm, page)
+    while len(_attached) > ATTACH_ENTRIES:
+        _, (old, _) = _attached.popitem(last=False)
+        if old is not None:
+            try:
+                old.close()
+            except BufferError:  # a feature still views the buffer; the mapping goes with the process
+                pass
+    return page
+
+
+def _worker_main(conn: Connection, cpu: int | None, warm: bool, cancel_flag: Any) -> None:
+    if cpu is not None:
+        os.sched_setaffinity(0, {cpu})
+    cv2.setNumThreads(CV2_THREADS)
+    if warm:
+        from .warmup import warm_pools, warm_up
+
+        warm_up()
+        warm_pools()
+    metrics.drain()  # warm-up is not traffic
+    conn.send(os.getpid())
+    jobs = 0
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+        if msg is None:
+            break
+        fn, args, limit = msg
+        limited = deadline.Deadline(limit[0], expires=limit[1], cancel_flag=cancel_flag) if limit else None
+        try:
+            with deadline.within(limited):
+                out: Tuple[str, Any] = ("ok", fn(*args))
+        except deadline.Cancelled as e:
+            out = ("cancelled", str(e))
+        except HTTPException as e:
+            out = ("http", (e.status_code, e.detail))
+        except Exception as e:
+            out = ("error", f"{type(e).__name__}: {e}")
+        jobs += 1
+        rss = _rss_mb()
+        recycle = (MAX_JOBS > 0 and jobs >= MAX_JOBS) or (MAX_RSS_MB > 0 and rss >= MAX_RSS_MB)
+        conn.send((out, rss, recycle, metrics.drain()))
+        if recycle:
+            break
+    conn.close()
+
+
+# ---- server side: the pool -------------------------------------------------------------
+
+
+class _Worker:
+    def __init__(self, process: mp.Process, conn: Connection, cpu: int | None, cancel_flag: Any):
+        self.process = process
+        self.conn = conn
+        self.cpu = cpu
+        self.cancel_flag = cancel_flag
+        self.jobs = 0
+        self.rss_mb = 0.0
+
+
+class WorkerPool:
+    """
+    Fixed number of worker processes fed by the server's dispatch threads. `call`
+    blocks the calling thread until an idle worker has run the job.
+    """
+
+    def __init__(self, processes: int, warm: bool = True):
+        self.processes = processes
+        self.warm = warm
+        self._ctx = mp.get_context("spawn")  # no inherited threads, locks or OpenCV state
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._workers: Dict[int, _Worker] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self.recycled = 0
+        self.crashed = 0
+        self.timed_out = 0
+        self.unavailable = 0
+        self.jobs = 0
+        self.spawn_failures = 0
+        self.last_error: str | None = None
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else []
+        self._cores = cores if PIN else []
+
+    def _spawn(self, slot: int, attempt: int = 0) -> None:
+        if self._closed:
+            return
+        cpu = self._cores[slot % len(self._cores)] if self._cores else None
+        parent_conn, child_conn = self._ctx.Pipe()
+        cancel_flag = self._ctx.Event()
+        process = self._ctx.Process(
+            target=_worker_main, args=(child_conn, cpu, self.warm, cancel_flag), name=f"ml-worker-{slot}", daemon=True
+        )
+        try:
+            process.start()
+            child_conn.close()
+            if not parent_conn.poll(START_TIMEOUT_S):
+                raise TimeoutError(f"not ready after {START_TIMEOUT_S:g}s")
+            parent_conn.recv()  # ready
+        except Exception as e:
+            parent_conn.close()
+            if process.is_alive():
+                process.terminate()
+            if self._closed:
+                return
+            with self._lock:
+                self.spawn_failures += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+            # Retry in the background so the slot is not lost for good
+            delay = min(SPAWN_BACKOFF_MAX_S, 2.0**attempt)
+            print(f"[ml] worker {slot} failed to start: {self.last_error}; retrying in {delay:g}s")
+            retry = threading.Timer(delay, self._spawn, args=(slot, attempt + 1))
+            retry.daemon = True
+            retry.start()
+            return
+        worker = _Worker(process, parent_conn, cpu, cancel_flag)
+        with self._lock:
+            if self._closed:
+                parent_conn.send(None)
+                return
+            self._workers[slot] = worker
+        self._idle.put(worker)
+
+    def start(self) -> None:
+        """Start every worker and wait until all of them have warmed up."""
+        threads = [threading.Thread(target=self._spawn, args=(i,), daemon=True) for i in range(self.processes)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if not self._workers:
+            raise RuntimeError(f"No worker process started ({self.last_error})")
+
+    def _replace(self, worker: _Worker) -> None:
+        # Spawn in the background so the caller's response is not held up by the new worker's warm-up
+        with self._lock:
+            slot = next((s for s, w in self._workers.items() if w is worker), None)
+            if slot is not None:
+                del self._workers[slot]
+        worker.conn.close()
+        worker.process.join(timeout=5)
+        if slot is not None and not self._closed:
+            threading.Thread(target=self._spawn, args=(slot,), name="ml-worker-spawn", daemon=True).start()
+
+    def call(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        Run fn(*args) in a worker process under the caller's deadline; fn and args must be
+        picklable. Raises WorkerUnavailable (503) when no worker frees up within WAIT_S or
+        the job outlives JOB_TIMEOUT_S.
+        """
+        # Shared pages stay pinned until the worker is done with them, even if the caller
+        # that published them has already moved on (e.g. a cancelled batch)
+        refs = [a for a in args if isinstance(a, SharedPage)]
+        for ref in refs:
+            _pin(ref)
+        try:
+            return self._call(fn, args)
+        finally:
+            for ref in refs:
+                release(ref)
+
+    def _call(self, fn: Callable[..., Any], args: Tuple[Any, ...]) -> Any:
+        try:
+            worker = self._idle.get(timeout=WAIT_S)
+        except queue.Empty:
+            with self._lock:
+                self.unavailable += 1
+            metrics.ERRORS.inc("worker_unavailable")
+            raise WorkerUnavailable(f"No worker process became available within {WAIT_S:g}s")
+        limited = deadline.current()
+        if limited is not None and limited.cancelled:
+            self._idle.put(worker)
+            raise deadline.Cancelled("Client disconnected")
+        limit = (limited.budget_s, limited.expires) if limited is not None else None
+        # Cleared before sending: a cancel aimed at this worker's previous job may have landed late
+        worker.cancel_flag.clear()
+        unregister = limited.on_cancel(worker.cancel_flag.set) if limited is not None else None
+        try:
+            worker.conn.send((fn, args, limit))
+            if not worker.conn.poll(JOB_TIMEOUT_S):
+                with self._lock:
+                    self.timed_out += 1
+                metrics.ERRORS.inc("worker_timeout")
+                worker.process.kill()
+                self._replace(worker)
+                raise WorkerUnavailable(f"Worker process {worker.process.pid} did not finish within {JOB_TIMEOUT_S:g}s")
+            (status, payload), rss, recycle, worker_metrics = worker.conn.recv()
+        except (EOFError, OSError):
+            self.crashed += 1
+            metrics.ERRORS.inc("worker_crash")
+            self._replace(worker)
+            raise WorkerCrashed(f"Worker process {worker.process.pid} exited during a verification")
+        finally:
+            if unregister is not None:
+                unregister()
+        metrics.merge(worker_metrics)
+        worker.jobs += 1
+        worker.rss_mb = rss
+        with self._lock:
+            self.jobs += 1
+        if recycle:
+            self.recycled += 1
+            self._replace(worker)
+        else:
+            self._idle.put(worker)
+        if status == "cancelled":
+            raise deadline.Cancelled(payload)
+        if status == "http":
+            raise HTTPException(status_code=payload[0], detail=payload[1])
+        if status == "error":
+            raise RuntimeError(payload)
+        return payload
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            workers = list(self._workers.values())
+            self._workers.clear()
+        for w in workers:
+            try:
+                w.conn.send(None)
+            except OSError:
+                pass
+        for w in workers:
+            w.process.join(timeout=5)
+            if w.process.is_alive():
+                w.process.terminate()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            workers: List[Dict[str, Any]] = [
+                {"slot": s, "pid": w.process.pid, "cpu": w.cpu, "jobs": w.jobs, "rss_mb": round(w.rss_mb, 1)}
+                for s, w in sorted(self._workers.items())
+            ]
+        with _published_lock:
+            shared = {
+                "templates": len(_published),
+                "bytes": sum(s.shm.size for s in _segments.values()),
+                "evicted_pinned": len(_segments) - len(_published),
+            }
+        return {
+            "processes": self.processes,
+            "alive": len(workers),
+            "idle": self._idle.qsize(),
+            "jobs": self.jobs,
+            "recycled": self.recycled,
+            "crashed": self.crashed,
+            "timed_out": self.timed_out,
+            "unavailable": self.unavailable,
+            "spawn_failures": self.spawn_failures,
+            "cv2_threads": CV2_THREADS,
+            "max_jobs": MAX_JOBS,
+            "max_rss_mb": MAX_RSS_MB,
+            "shared_memory": shared,
+            "workers": workers,
+        }
+
+
+pool: WorkerPool | None = None
+
+
+def create_pool(warm: bool = True) -> WorkerPool | None:
+    """Install the pool (ML_WORKER_PROCESSES > 0) so jobs queue for it; `pool.start()` launches the workers."""
+    global pool
+    if PROCESSES > 0 and pool is None:
+        pool = WorkerPool(PROCESSES, warm)
+    return pool
+
+
+def stop_pool() -> None:
+    global pool
+    if pool is not None:
+        pool.close()
+        pool = None
+    _release_published()
+
+
+def run(fn: Callable[..., Any], *args: Any) -> Any:
+    """fn(*args) in a worker process when the pool is running, otherwise on the calling thread."""
+    if pool is not None:
+        return pool.call(fn, *args)
+    return fn(*args)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import the service as `backend`, like `python -m backend...` run from ml/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,50 @@
+"""Admission control: a full verification queue answers 503 with Retry-After at once."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import server
+from backend.admission import Overloaded, VerificationExecutor
+
+
+@pytest.fixture
+def full_executor():
+    """One worker, no queue, and its only slot held by a job that waits for the test to finish."""
+    executor = VerificationExecutor(1, 0)
+    release = threading.Event()
+    holder = threading.Thread(target=lambda: asyncio.run(executor.run(release.wait)))
+    holder.start()
+    while executor.stats()["running"] < 1:
+        time.sleep(0.01)
+    yield executor
+    release.set()
+    holder.join()
+
+
+def test_rejects_beyond_capacity(full_executor):
+    with pytest.raises(Overloaded) as e:
+        asyncio.run(full_executor.run(lambda: None))
+    assert e.value.retry_after >= 1
+    assert full_executor.stats()["rejected"] == 1
+
+
+def test_batch_is_admitted_whole_or_not_at_all():
+    executor = VerificationExecutor(1, 2)
+    with pytest.raises(Overloaded):
+        asyncio.run(executor.run_many(lambda: None, [()] * 4))
+    outcomes, _ = asyncio.run(executor.run_many(lambda i: i, [(i,) for i in range(3)]))
+    assert outcomes == [0, 1, 2]
+    assert executor.stats()["queued"] == 0
+
+
+def test_verify_answers_503_with_retry_after(monkeypatch, full_executor):
+    monkeypatch.setattr(server, "verify_executor", full_executor)
+    files = {"original": ("o.pdf", b"%PDF-original"), "uploaded": ("u.pdf", b"%PDF-uploaded")}
+    response = TestClient(server.app).post("/verify", files=files)
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    assert response.json()["queue"]["running"] == 1
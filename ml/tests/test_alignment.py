@@ -0,0 +1,33 @@
+"""Shared alignment: one homography per document pair, reused by every model."""
+
+import numpy as np
+import pytest
+
+from backend import alignment, main
+from backend.context import DocumentPair, PageImage
+from backend.synthetic import synthetic_certificate
+
+
+@pytest.fixture(scope="module")
+def certificate():
+    return synthetic_certificate(100)
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_models_share_one_alignment(monkeypatch, certificate, workers):
+    calls = []
+    align = alignment.align_to_template
+    monkeypatch.setattr(alignment, "align_to_template", lambda *a, **kw: calls.append(1) or align(*a, **kw))
+    pair = DocumentPair(PageImage(image=certificate), PageImage(image=np.roll(certificate, 5, axis=1)))
+    result = main.verify_pair(pair, workers=workers, tiered=False)
+    assert len(calls) == 1
+    assert result["alignment"]["aligned"]
+
+
+def test_template_features_are_reused_across_pairs(certificate):
+    template = PageImage(image=certificate)
+    first = DocumentPair(template, PageImage(image=certificate.copy())).alignment
+    before = template.memoized()["orb:2000"]
+    second = DocumentPair(template, PageImage(image=np.roll(certificate, 3, axis=0))).alignment
+    assert template.memoized()["orb:2000"] is before
+    assert first.aligned and second.aligned
@@ -0,0 +1,103 @@
+"""backend.deadline: partial and inconclusive results when the time budget runs out."""
+
+import threading
+import time
+
+import pytest
+
+from backend import deadline, main, memory, server
+from backend.context import DocumentPair, PageImage
+from backend.multipage import verify_pages
+from backend.synthetic import synthetic_certificate
+
+
+@pytest.fixture(scope="module")
+def certificate():
+    return synthetic_certificate(100)
+
+
+def identical_pair(image) -> DocumentPair:
+    return DocumentPair(PageImage(image=image), PageImage(image=image.copy()))
+
+
+def test_parse_ms():
+    assert deadline.parse_ms(None) is None and deadline.parse_ms("") is None
+    assert deadline.parse_ms("1500").budget_s == 1.5
+    for bad in ("0", "-5", str(deadline.MAX_BUDGET_MS + 1), "soon"):
+        with pytest.raises(ValueError):
+            deadline.parse_ms(bad)
+
+
+def test_spent_budget_is_inconclusive_without_running_models(certificate):
+    limited = deadline.Deadline(0.0)
+    with deadline.within(limited):
+        result = main.verify_pair(identical_pair(certificate))
+    assert result["overall_status"] == "inconclusive" and result["verdict_tier"] == "deadline"
+    assert {result[name]["status"] for name, _ in main.MODELS} == {"inconclusive"}
+    assert limited.skipped == ["verification"] and limited.partial
+
+
+def test_model_that_does_not_fit_is_skipped(monkeypatch, certificate):
+    monkeypatch.setattr(main, "_min_seconds", lambda name: 1000.0 if name == "seal" else 0.0)
+    limited = deadline.Deadline(60.0)
+    with deadline.within(limited):
+        result, _ = server._run_job(False, main.verify_pair, identical_pair(certificate), 1)
+    # The other models still ran and found the copy authentic; the page is only inconclusive
+    assert {name: result[name]["status"] for name, _ in main.MODELS} == {
+        "layout": "authentic",
+        "photo": "authentic",
+        "seal": "inconclusive",
+        "signature": "authentic",
+    }
+    assert result["overall_status"] == "inconclusive"
+    assert result["partial"] is True
+    assert result["deadline"]["skipped"] == ["model.seal"] and result["deadline"]["budget_ms"] == 60000
+
+
+def test_unlimited_run_is_not_partial(certificate):
+    with deadline.within(deadline.Deadline(None)):
+        result, _ = server._run_job(False, main.verify_pair, identical_pair(certificate), 1)
+    assert "partial" not in result and "deadline" not in result
+
+
+def test_pages_without_time_are_inconclusive(certificate):
+    page = PageImage(image=certificate)
+    with deadline.within(deadline.Deadline(0.0)):
+        result = verify_pages(2, 2, lambda i: page, lambda i: page)
+    assert result["overall_status"] == "inconclusive"
+    assert [p["overall_status"] for p in result["pages"]] == ["inconclusive", "inconclusive"]
+
+
+def test_cancelled_request_stops_at_next_stage(certificate):
+    limited = deadline.Deadline(None)
+    limited.cancel()
+    with deadline.within(limited), pytest.raises(deadline.Cancelled):
+        main.verify_pair(identical_pair(certificate))
+
+
+def test_memory_wait_ends_at_the_deadline():
+    pool = memory._Pool(100)
+    held, release = threading.Event(), threading.Event()
+
+    def hold():
+        with pool.reserve(80):
+            held.set()
+            release.wait()
+
+    threading.Thread(target=hold).start()
+    held.wait()
+    try:
+        t0 = time.perf_counter()
+        with deadline.within(deadline.Deadline(0.1)), pool.reserve(50):
+            assert deadline.expired()
+            assert pool.reserved == 80  # entered without a reservation
+        assert time.perf_counter() - t0 < 5
+
+        limited = deadline.Deadline(None)
+        threading.Timer(0.1, limited.cancel).start()
+        with deadline.within(limited), pytest.raises(deadline.Cancelled):
+            with pool.reserve(50):
+                pass
+    finally:
+        release.set()
+    assert pool.stats()["waits"] == 2
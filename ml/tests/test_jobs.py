@@ -0,0 +1,84 @@
+"""backend.jobs: retries with backoff, lease expiry and result TTL of the durable queue."""
+
+import time
+
+import pytest
+
+from backend import jobs
+from backend.jobs import JobQueue, PermanentError, QueueFull
+
+SHORT_S = 0.05
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "RETRY_BASE_S", SHORT_S)
+    return JobQueue(str(tmp_path / "jobs.db"), max_attempts=2, lease_s=SHORT_S, result_ttl_s=SHORT_S, max_queued=2)
+
+
+def inputs(queue: JobQueue, job_id: str):
+    return queue.db.execute("SELECT original, uploaded FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+
+def test_claims_by_priority_then_age(queue):
+    low = queue.submit({}, None, b"u")["job_id"]
+    high = queue.submit({}, None, b"u", priority=5)["job_id"]
+    assert queue.claim()[0] == high
+    assert queue.claim()[0] == low
+    assert queue.claim() is None
+
+
+def test_rejects_beyond_max_queued(queue):
+    queue.submit({}, None, b"u")
+    queue.submit({}, None, b"u")
+    with pytest.raises(QueueFull):
+        queue.submit({}, None, b"u")
+
+
+def test_failed_attempt_is_retried_after_backoff(queue):
+    job_id = queue.submit({"mode": "first"}, b"o", b"u")["job_id"]
+    assert queue.claim() == (job_id, {"mode": "first"}, b"o", b"u")
+    queue.fail(job_id, "RuntimeError: boom")
+    job = queue.get(job_id)
+    assert (job["status"], job["attempts"], job["error"]) == ("queued", 1, "RuntimeError: boom")
+    assert queue.claim() is None  # backing off
+    time.sleep(SHORT_S * 1.5)
+    assert queue.claim()[0] == job_id
+    queue.fail(job_id, "RuntimeError: boom again")
+    job = queue.get(job_id)
+    assert (job["status"], job["attempts"]) == ("failed", 2)
+    assert inputs(queue, job_id) == (None, None)
+
+
+def test_permanent_error_is_not_retried(queue):
+    def handler(params, original, uploaded):
+        raise PermanentError("unreadable PDF")
+
+    job_id = queue.submit({}, None, b"u")["job_id"]
+    assert queue._run_one(handler)
+    job = queue.get(job_id)
+    assert (job["status"], job["attempts"], job["error"]) == ("failed", 1, "unreadable PDF")
+
+
+def test_expired_lease_is_claimed_again_until_attempts_run_out(queue):
+    job_id = queue.submit({}, None, b"u")["job_id"]
+    assert queue.claim()[0] == job_id
+    assert queue.claim() is None  # lease still held
+    time.sleep(SHORT_S * 1.5)
+    assert queue.claim()[0] == job_id  # runner died: taken over
+    time.sleep(SHORT_S * 1.5)
+    assert queue.claim() is None
+    job = queue.get(job_id)
+    assert (job["status"], job["attempts"]) == ("failed", 2)
+
+
+def test_result_expires_after_ttl(queue):
+    job_id = queue.submit({}, b"o", b"u")["job_id"]
+    assert queue._run_one(lambda params, original, uploaded: {"overall_status": "authentic"})
+    job = queue.get(job_id)
+    assert job["status"] == "done" and job["result"] == {"overall_status": "authentic"}
+    assert inputs(queue, job_id) == (None, None)
+    time.sleep(SHORT_S * 1.5)
+    assert queue.get(job_id) is None
+    assert queue.purge() == 1
+    assert queue.stats()["done"] == 0
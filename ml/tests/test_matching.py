@@ -0,0 +1,74 @@
+"""backend.matching: every backend finds the same correspondences on the same pages."""
+
+import numpy as np
+import pytest
+
+from backend import alignment, matching
+from backend.context import PageImage
+from backend.synthetic import synthetic_certificate
+
+
+@pytest.fixture(scope="module")
+def pages():
+    page = synthetic_certificate(100)
+    return PageImage(image=page), PageImage(image=np.roll(page, (7, 11), axis=(0, 1)))
+
+
+@pytest.fixture(scope="module")
+def features(pages):
+    template, upload = pages
+    return alignment._orb_features(upload), alignment._orb_features(template)
+
+
+@pytest.mark.parametrize("backend", matching.BACKENDS)
+def test_matches_are_consistent_arrays(features, backend):
+    (_, des_u), (_, des_t) = features
+    found = matching.match(des_u, des_t, backend)
+    assert found.backend == backend and len(found) > 100
+    assert found.query.shape == found.train.shape == found.distance.shape
+    assert found.query.max() < len(des_u) and found.train.max() < len(des_t)
+    # Reported distances are the true Hamming distances of the matched descriptors
+    bits = np.unpackbits(des_u[found.query] ^ des_t[found.train], axis=1).sum(axis=1)
+    assert np.array_equal(bits, found.distance.astype(int))
+
+
+@pytest.mark.parametrize("backend", ["knn", "flann"])
+def test_ratio_backends_find_what_brute_force_finds(features, backend):
+    (pts_u, des_u), (pts_t, des_t) = features
+    hamming = np.unpackbits(des_u[:, None, :] ^ des_t[None, :, :], axis=2).sum(axis=2)
+
+    def share_on_shift(found: matching.Matches) -> float:
+        # Matches agreeing with the known (11, 7) px shift between the pages
+        return float(np.mean(np.linalg.norm(pts_u[found.query] - (11, 7) - pts_t[found.train], axis=1) <= 2))
+
+    exact = matching.match(des_u, des_t, "bf")
+    found = matching.match(des_u, des_t, backend)
+    # Nearest neighbours (FLANN-LSH is approximate), and about as many of them right as brute force
+    nearest = found.distance == hamming[found.query].min(axis=1)
+    assert nearest.mean() >= (1.0 if backend == "knn" else 0.9)
+    assert abs(len(found) - len(exact)) <= 0.1 * len(exact)
+    assert share_on_shift(found) >= share_on_shift(exact) - 0.05
+
+
+@pytest.mark.parametrize("backend", matching.BACKENDS)
+def test_every_backend_recovers_the_same_homography(monkeypatch, pages, backend):
+    monkeypatch.setattr(matching, "MATCHER", backend)
+    template, upload = pages
+    result = alignment.align_to_template(upload, template)
+    assert result.aligned and result.info()["matcher"] == backend
+    expected = np.array([[1, 0, -11], [0, 1, -7], [0, 0, 1]], np.float64)
+    assert np.allclose(result.homography / result.homography[2, 2], expected, atol=0.5)
+
+
+@pytest.mark.parametrize("backend", ["knn", "flann"])
+def test_too_few_train_descriptors_fall_back_to_brute_force(features, backend):
+    (_, des_u), (_, des_t) = features
+    found = matching.match(des_u, des_t[:1], backend)
+    assert found.backend == "bf" and len(found) == 1
+
+
+@pytest.mark.parametrize("backend", matching.BACKENDS)
+def test_no_descriptors_match_nothing(features, backend):
+    (_, des_u), _ = features
+    assert len(matching.match(des_u, None, backend)) == 0
+    assert len(matching.match(des_u[:0], des_u, backend)) == 0
@@ -0,0 +1,74 @@
+"""backend.multipage: lazy page rendering and the short-circuit on a tampered page."""
+
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from backend import multipage
+from backend.context import PageImage
+
+
+@pytest.fixture
+def pages(monkeypatch):
+    """Page callables that record what was rendered, and a verify_pair stub tampering `tampered` pages."""
+    rendered, verified, tampered = [], [], set()
+    lock = threading.Lock()
+
+    def page(i: int) -> PageImage:
+        def load():
+            with lock:
+                rendered.append(i)
+            return np.full((4, 4, 3), i, np.uint8)
+
+        return PageImage(loader=load)
+
+    def verify_pair(pair):
+        i = int(pair.original.image[0, 0, 0])
+        pair.uploaded.image  # renders the upload, as the models would
+        with lock:
+            verified.append(i)
+        if i in tampered:
+            return {"overall_status": "tampered"}
+        time.sleep(0.05)  # later pages are still queued when page 0 fails
+        return {"overall_status": "authentic"}
+
+    monkeypatch.setattr(multipage, "verify_pair", verify_pair)
+    return page, rendered, verified, tampered
+
+
+def test_all_pages_verified_when_authentic(pages):
+    page, rendered, verified, _ = pages
+    result = multipage.verify_pages(3, 3, page, page)
+    assert result["overall_status"] == "authentic" and not result["short_circuited"]
+    assert [p["page"] for p in result["pages"]] == [0, 1, 2]
+    assert sorted(verified) == [0, 1, 2] and len(rendered) == 6
+
+
+def test_tampered_page_skips_pages_not_started(pages):
+    page, rendered, verified, tampered = pages
+    tampered.add(0)
+    result = multipage.verify_pages(8, 8, page, page)
+    assert result["overall_status"] == "tampered" and result["short_circuited"]
+    statuses = [p["overall_status"] for p in result["pages"]]
+    assert statuses[0] == "tampered" and "skipped" in statuses
+    # Skipped pages were never rendered
+    skipped = {i for i, s in enumerate(statuses) if s == "skipped"}
+    assert not skipped & set(rendered) and not skipped & set(verified)
+
+
+def test_full_report_verifies_every_page(pages):
+    page, _, verified, tampered = pages
+    tampered.add(0)
+    result = multipage.verify_pages(4, 4, page, page, full_report=True)
+    assert result["overall_status"] == "tampered" and not result["short_circuited"]
+    assert sorted(verified) == [0, 1, 2, 3]
+
+
+def test_page_count_mismatch_renders_nothing(pages):
+    page, rendered, _, _ = pages
+    result = multipage.verify_pages(2, 3, page, page)
+    assert result["overall_status"] == "tampered" and result["short_circuited"]
+    assert [p["overall_status"] for p in result["pages"]] == ["skipped", "skipped", "tampered"]
+    assert rendered == []
@@ -0,0 +1,61 @@
+"""backend.result_cache: keys, the in-memory LRU and the SQLite tier."""
+
+from backend.result_cache import ResultCache, result_key
+
+O, U = "a" * 64, "b" * 64
+
+
+def test_key_covers_documents_dpi_mode_and_config(monkeypatch):
+    monkeypatch.delenv("ML_MATCHER", raising=False)
+    base = result_key(O, U, 200)
+    assert base == result_key(O, U, 200, "first")
+    assert len({base, result_key(U, O, 200), result_key(O, U, 300), result_key(O, U, 200, "pages")}) == 4
+    monkeypatch.setenv("ML_MATCHER", "flann")
+    assert result_key(O, U, 200) != base
+
+
+def test_hit_returns_a_fresh_copy():
+    cache = ResultCache(4)
+    cache.put("k", {"overall_status": "authentic"}, 12.5)
+    result, compute_ms, tier = cache.get("k")
+    assert (result, compute_ms, tier) == ({"overall_status": "authentic"}, 12.5, "memory")
+    result["cache"] = {"hit": True}
+    assert "cache" not in cache.get("k")[0]
+
+
+def test_evicts_least_recently_used():
+    cache = ResultCache(2)
+    cache.put("a", {"n": 1}, 1)
+    cache.put("b", {"n": 2}, 1)
+    cache.get("a")  # "b" is now the oldest
+    cache.put("c", {"n": 3}, 1)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["entries"] == 2
+
+
+def test_disk_tier_survives_restart_and_is_promoted(tmp_path):
+    db = str(tmp_path / "results.db")
+    ResultCache(2, db).put("k", {"overall_status": "tampered"}, 30.0)
+    restarted = ResultCache(2, db)
+    assert restarted.get_memory("k") is None
+    assert restarted.get("k") == ({"overall_status": "tampered"}, 30.0, "disk")
+    assert restarted.get("k")[2] == "memory"
+    stats = restarted.stats()
+    assert (stats["hits"], stats["disk_hits"], stats["misses"]) == (2, 1, 0)
+
+
+def test_memory_only_put_leaves_disk_to_the_caller(tmp_path):
+    db = str(tmp_path / "results.db")
+    cache = ResultCache(2, db)
+    encoded = cache.put("k", {"n": 1}, 5.0, disk=False)
+    assert ResultCache(2, db).get("k") is None
+    cache.put_disk("k", encoded, 5.0)
+    assert ResultCache(2, db).get("k") == ({"n": 1}, 5.0, "disk")
+
+
+def test_disabled_without_entries_or_db():
+    cache = ResultCache(0)
+    assert not cache.enabled
+    cache.put("k", {"n": 1}, 1)
+    assert cache.get("k") is None
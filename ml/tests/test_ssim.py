@@ -0,0 +1,52 @@
+"""backend.ssim against skimage.metrics.structural_similarity (the reference it replaces)."""
+
+import cv2
+import numpy as np
+import pytest
+from skimage.metrics import structural_similarity
+
+from backend.ssim import ssim
+from backend.synthetic import synthetic_certificate
+
+SCORE_TOL = 1e-5
+MAP_TOL = 1e-4
+
+
+@pytest.fixture(scope="module")
+def pages():
+    page = cv2.cvtColor(synthetic_certificate(100), cv2.COLOR_BGR2GRAY)
+    rng = np.random.default_rng(0)
+    noisy = np.clip(page.astype(np.int16) + rng.normal(0, 12, page.shape), 0, 255).astype(np.uint8)
+    edited = page.copy()
+    cv2.putText(edited, "EDITED", (200, 460), cv2.FONT_HERSHEY_SIMPLEX, 1.5, 0, 3)
+    return {"identical": page, "noise": noisy, "edit": edited, "shift": np.roll(page, 3, axis=1)}
+
+
+# The whole page, an odd-sized crop, and a crop just over one window
+CROPS = {"page": np.s_[:, :], "odd": np.s_[61:302, 33:232], "tiny": np.s_[100:109, 100:111]}
+
+
+@pytest.mark.parametrize("case", ["identical", "noise", "edit", "shift"])
+@pytest.mark.parametrize("crop", sorted(CROPS))
+# None: default strips; 7 is narrower than the halo; 64 and 97 put boundaries mid-content
+@pytest.mark.parametrize("tile_rows", [None, 7, 64, 97])
+def test_matches_skimage(pages, case, crop, tile_rows):
+    x, y = pages["identical"][CROPS[crop]], pages[case][CROPS[crop]]
+    ref_score, ref_map = structural_similarity(x, y, full=True)
+    score, smap = ssim(x, y, full=True, tile_rows=tile_rows)
+    assert smap.shape == ref_map.shape
+    assert abs(score - ref_score) < SCORE_TOL
+    assert float(np.abs(smap - ref_map).max()) < MAP_TOL
+    assert abs(ssim(x, y, tile_rows=tile_rows) - score) < 1e-7  # score-only path
+
+
+@pytest.mark.parametrize("case", ["noise", "edit"])
+def test_gaussian_matches_skimage(pages, case):
+    x, y = pages["identical"], pages[case]
+    ref = structural_similarity(x, y, gaussian_weights=True, sigma=1.5, use_sample_covariance=False)
+    assert abs(ssim(x, y, gaussian=True, tile_rows=97) - ref) < SCORE_TOL
+
+
+def test_rejects_mismatched_shapes():
+    with pytest.raises(ValueError):
+        ssim(np.zeros((20, 20), np.uint8), np.zeros((20, 21), np.uint8))
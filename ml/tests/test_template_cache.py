@@ -0,0 +1,56 @@
+"""backend.template_cache: keys and the memory-bounded LRU."""
+
+import numpy as np
+
+from backend.context import PageImage
+from backend.template_cache import TemplateCache, hash_key
+
+PAGE_BYTES = 100 * 100 * 3
+
+
+def page() -> PageImage:
+    return PageImage(image=np.zeros((100, 100, 3), np.uint8))
+
+
+def test_key_covers_render_settings():
+    keys = {hash_key("a" * 64, 200), hash_key("a" * 64, 300), hash_key("a" * 64, 200, page=1), hash_key("b" * 64, 200)}
+    assert len(keys) == 4
+    assert hash_key("a" * 64, 200) == hash_key("a" * 64, 200, page=0)
+
+
+def test_hit_reuses_page_and_its_features():
+    cache = TemplateCache(10 * PAGE_BYTES)
+    calls = []
+    first = cache.get_or_create("k", lambda: calls.append(1) or page())
+    first.memo("feature", lambda: "computed once")
+    again = cache.get_or_create("k", lambda: calls.append(1) or page())
+    assert again is first and calls == [1]
+    assert again.memo("feature", lambda: "recomputed") == "computed once"
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_evicts_least_recently_used_by_bytes():
+    cache = TemplateCache(2 * PAGE_BYTES)
+    a = cache.get_or_create("a", page)
+    cache.get_or_create("b", page)
+    cache.get_or_create("a", page)  # touch: "b" is now the oldest
+    cache.get_or_create("c", page)
+    assert cache.get_or_create("a", page) is a
+    stats = cache.stats()
+    assert stats["entries"] == 2 and stats["evictions"] == 1 and stats["bytes"] <= 2 * PAGE_BYTES
+
+
+def test_features_count_toward_the_bound():
+    cache = TemplateCache(2 * PAGE_BYTES)
+    a = cache.get_or_create("a", page)
+    cache.get_or_create("b", page)
+    a.memo("gray", lambda: np.zeros((100, 100, 3), np.uint8))
+    cache.get_or_create("b", page)  # re-measured on access
+    assert cache.stats()["entries"] == 1 and cache.stats()["evictions"] == 1
+
+
+def test_never_evicts_the_entry_in_use():
+    cache = TemplateCache(PAGE_BYTES // 2)
+    big = cache.get_or_create("big", page)
+    assert cache.get_or_create("big", page) is big
+    assert cache.stats()["entries"] == 1
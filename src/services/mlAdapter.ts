@@ -12,10 +12,22 @@ export type MlVerifyResponse = {
   photo?: MlModelResult;
   seal?: MlModelResult;
   signature?: MlModelResult;
-  overall_status?: 'authentic' | 'tampered' | string;
+  overall_status?: 'authentic' | 'tampered' | 'inconclusive' | string;
+  // Set when the ML deadline skipped or downgraded stages; see `deadline` for which
+  partial?: boolean;
   [k: string]: any;
 };
 
+const DEFAULT_TIMEOUT_MS = 20000;
+// The ML service rejects larger budgets with 422 (MAX_BUDGET_MS in ml/backend/deadline.py)
+const MAX_DEADLINE_MS = 600000;
+
+// ML_TIMEOUT_MS, or the default when it is missing or not a positive number
+function timeoutMs(): number {
+  const ms = config.ml.timeoutMs;
+  return Number.isFinite(ms) && ms > 0 ? ms : DEFAULT_TIMEOUT_MS;
+}
+
 async function requestWithTimeout<T>(p: Promise<T>, ms: number): Promise<T> {
   const t = new Promise<T>((_, rej) => setTimeout(() => rej(new Error('ML timeout')), ms));
   return Promise.race([p, t]);
@@ -36,10 +48,14 @@ export const mlAdapter = {
     form.append('original', new BlobCtor([originalPdf]), 'original.pdf');
     form.append('uploaded', new BlobCtor([uploadedPdf]), 'uploaded.pdf');
 
+    const timeout = timeoutMs();
     const AC: any = (globalThis as any).AbortController;
     const controller = new AC();
     const headers: Record<string, string> = {};
     if (config.ml.apiKey) headers['Authorization'] = `Bearer ${config.ml.apiKey}`;
+    // Leave headroom for upload and response so a partial result arrives before our own timeout
+    const budget = Math.min(MAX_DEADLINE_MS, Math.max(1, Math.floor(timeout * 0.9) - 250));
+    headers['X-ML-Deadline-Ms'] = String(budget);
 
     const url = `${config.ml.baseUrl.replace(/\/$/, '')}/verify`;
     const fetchFn: any = (globalThis as any).fetch;
@@ -57,7 +73,7 @@ export const mlAdapter = {
     });
 
     try {
-      const out = await requestWithTimeout(fetchPromise, config.ml.timeoutMs);
+      const out = await requestWithTimeout(fetchPromise, timeout);
       return out;
     } finally {
       controller.abort();